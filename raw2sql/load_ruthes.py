@@ -0,0 +1,380 @@
+#!/usr/bin/env python3
+"""
+Загрузка РуТез из исходных текстовых файлов (raw2xml/data) прямо в таблицы
+concepts, relations, text_entry и synonyms, без промежуточных xml-файлов.
+
+Файлы разбираются теми же правилами, что и в raw2xml (ruwordnet/raw_text.py),
+и построчно передаются в COPY (ruwordnet/bulk.py). Значения приводятся так
+же, как при записи в xml и чтении xml2sql/xml2sql.py: пустые поля
+становятся NULL, у остальных убираются пробелы по краям. С --xml-dir
+попутно пишутся те же xml-файлы, что порождает raw2xml.
+
+С --jobs N таблицы разбираются и загружаются параллельно в N процессах,
+у каждого своё соединение с базой. Таблица, которая ссылается внешним
+ключом на другую загружаемую таблицу, загружается после неё. С --replace
+внешние ключи и неуникальные индексы загружаемых таблиц удаляются перед
+загрузкой и создаются заново после неё (тоже параллельно); первичные ключи
+остаются, по ним отбрасываются повторы.
+"""
+
+import argparse
+import logging
+import os
+import sys
+import time
+from collections import defaultdict, namedtuple
+from contextlib import ExitStack, closing
+from multiprocessing import Pool
+from typing import List
+
+from psycopg2 import connect
+
+from ruwordnet.bulk import copy_rows
+from ruwordnet.raw_text import (
+    ENCODING,
+    parse_relation,
+    parse_synonym,
+    parse_text_entry,
+    read_concepts,
+)
+from ruwordnet.raw_xml import (
+    XmlWriter,
+    concept_element,
+    relation_element,
+    synonym_element,
+    text_entry_element,
+)
+
+RAW2XML_ROOT = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "raw2xml"
+)
+
+Table = namedtuple("Table", "fields xml_file root_tag make_element")
+# Внешний ключ или индекс, удалённый на время загрузки
+Deferred = namedtuple("Deferred", "table kind drop_sql create_sql")
+
+# Таблицы в порядке загрузки
+TABLES = {
+    "concepts": Table(
+        ["id", "name", "gloss", "domain"], "concepts.xml", "concepts", concept_element
+    ),
+    "relations": Table(
+        ["from_id", "to_id", "name", "asp"],
+        "relations.xml",
+        "relations",
+        relation_element,
+    ),
+    "text_entry": Table(
+        ["id", "name", "lemma", "main_word", "synt_type", "pos_string"],
+        "text_entry.xml",
+        "entries",
+        text_entry_element,
+    ),
+    "synonyms": Table(
+        ["concept_id", "entry_id"], "synonyms.xml", "synonyms", synonym_element
+    ),
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Load RuThes txt data files straight into the database"
+    )
+    parser.add_argument(
+        "-s",
+        "--source-dir",
+        type=str,
+        help="Directory with source txt files",
+        default=os.path.join(RAW2XML_ROOT, "data"),
+    )
+    connection_string = (
+        "host='localhost' dbname='ruwordnet' user='ruwordnet' password='ruwordnet'"
+    )
+    parser.add_argument(
+        "-c",
+        "--connection-string",
+        type=str,
+        help="Postgresql database connection string ({})".format(connection_string),
+        default=connection_string,
+    )
+    parser.add_argument(
+        "--tables",
+        nargs="+",
+        choices=list(TABLES),
+        help="Tables to load (default: all)",
+        default=list(TABLES),
+    )
+    parser.add_argument(
+        "--replace",
+        help="Replace the contents of the tables instead of merging into them",
+        action="store_true",
+    )
+    parser.add_argument(
+        "-x",
+        "--xml-dir",
+        type=str,
+        help="Also write raw2xml xml files to this directory",
+        default=None,
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        help="Number of processes loading tables and building indexes in parallel",
+        default=1,
+    )
+    ARGS = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    started = time.perf_counter()
+    tables = [name for name in TABLES if name in ARGS.tables]
+    settings = (ARGS.connection_string, ARGS.source_dir, ARGS.xml_dir, ARGS.replace)
+    deferred = []
+    run = None
+    with ExitStack() as stack:
+        try:
+            connection = stack.enter_context(closing(connect(ARGS.connection_string)))
+            if ARGS.replace:
+                deferred = drop_deferred(connection, tables)
+            waves = load_order(connection, tables)
+            logging.info(
+                "Load order: %s", " -> ".join(", ".join(wave) for wave in waves)
+            )
+
+            if ARGS.jobs > 1:
+                pool = stack.enter_context(Pool(ARGS.jobs, init_worker, settings))
+                run = pool.imap_unordered
+            else:
+                init_worker(*settings)
+                run = map
+            for wave in waves:
+                for name, copied, inserted, elapsed in run(load_task, wave):
+                    logging.info(
+                        "%s: %s rows copied, %s rows inserted in %.1fs",
+                        name,
+                        copied,
+                        inserted,
+                        elapsed,
+                    )
+        except BaseException:
+            # Индексы и внешние ключи восстанавливаются и после ошибки, но
+            # ошибка восстановления не должна скрыть исходную
+            if deferred:
+                try:
+                    if run is None:
+                        init_worker(*settings)
+                        run = map
+                    restore_deferred(deferred, run)
+                except Exception:
+                    logging.exception("Could not restore indexes and foreign keys")
+            raise
+        if restore_deferred(deferred, run):
+            sys.exit(1)
+    logging.info("Done in %.1fs", time.perf_counter() - started)
+
+
+def drop_deferred(connection, tables) -> List[Deferred]:
+    """
+    Удаляет внешние ключи и неуникальные индексы таблиц, возвращает
+    запросы для их восстановления
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT conrelid::regclass::text, 'constraint',
+                   format('ALTER TABLE %%s DROP CONSTRAINT %%I', conrelid::regclass, conname),
+                   format('ALTER TABLE %%s ADD CONSTRAINT %%I %%s',
+                          conrelid::regclass, conname, pg_get_constraintdef(oid))
+            FROM pg_constraint
+            WHERE contype = 'f'
+              AND conrelid = ANY(%(tables)s::regclass[])
+            UNION ALL
+            SELECT x.indrelid::regclass::text, 'index',
+                   format('DROP INDEX %%s', x.indexrelid::regclass),
+                   pg_get_indexdef(x.indexrelid)
+            FROM pg_index x
+            WHERE x.indrelid = ANY(%(tables)s::regclass[])
+              AND NOT x.indisunique
+              AND NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conindid = x.indexrelid)
+            """,
+            {"tables": tables},
+        )
+        deferred = [Deferred(*row) for row in cursor.fetchall()]
+        for item in deferred:
+            cursor.execute(item.drop_sql)
+    connection.commit()
+    logging.info("Deferred %s indexes and foreign keys", len(deferred))
+    return deferred
+
+
+def restore_deferred(deferred, run) -> List[str]:
+    """
+    Создаёт заново удалённые индексы, затем внешние ключи; возвращает
+    запросы, которые не удалось выполнить
+    """
+    failed = []
+    for kind in ("index", "constraint"):
+        statements = [item.create_sql for item in deferred if item.kind == kind]
+        for statement, elapsed, error in run(execute_task, statements):
+            if error is None:
+                logging.info("%s in %.1fs", statement, elapsed)
+            else:
+                logging.error("%s failed: %s", statement, error)
+                failed.append(statement)
+    return failed
+
+
+def load_order(connection, tables) -> List[List[str]]:
+    """
+    Очереди таблиц: таблицы одной очереди загружаются параллельно, после
+    таблиц, на которые они ссылаются внешними ключами
+    """
+    references = defaultdict(set)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT conrelid::regclass::text, confrelid::regclass::text
+            FROM pg_constraint
+            WHERE contype = 'f'
+              AND conrelid = ANY(%s::regclass[])
+            """,
+            (tables,),
+        )
+        for table, referenced in cursor:
+            if referenced in tables and referenced != table:
+                references[table].add(referenced)
+    connection.commit()
+
+    waves = []
+    loaded = set()
+    rest = list(tables)
+    while rest:
+        wave = [table for table in rest if references[table] <= loaded]
+        if not wave:
+            # Таблицы ссылаются друг на друга: порядок не поможет
+            wave = rest
+        waves.append(wave)
+        loaded.update(wave)
+        rest = [table for table in rest if table not in loaded]
+    return waves
+
+
+# Состояние процесса-загрузчика
+worker = {}
+
+
+def init_worker(connection_string, source_dir, xml_dir, replace):
+    logging.basicConfig(level=logging.INFO)
+    worker.update(
+        connection=connect(connection_string),
+        source_dir=source_dir,
+        xml_dir=xml_dir,
+        replace=replace,
+    )
+
+
+def load_task(name):
+    started = time.perf_counter()
+    xml_file = None
+    if worker["xml_dir"] is not None:
+        xml_file = os.path.join(worker["xml_dir"], TABLES[name].xml_file)
+    connection = worker["connection"]
+    try:
+        with connection.cursor() as cursor:
+            copied, inserted = load_table(
+                cursor,
+                name,
+                read_records(name, worker["source_dir"]),
+                xml_file,
+                worker["replace"],
+            )
+    except Exception:
+        # Соединение ещё понадобится для восстановления индексов
+        connection.rollback()
+        raise
+    connection.commit()
+    return name, copied, inserted, time.perf_counter() - started
+
+
+def execute_task(statement):
+    """
+    Выполняет запрос; ошибка возвращается, а не пробрасывается, чтобы
+    остальные запросы выполнились
+    """
+    started = time.perf_counter()
+    connection = worker["connection"]
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(statement)
+    except Exception as e:
+        connection.rollback()
+        return statement, time.perf_counter() - started, str(e).strip()
+    connection.commit()
+    return statement, time.perf_counter() - started, None
+
+
+def load_table(cursor, name, records, xml_file=None, replace=False):
+    """
+    Загружает записи в таблицу name, попутно записывая их в xml_file
+    """
+    table = TABLES[name]
+    with ExitStack() as stack:
+        if xml_file is not None:
+            writer = stack.enter_context(XmlWriter(xml_file, table.root_tag))
+            records = write_xml(records, writer, table.make_element)
+        rows = (
+            [db_value(getattr(record, field)) for field in table.fields]
+            for record in records
+        )
+        return copy_rows(cursor, name, table.fields, rows, replace)
+
+
+def read_records(name, source_dir):
+    """
+    Записи таблицы name из исходного файла
+    """
+    if name == "concepts":
+        yield from read_concepts(
+            os.path.join(source_dir, "concepts.txt"),
+            os.path.join(source_dir, "concept_gloss_text_ready.txt"),
+        )
+        return
+
+    filename = {
+        "relations": "relats.txt",
+        "text_entry": "textentries.txt",
+        "synonyms": "synonyms.txt",
+    }[name]
+    with open(os.path.join(source_dir, filename), "r", encoding=ENCODING) as file:
+        if name == "relations":
+            yield from (parse_relation(line) for line in file)
+        elif name == "synonyms":
+            yield from (parse_synonym(line) for line in file)
+        else:
+            for line in file:
+                entry = parse_text_entry(line)
+                if entry is None:
+                    logging.warning("Text entry does not match: %s", line.rstrip("\n"))
+                    continue
+                yield entry
+
+
+def write_xml(records, writer, make_element):
+    for record in records:
+        writer.write(make_element(record))
+        yield record
+
+
+def db_value(value):
+    """
+    Значение поля так, как его загрузил бы xml2sql: пустой текст элемента
+    читается как None, остальные значения — без пробелов по краям
+    """
+    if not value:
+        return None
+    return value.strip()
+
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,8 @@ import re
 
 from psycopg2 import connect
 
+from ruwordnet.raw_text import ENCODING, parse_text_entry
+
 conn = None
 cur = None
 
@@ -27,42 +29,16 @@ def main():
 
     filename = "/Users/german/tmp/ruthes/textentr_pos_edited.txt"
 
-    word_chars = '[А-Яа-я\d\w\-",\(\)\./]'
-    pp = (
-        "(\d+)\s+((?:\s{0,2}"
-        + word_chars
-        + ")+)\s+(?:10|20)\s+((?:\s{0,2}"
-        + word_chars
-        + ")+)"
-    )
-    pattern0 = re.compile(pp)
-    pp += "\s+([A-Za-z]+)"
-    pattern1 = re.compile(pp)
-    pp += "\s+([А-Яа-я\-]+)\s+([A-Za-z ]+)"
-    pattern2 = re.compile(pp)
-
-    keys = ("id", "name", "lemma", "synt_type", "main_word", "pos")
-
-    file = open(filename, "r", -1, "Cp1251")
+    file = open(filename, "r", -1, ENCODING)
 
     i = 0
 
     for line in file:
         print(line)
         i += 1
-        match_obj = pattern2.match(line)
-        if match_obj is not None:
-            insert_data(dict(zip(keys, match_obj.groups())))
-            continue
-
-        match_obj = pattern1.match(line)
-        if match_obj is not None:
-            insert_data(dict(zip(keys, match_obj.groups() + ("", ""))))
-            continue
-
-        match_obj = pattern0.match(line)
-        if match_obj is not None:
-            insert_data(dict(zip(keys, match_obj.groups() + ("", "", ""))))
+        entry = parse_text_entry(line)
+        if entry is not None:
+            insert_data(entry._asdict())
             continue
         print("DOES NOT MATCH: " + line)
     print(str(i) + " rows inserted")
@@ -70,7 +46,7 @@ def main():
 
 def insert_data(elements):
     print(elements)
-    sql_str = "EXECUTE insert_entry (%(id)s, %(name)s, %(lemma)s, %(synt_type)s, %(main_word)s, %(pos)s)"
+    sql_str = "EXECUTE insert_entry (%(id)s, %(name)s, %(lemma)s, %(synt_type)s, %(main_word)s, %(pos_string)s)"
     values = {
         k: re.sub(r"\s+", " ", val.strip()) if isinstance(val, str) else val
         for k, val in elements.items()
@@ -2,9 +2,9 @@
 
 import argparse
 import os
-import re
 
-from lxml import etree
+from ruwordnet.raw_text import read_concepts
+from ruwordnet.raw_xml import XmlWriter, concept_element
 
 PKG_ROOT = os.path.dirname(os.path.abspath(__file__))
 
@@ -35,58 +35,6 @@ parser.add_argument(
 
 ARGS = parser.parse_args()
 
-concepts = {}
-
-with open(ARGS.source_file, "r", encoding="Windows-1251") as inp:
-    rgx = re.compile("^(\d+)\s+(.+)\s+(\d+)$")
-    for line in inp:
-        # I've got file with spaces instead of tabs, so it won't work
-        # spl = line.split('\t')
-        # concepts[spl[0]] = spl[1:] + [""]
-        spl = rgx.findall(line)[0]
-        concepts[spl[0]] = [spl[1].strip(), spl[2], ""]
-
-concept = None
-gloss = ""
-with open(ARGS.gloss_file, "r", encoding="Windows-1251") as inp:
-    for line in inp:
-        spl = line.split("\t")
-        if len(spl) == 2:
-            if len(gloss):
-                if concept and concept[0] in concepts:
-                    concepts[concept[0]][-1] = gloss.strip()
-                elif concept:
-                    print("Concept not found", concept, gloss)
-                else:
-                    print("Gloss without concept", gloss)
-            gloss = ""
-            concept = spl
-            continue
-        gloss = gloss + " " + line.strip()
-
-root = etree.Element("concepts")
-
-srt = sorted(concepts.items(), key=lambda item: item[0])
-
-for elem in srt:
-    idx = elem[0]
-    values = elem[1]
-    doc = etree.SubElement(root, "concept")
-    doc.set("id", idx)
-
-    name = etree.SubElement(doc, "name")
-    name.text = values[0]
-
-    gloss = etree.SubElement(doc, "gloss")
-    gloss.text = values[-1]
-
-    domain = etree.SubElement(doc, "domain")
-    if int(values[1]) in [8, 40, 264, 2968, 40, 264, 296]:
-        domain.text = "GL"
-    elif int(values[1]) == 2:
-        domain.text = "GEO"
-    else:
-        domain.text = "SOC-POL"
-
-tree = etree.ElementTree(root)
-tree.write(ARGS.destination_file, encoding="utf-8", pretty_print=True)
+with XmlWriter(ARGS.destination_file, "concepts") as writer:
+    for concept in read_concepts(ARGS.source_file, ARGS.gloss_file):
+        writer.write(concept_element(concept))
@@ -2,9 +2,9 @@
 
 import argparse
 import os
-import re
 
-from lxml import etree
+from ruwordnet.raw_text import ENCODING, parse_synonym
+from ruwordnet.raw_xml import XmlWriter, synonym_element
 
 PKG_ROOT = os.path.dirname(os.path.abspath(__file__))
 
@@ -28,16 +28,8 @@ parser.add_argument(
 
 ARGS = parser.parse_args()
 
-root = etree.Element("synonyms")
-
-with open(ARGS.source_file, "r", encoding="Windows-1251") as inp:
-    rgx = re.compile("\s{2,}")
+with open(ARGS.source_file, "r", encoding=ENCODING) as inp, XmlWriter(
+    ARGS.destination_file, "synonyms"
+) as writer:
     for line in inp:
-        spl = rgx.split(line.strip())
-
-        doc = etree.SubElement(root, "entry_rel")
-        doc.set("concept_id", spl[0])
-        doc.set("entry_id", spl[1])
-
-tree = etree.ElementTree(root)
-tree.write(ARGS.destination_file, encoding="utf-8", pretty_print=True)
+        writer.write(synonym_element(parse_synonym(line)))
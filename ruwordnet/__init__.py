@@ -0,0 +1,3 @@
+"""
+Общий код конвертеров и скриптов RuWordNet
+"""
@@ -0,0 +1,105 @@
+"""
+Загрузка записей в таблицы PostgreSQL через COPY.
+
+Записи передаются в COPY потоком (CopyReader превращает их в строки
+текстового формата COPY по мере того, как их читает psycopg2), поэтому
+таблица загружается одной командой COPY, а расход памяти не зависит от
+числа записей. copy_rows копирует записи во временную таблицу и переносит
+их в основную с ON CONFLICT DO NOTHING; так загружают таблицы
+xml2sql --bulk и raw2sql/load_ruthes.py.
+
+    with connection.cursor() as cursor:
+        copied, inserted = copy_rows(cursor, "synonyms", fields, rows)
+    connection.commit()
+"""
+
+import itertools
+from typing import Iterable, Optional, Sequence, Tuple
+
+
+def copy_value(value) -> str:
+    """
+    Представление значения в текстовом формате COPY
+    """
+    if value is None:
+        return "\\N"
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+class CopyReader:
+    """
+    Файлоподобный объект для cursor.copy_expert: строки COPY из записей rows
+    (последовательностей значений)
+    """
+
+    def __init__(self, rows: Iterable[Sequence]):
+        self.lines = (
+            "\t".join([copy_value(value) for value in row]) + "\n" for row in rows
+        )
+        self.rest = ""
+        self.count = 0
+
+    def read(self, size: int = -1) -> str:
+        chunks = [self.rest]
+        length = len(self.rest)
+        for line in self.lines:
+            chunks.append(line)
+            length += len(line)
+            self.count += 1
+            if 0 <= size <= length:
+                break
+        data = "".join(chunks)
+        if size < 0:
+            self.rest = ""
+            return data
+        self.rest = data[size:]
+        return data[:size]
+
+
+def copy_rows(
+    cursor,
+    table: str,
+    fields: Sequence[str],
+    rows: Iterable[Sequence],
+    replace=False,
+    batch_size: Optional[int] = None,
+) -> Tuple[int, int]:
+    """
+    Загружает записи (значения полей fields по порядку) в таблицу table.
+    С replace содержимое таблицы предварительно удаляется. С batch_size
+    записи передаются несколькими командами COPY по batch_size записей.
+    Возвращает число скопированных и добавленных записей; транзакцию
+    фиксирует вызывающий
+    """
+    staging = "{}_staging".format(table)
+    fields_str = ", ".join(fields)
+    cursor.execute(
+        "CREATE TEMP TABLE {staging} (LIKE {table} INCLUDING DEFAULTS) "
+        "ON COMMIT DROP".format(staging=staging, table=table)
+    )
+    copy_sql = "COPY {staging} ({fields}) FROM STDIN".format(
+        staging=staging, fields=fields_str
+    )
+    if batch_size:
+        rows = iter(rows)
+        batches = iter(lambda: list(itertools.islice(rows, batch_size)), [])
+    else:
+        batches = [rows]
+    copied = 0
+    for batch in batches:
+        reader = CopyReader(batch)
+        cursor.copy_expert(copy_sql, reader)
+        copied += reader.count
+    if replace:
+        cursor.execute("DELETE FROM {}".format(table))
+    cursor.execute(
+        "INSERT INTO {table} ({fields}) SELECT {fields} FROM {staging} "
+        "ON CONFLICT DO NOTHING".format(table=table, fields=fields_str, staging=staging)
+    )
+    return copied, cursor.rowcount
@@ -0,0 +1,40 @@
+"""
+Ограниченный LRU-кэш для HTTP-сервиса и разбора частей речи.
+
+При переполнении вытесняется запись, к которой дольше всего не
+обращались; hits и misses считают попадания и промахи. Значение None
+не кэшируется: get возвращает None для отсутствующего ключа.
+
+    cache = LRUCache(10000)
+    value = cache.get(key)
+    if value is None:
+        value = compute(key)
+        cache.put(key, value)
+"""
+
+from collections import OrderedDict
+
+
+class LRUCache:
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        value = self.data.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.data.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+        self.data[key] = value
+        self.data.move_to_end(key)
+        if len(self.data) > self.maxsize:
+            self.data.popitem(last=False)
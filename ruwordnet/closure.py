@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Обновление таблиц транзитивного замыкания иерархий (sql/hierarchy_closure.sql).
+
+Строки замыкания с depth = 1 — это непосредственные предки на момент
+прошлого обновления. Узлы, у которых набор непосредственных предков с тех
+пор изменился, вместе со всеми своими потомками (по старому замыканию и по
+текущим отношениям) пересчитываются обходом в ширину вверх по иерархии,
+остальные строки таблицы не меняются. С --full таблица заполняется заново.
+"""
+
+import argparse
+import logging
+from collections import defaultdict, deque, namedtuple
+
+from psycopg2 import connect, extras
+
+Hierarchy = namedtuple("Hierarchy", "table edges_sql")
+
+# Таблица замыкания и запрос, возвращающий пары (потомок, непосредственный предок)
+HIERARCHIES = {
+    "ruthes": Hierarchy(
+        "ruthes_closure",
+        """
+        SELECT from_id, to_id
+        FROM relations
+        WHERE name = 'ВЫШЕ'""",
+    ),
+    "rwn": Hierarchy(
+        "synset_closure",
+        """
+        SELECT parent_id, child_id
+        FROM synset_relations
+        WHERE name IN ('hypernym', 'instance hypernym')""",
+    ),
+}
+
+PAGE_SIZE = 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Refresh transitive closure tables of RuThes and RuWordNet hierarchies"
+    )
+    connection_string = (
+        "host='localhost' dbname='ruwordnet' user='ruwordnet' password='ruwordnet'"
+    )
+    parser.add_argument(
+        "-c",
+        "--connection-string",
+        type=str,
+        help="Postgresql database connection string ({})".format(connection_string),
+        default=connection_string,
+    )
+    parser.add_argument(
+        "--hierarchy",
+        choices=sorted(HIERARCHIES) + ["all"],
+        default="all",
+        help="Hierarchy to refresh (default: all)",
+    )
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="Rebuild the closure from scratch instead of refreshing changed nodes",
+    )
+    ARGS = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    names = sorted(HIERARCHIES) if ARGS.hierarchy == "all" else [ARGS.hierarchy]
+    connection = connect(ARGS.connection_string)
+    for name in names:
+        logging.info("Refreshing %s hierarchy closure", name)
+        refresh(connection, HIERARCHIES[name], ARGS.full)
+    logging.info("Done")
+
+
+def refresh(connection, hierarchy, full=False) -> int:
+    """
+    Обновляет таблицу замыкания в одной транзакции, возвращает число
+    пересчитанных узлов
+    """
+    table = hierarchy.table
+    with connection.cursor() as cursor:
+        parents = defaultdict(list)
+        cursor.execute(hierarchy.edges_sql)
+        for descendant, ancestor in cursor:
+            if descendant != ancestor:
+                parents[descendant].append(ancestor)
+        for ancestors in parents.values():
+            ancestors.sort()
+
+        if full:
+            cursor.execute("DELETE FROM {}".format(table))
+            affected = set(parents)
+        else:
+            old_parents = defaultdict(set)
+            cursor.execute(
+                "SELECT descendant_id, ancestor_id FROM {} WHERE depth = 1".format(
+                    table
+                )
+            )
+            for descendant, ancestor in cursor:
+                old_parents[descendant].add(ancestor)
+            changed = [
+                node
+                for node in set(parents) | set(old_parents)
+                if set(parents.get(node, ())) != old_parents.get(node, set())
+            ]
+            if not changed:
+                logging.info("%s is up to date", table)
+                connection.commit()
+                return 0
+
+            cursor.execute(
+                "SELECT DISTINCT descendant_id FROM {} WHERE ancestor_id = ANY(%s)".format(
+                    table
+                ),
+                (changed,),
+            )
+            affected = {row[0] for row in cursor}
+            affected.update(find_descendants(parents, changed))
+            cursor.execute(
+                "DELETE FROM {} WHERE descendant_id = ANY(%s)".format(table),
+                (list(affected),),
+            )
+
+        logging.info("Computing ancestors of %s nodes", len(affected))
+        extras.execute_values(
+            cursor,
+            "INSERT INTO {} (ancestor_id, descendant_id, depth, path) VALUES %s".format(
+                table
+            ),
+            (
+                (ancestor, node, len(path) - 1, path)
+                for node in sorted(affected)
+                for ancestor, path in find_ancestors(parents, node)
+            ),
+            page_size=PAGE_SIZE,
+        )
+    connection.commit()
+    return len(affected)
+
+
+def find_ancestors(parents, node):
+    """
+    Предки узла с кратчайшими путями к ним (от предка к узлу). Обход
+    в ширину с упорядоченными списками предков, поэтому из путей одной
+    длины всегда выбирается один и тот же.
+    """
+    previous = {node: None}
+    queue = deque([node])
+    while queue:
+        current = queue.popleft()
+        for ancestor in parents.get(current, ()):
+            if ancestor in previous:
+                continue
+            previous[ancestor] = current
+            queue.append(ancestor)
+            path = [ancestor]
+            step = current
+            while step is not None:
+                path.append(step)
+                step = previous[step]
+            yield ancestor, path
+
+
+def find_descendants(parents, nodes) -> set:
+    """
+    Узлы nodes и все их потомки по текущим отношениям
+    """
+    children = defaultdict(list)
+    for descendant, ancestors in parents.items():
+        for ancestor in ancestors:
+            children[ancestor].append(descendant)
+    found = set(nodes)
+    queue = deque(nodes)
+    while queue:
+        for child in children.get(queue.popleft(), ()):
+            if child not in found:
+                found.add(child)
+                queue.append(child)
+    return found
+
+
+if __name__ == "__main__":
+    main()
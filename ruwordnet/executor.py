@@ -0,0 +1,255 @@
+"""
+Пул процессов-обработчиков для скриптов, которые обрабатывают смыслы
+(или другие записи) по одному.
+
+Записи передаются обработчикам пачками по chunk_size через общую очередь:
+освободившийся обработчик сам забирает следующую пачку, поэтому медленные
+записи не задерживают остальные процессы. Каждый обработчик один раз
+подготавливает соединение и запросы (setup), обрабатывает записи (process)
+и после обработки всех пачек получает сигнал остановки, закрывает
+соединение (teardown) и сообщает, сколько записей обработал, вместе
+со своим результатом (result), например счётчиками.
+
+    class Worker(TaskWorker):
+        def setup(self):
+            self.conn = connect(...)
+
+        def process(self, row):
+            ...
+
+        def teardown(self):
+            self.conn.close()
+
+    with Executor(lambda number: Worker(), workers_count=4) as executor:
+        executor.run(rows)
+"""
+
+import logging
+import queue
+import sys
+import threading
+import time
+import traceback
+from multiprocessing import Process, Queue, cpu_count
+from typing import Callable, Iterable, List
+
+from tqdm import tqdm
+
+# Сообщения обработчиков в очереди прогресса
+PROGRESS = "progress"
+FINISHED = "finished"
+
+
+def default_workers_count() -> int:
+    """
+    Число обработчиков по умолчанию: все процессоры, кроме одного,
+    но не меньше одного обработчика
+    """
+    return max(cpu_count() - 1, 1)
+
+
+class TaskWorker(Process):
+    """
+    Процесс-обработчик. Наследники переопределяют setup, process и teardown;
+    setup и teardown выполняются уже в дочернем процессе. Чтобы обработать
+    пачку целиком (например, одним запросом), достаточно переопределить
+    process_chunk.
+    """
+
+    def attach(self, tasks: Queue, progress: Queue) -> None:
+        self.tasks = tasks
+        self.progress = progress
+
+    def setup(self) -> None:
+        pass
+
+    def process(self, item) -> None:
+        raise NotImplementedError
+
+    def teardown(self) -> None:
+        pass
+
+    def result(self):
+        """
+        Результат обработчика, который передаётся в основной процесс
+        после остановки (должен сериализоваться pickle)
+        """
+        return None
+
+    def process_chunk(self, chunk: list) -> int:
+        """
+        Обрабатывает пачку записей, возвращает число ошибок
+        """
+        errors = 0
+        for item in chunk:
+            try:
+                self.process(item)
+            except Exception:  # pylint: disable=broad-except
+                # Ошибка в одной записи не останавливает обработчик
+                errors += 1
+                logging.error(
+                    "%s: failed to process %r\n%s",
+                    self.name,
+                    item,
+                    traceback.format_exc(),
+                )
+        return errors
+
+    def run(self) -> None:
+        processed = errors = 0
+        busy = 0.0
+        self.setup()
+        try:
+            while True:
+                chunk = self.tasks.get()
+                if chunk is None:
+                    break
+                started = time.perf_counter()
+                try:
+                    errors += self.process_chunk(chunk)
+                except Exception:  # pylint: disable=broad-except
+                    errors += len(chunk)
+                    logging.error(
+                        "%s: failed to process a chunk of %s items\n%s",
+                        self.name,
+                        len(chunk),
+                        traceback.format_exc(),
+                    )
+                busy += time.perf_counter() - started
+                processed += len(chunk)
+                self.progress.put((PROGRESS, self.name, len(chunk)))
+        finally:
+            self.teardown()
+            self.progress.put(
+                (FINISHED, self.name, (processed, errors, busy, self.result()))
+            )
+
+
+class Executor:
+    """
+    Запускает workers_count обработчиков, созданных make_worker(номер),
+    и распределяет между ними записи пачками по chunk_size
+    """
+
+    def __init__(
+        self,
+        make_worker: Callable[[int], TaskWorker],
+        workers_count: int = None,
+        chunk_size: int = 100,
+        show_progress: bool = True,
+    ):
+        self.make_worker = make_worker
+        self.workers_count = workers_count or default_workers_count()
+        self.chunk_size = chunk_size
+        self.show_progress = show_progress
+        self.workers: List[TaskWorker] = []
+        self.stats = {}
+        self.results = {}
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is not None:
+            self.terminate()
+
+    def start(self) -> None:
+        # Очередь небольшая: пачки читаются по мере обработки, а не все сразу
+        self.tasks = Queue(self.workers_count * 2)
+        self.progress = Queue()
+        for number in range(self.workers_count):
+            worker = self.make_worker(number)
+            worker.attach(self.tasks, self.progress)
+            worker.daemon = True
+            worker.start()
+            self.workers.append(worker)
+        logging.info("Started %s workers", self.workers_count)
+
+    def run(self, items: Iterable, total: int = None) -> dict:
+        """
+        Обрабатывает все записи и останавливает обработчики. Возвращает
+        словарь {имя обработчика: (записей, ошибок, секунд работы)};
+        результаты обработчиков после этого лежат в results
+        """
+        if total is None and hasattr(items, "__len__"):
+            total = len(items)
+        started = time.perf_counter()
+        bar = tqdm(total=total, file=sys.stdout, disable=not self.show_progress)
+        collector = threading.Thread(target=self.collect, args=(bar,), daemon=True)
+        collector.start()
+
+        chunk = []
+        for item in items:
+            chunk.append(item)
+            if len(chunk) == self.chunk_size:
+                self.put(chunk)
+                chunk = []
+        if chunk:
+            self.put(chunk)
+        for _ in self.workers:
+            self.put(None)
+
+        collector.join()
+        for worker in self.workers:
+            worker.join()
+        bar.close()
+        self.log_stats(time.perf_counter() - started)
+        return self.stats
+
+    def put(self, chunk) -> None:
+        while True:
+            try:
+                self.tasks.put(chunk, timeout=1)
+                return
+            except queue.Full:
+                if not any(worker.is_alive() for worker in self.workers):
+                    raise RuntimeError("All workers have exited")
+
+    def collect(self, bar: tqdm) -> None:
+        """
+        Читает сообщения обработчиков, пока все они не завершатся
+        """
+        running = {worker.name for worker in self.workers}
+        while running:
+            try:
+                kind, name, value = self.progress.get(timeout=1)
+            except queue.Empty:
+                # Обработчик, завершившийся аварийно, не пришлёт FINISHED
+                for worker in self.workers:
+                    if worker.name in running and not worker.is_alive():
+                        logging.error(
+                            "%s exited with code %s", worker.name, worker.exitcode
+                        )
+                        running.discard(worker.name)
+                continue
+            if kind == PROGRESS:
+                bar.update(value)
+            elif kind == FINISHED:
+                self.stats[name] = value[:3]
+                self.results[name] = value[3]
+                running.discard(name)
+
+    def log_stats(self, elapsed: float) -> None:
+        processed = sum(count for count, _, _ in self.stats.values())
+        errors = sum(errors for _, errors, _ in self.stats.values())
+        for name, (count, worker_errors, busy) in sorted(self.stats.items()):
+            logging.info(
+                "%s: %s items, %s errors, %.1f items/s",
+                name,
+                count,
+                worker_errors,
+                count / busy if busy else 0,
+            )
+        logging.info(
+            "Processed %s items with %s errors in %.1fs (%.1f items/s)",
+            processed,
+            errors,
+            elapsed,
+            processed / elapsed if elapsed else 0,
+        )
+
+    def terminate(self) -> None:
+        for worker in self.workers:
+            if worker.is_alive():
+                worker.terminate()
@@ -0,0 +1,534 @@
+"""
+Компактный граф РуТез в памяти, общий для всех конвертеров.
+
+Понятия и текстовые входы нумеруются подряд (индекс — позиция в массиве
+идентификаторов, отсортированном по возрастанию), связки и отношения
+хранятся в виде смежности CSR: массив смещений на каждое понятие и плоские
+массивы целых чисел. Повторяющиеся строки (синтаксические типы, части
+речи, аспекты и версии отношений) хранятся один раз в таблице строк,
+в массивах записей лежат только их номера.
+
+Граф загружается один раз из базы или из снимка (см. Graph.from_database
+и Graph.from_snapshot) и передаётся конвертерам; замыкание иерархических
+отношений реализовано в HierarchyClosure.
+"""
+
+import itertools
+import logging
+from array import array
+from bisect import bisect_left
+from collections import namedtuple
+
+POS_TYPE_MAP = {
+    "N": {"N", "NG", "NGprep", "PrepG"},
+    "V": {"V", "VG", "VGprep", "Prdc"},
+    "Adj": {"Adj", "AdjG", "AdjGprep"},
+}
+
+# все типы текстовых входов, которые можно экспортировать
+ALL_TYPES = set().union(*POS_TYPE_MAP.values())
+
+POS_BITS = {"N": 1, "V": 2, "Adj": 4}
+
+# Количество строк, получаемых за раз из серверного курсора
+ITERSIZE = 10000
+
+Entry = namedtuple(
+    "Entry", "id name lemma synt_type meaning main_word poses part_of_speech"
+)
+Relation = namedtuple("Relation", "from_id to_id name asp version")
+
+
+def get_part_of_speech(synt_type):
+    for pos, types in POS_TYPE_MAP.items():
+        if synt_type in types:
+            return pos
+
+
+class StringTable:
+    """
+    Таблица строк: каждая строка хранится один раз, вместо неё
+    используется её номер
+    """
+
+    def __init__(self):
+        self.values = []
+        self.codes = {}
+
+    def code(self, value) -> int:
+        code = self.codes.get(value)
+        if code is None:
+            code = len(self.values)
+            self.codes[value] = code
+            self.values.append(value)
+        return code
+
+    def __getitem__(self, code):
+        return self.values[code]
+
+    def __len__(self):
+        return len(self.values)
+
+
+class Adjacency:
+    """
+    Смежность в формате CSR: связи понятия с индексом i занимают позиции
+    offsets[i]..offsets[i + 1] в массивах targets и attributes.
+    """
+
+    def __init__(self, count, attributes=()):
+        self.offsets = array("l", bytes(array("l").itemsize * (count + 1)))
+        self.targets = array("l")
+        self.attributes = {name: array("l") for name in attributes}
+
+    @classmethod
+    def build(cls, count, rows, attributes=()):
+        """
+        rows — тройки (индекс источника, индекс цели, значения атрибутов),
+        упорядоченные по индексу источника
+        """
+        adjacency = cls(count, attributes)
+        offsets = adjacency.offsets
+        columns = [adjacency.attributes[name] for name in attributes]
+        for source, target, values in rows:
+            offsets[source + 1] += 1
+            adjacency.targets.append(target)
+            for column, value in zip(columns, values):
+                column.append(value)
+        for i in range(count):
+            offsets[i + 1] += offsets[i]
+        return adjacency
+
+    def span(self, index) -> range:
+        return range(self.offsets[index], self.offsets[index + 1])
+
+    def __len__(self):
+        return len(self.targets)
+
+
+class Graph:
+    """
+    Граф РуТез: понятия, текстовые входы, связки между ними и отношения
+    между понятиями.
+
+    В граф попадают только понятия, у которых есть хотя бы один текстовый
+    вход; отношения, ведущие к остальным понятиям или от них, отбрасываются.
+
+    Снаружи понятия и текстовые входы адресуются своими идентификаторами
+    из РуТез, индексы используются только внутри.
+    """
+
+    def __init__(self):
+        self.strings = StringTable()
+
+        # Понятия
+        self.concept_ids = array("l")
+        self.concept_names = []
+        self.glosses = []
+        self.pos_masks = bytearray()
+
+        # Текстовые входы
+        self.entry_ids = array("l")
+        self.entry_names = []
+        self.entry_lemmas = []
+        self.entry_main_words = []
+        self.entry_synt_types = array("l")
+        self.entry_poses = array("l")
+
+        # Связки: понятие -> текстовые входы (по алфавиту) с номером значения
+        # и обратная смежность текстовый вход -> понятия (по возрастанию id)
+        self.synonyms = None
+        self.entry_concepts = None
+
+        # Отношения: тип отношения -> смежность с атрибутами asp и version
+        self.relation_types = {}
+
+    def __len__(self):
+        return len(self.concept_ids)
+
+    def __contains__(self, concept_id):
+        return self.concept_index(concept_id) is not None
+
+    def __iter__(self):
+        return iter(self.concept_ids)
+
+    @staticmethod
+    def _find(ids, value):
+        i = bisect_left(ids, value)
+        if i < len(ids) and ids[i] == value:
+            return i
+        return None
+
+    def concept_index(self, concept_id):
+        return self._find(self.concept_ids, concept_id)
+
+    def entry_index(self, entry_id):
+        return self._find(self.entry_ids, entry_id)
+
+    def concept_name(self, concept_id) -> str:
+        return self.concept_names[self.concept_index(concept_id)]
+
+    def gloss(self, concept_id) -> str:
+        return self.glosses[self.concept_index(concept_id)]
+
+    def pos_mask(self, concept_id) -> int:
+        """
+        Части речи, в которых у понятия есть текстовые входы (битовая маска
+        из POS_BITS)
+        """
+        return self.pos_masks[self.concept_index(concept_id)]
+
+    def entries(self, concept_id) -> list:
+        """
+        Все текстовые входы понятия в алфавитном порядке. Номер значения
+        (meaning) у многозначного текстового входа — позиция понятия среди
+        всех его понятий, начиная с 1, у однозначного — 0.
+        """
+        synonyms = self.synonyms
+        meanings = synonyms.attributes["meaning"]
+        entries = []
+        for k in synonyms.span(self.concept_index(concept_id)):
+            i = synonyms.targets[k]
+            synt_type = self.strings[self.entry_synt_types[i]]
+            entries.append(
+                Entry(
+                    id=self.entry_ids[i],
+                    name=self.entry_names[i],
+                    lemma=self.entry_lemmas[i],
+                    synt_type=synt_type,
+                    meaning=meanings[k],
+                    main_word=self.entry_main_words[i],
+                    poses=self.strings[self.entry_poses[i]],
+                    part_of_speech=get_part_of_speech(synt_type),
+                )
+            )
+        return entries
+
+    def concepts_of_entry(self, entry_id) -> list:
+        entry_concepts = self.entry_concepts
+        return [
+            self.concept_ids[entry_concepts.targets[k]]
+            for k in entry_concepts.span(self.entry_index(entry_id))
+        ]
+
+    def relations(self, concept_id, name=None) -> list:
+        """
+        Отношения от понятия: все (типы по алфавиту) или только типа name
+        """
+        index = self.concept_index(concept_id)
+        if name is None:
+            # Типы отношений добавляются при загрузке в алфавитном порядке
+            names = self.relation_types
+        elif name in self.relation_types:
+            names = (name,)
+        else:
+            return []
+        relations = []
+        for name in names:
+            adjacency = self.relation_types[name]
+            asps = adjacency.attributes["asp"]
+            versions = adjacency.attributes["version"]
+            for k in adjacency.span(index):
+                relations.append(
+                    Relation(
+                        from_id=concept_id,
+                        to_id=self.concept_ids[adjacency.targets[k]],
+                        name=name,
+                        asp=self.strings[asps[k]],
+                        version=self.strings[versions[k]],
+                    )
+                )
+        return relations
+
+    def all_relations(self):
+        for concept_id in self.concept_ids:
+            yield from self.relations(concept_id)
+
+    @classmethod
+    def from_database(cls, connection):
+        """
+        Загружает граф из таблиц РуТез (concepts, text_entry, synonyms,
+        relations). Все запросы читаются порциями через серверные курсоры.
+        """
+
+        def stream(name, sql):
+            with connection.cursor(name=name) as cursor:
+                cursor.itersize = ITERSIZE
+                cursor.execute(sql)
+                yield from cursor
+
+        return cls.from_rows(
+            concepts=stream(
+                "graph_concepts",
+                """
+                SELECT c.id, c.name, c.gloss
+                FROM concepts c
+                WHERE EXISTS (
+                  SELECT 1
+                  FROM synonyms s
+                    INNER JOIN text_entry t
+                      ON t.id = s.entry_id
+                  WHERE s.concept_id = c.id
+                )
+                ORDER BY c.id""",
+            ),
+            entries=stream(
+                "graph_entries",
+                """
+                SELECT t.id, t.name, t.lemma, t.main_word, t.synt_type, t.pos_string
+                FROM text_entry t
+                WHERE EXISTS (SELECT 1 FROM synonyms s WHERE s.entry_id = t.id)
+                ORDER BY t.id""",
+            ),
+            synonyms=stream(
+                "graph_synonyms",
+                """
+                SELECT s.concept_id, s.entry_id
+                FROM synonyms s
+                  INNER JOIN text_entry t
+                    ON t.id = s.entry_id
+                ORDER BY s.concept_id, t.name, t.id""",
+            ),
+            relations=stream(
+                "graph_relations",
+                """
+                SELECT r.name, r.from_id, r.to_id, r.asp, r.version
+                FROM relations r
+                ORDER BY r.name, r.from_id, r.to_id""",
+            ),
+        )
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        """
+        Загружает граф из снимка базы (см. ruwordnet.snapshot). Таблицы
+        в снимке упорядочены так же, как в запросах from_database, отбор
+        понятий и текстовых входов со связками делается здесь.
+        """
+        entry_ids = set(snapshot["text_entry"].column("id"))
+        synonyms = [
+            (cid, entry_id)
+            for cid, entry_id in zip(
+                snapshot["synonyms"].column("concept_id"),
+                snapshot["synonyms"].column("entry_id"),
+            )
+            if entry_id in entry_ids
+        ]
+        linked_concepts = {cid for cid, _ in synonyms}
+        linked_entries = {entry_id for _, entry_id in synonyms}
+
+        concepts = snapshot["concepts"]
+        entries = snapshot["text_entry"]
+        relations = snapshot["relations"]
+        return cls.from_rows(
+            concepts=(
+                row
+                for row in concepts.select("id", "name", "gloss")
+                if row[0] in linked_concepts
+            ),
+            entries=(
+                row
+                for row in entries.select(
+                    "id", "name", "lemma", "main_word", "synt_type", "pos_string"
+                )
+                if row[0] in linked_entries
+            ),
+            synonyms=synonyms,
+            relations=relations.select("name", "from_id", "to_id", "asp", "version"),
+        )
+
+    @classmethod
+    def from_rows(cls, concepts, entries, synonyms, relations):
+        """
+        Строит граф из последовательностей строк:
+        - concepts: (id, name, gloss) по возрастанию id, только понятия
+          с текстовыми входами;
+        - entries: (id, name, lemma, main_word, synt_type, pos_string)
+          по возрастанию id, только текстовые входы со связками;
+        - synonyms: (concept_id, entry_id) по понятию, затем по имени
+          текстового входа;
+        - relations: (name, from_id, to_id, asp, version) по типу отношения,
+          затем по from_id.
+        """
+        graph = cls()
+        strings = graph.strings
+
+        logging.info("Fetching concepts...")
+        for cid, name, gloss in concepts:
+            graph.concept_ids.append(cid)
+            graph.concept_names.append(name)
+            graph.glosses.append(gloss)
+        concept_count = len(graph.concept_ids)
+        graph.pos_masks = bytearray(concept_count)
+
+        logging.info("Fetching entries...")
+        for entry_id, name, lemma, main_word, synt_type, pos_string in entries:
+            graph.entry_ids.append(entry_id)
+            graph.entry_names.append(name)
+            graph.entry_lemmas.append(lemma)
+            graph.entry_main_words.append(main_word)
+            graph.entry_synt_types.append(strings.code(synt_type))
+            graph.entry_poses.append(strings.code(pos_string))
+        entry_count = len(graph.entry_ids)
+
+        logging.info("Fetching synonyms...")
+        # Номер значения зависит от всех связок текстового входа, в том числе
+        # с понятиями, которых нет в таблице concepts
+        links = []
+        entry_concept_ids = [[] for _ in range(entry_count)]
+        for cid, entry_id in synonyms:
+            entry_index = graph.entry_index(entry_id)
+            entry_concept_ids[entry_index].append(cid)
+            concept_index = graph.concept_index(cid)
+            if concept_index is not None:
+                links.append((concept_index, entry_index))
+
+        def make_synonym_rows():
+            for concept_index, entry_index in links:
+                concept_ids = entry_concept_ids[entry_index]
+                if len(concept_ids) > 1:
+                    meaning = concept_ids.index(graph.concept_ids[concept_index]) + 1
+                else:
+                    meaning = 0
+                yield concept_index, entry_index, (meaning,)
+
+        graph.synonyms = Adjacency.build(
+            concept_count, make_synonym_rows(), ("meaning",)
+        )
+        graph.entry_concepts = Adjacency.build(
+            entry_count,
+            sorted(
+                (entry_index, concept_index, ()) for concept_index, entry_index in links
+            ),
+        )
+        del links, entry_concept_ids
+
+        for concept_index in range(concept_count):
+            mask = 0
+            for k in graph.synonyms.span(concept_index):
+                pos = get_part_of_speech(
+                    strings[graph.entry_synt_types[graph.synonyms.targets[k]]]
+                )
+                if pos is not None:
+                    mask |= POS_BITS[pos]
+            graph.pos_masks[concept_index] = mask
+
+        logging.info("Fetching relations...")
+        for name, group in itertools.groupby(relations, key=lambda row: row[0]):
+            relation_rows = []
+            for _, from_id, to_id, asp, version in group:
+                from_index = graph.concept_index(from_id)
+                to_index = graph.concept_index(to_id)
+                if from_index is None or to_index is None:
+                    continue
+                relation_rows.append(
+                    (from_index, to_index, (strings.code(asp), strings.code(version)))
+                )
+            graph.relation_types[name] = Adjacency.build(
+                concept_count, relation_rows, ("asp", "version")
+            )
+
+        logging.info(
+            "Graph loaded: %s concepts, %s entries, %s synonyms, %s relations",
+            concept_count,
+            entry_count,
+            len(graph.synonyms),
+            sum(len(adjacency) for adjacency in graph.relation_types.values()),
+        )
+        return graph
+
+
+class HierarchyClosure:
+    """
+    Проверяем отношения - они должны указывать на понятия с не пустыми
+    текстовыми входами нужной части речи. Если отношение не проходит
+    проверку, спускаемся по иерархии отношений вниз и повторяем проверку
+    для низлежащих отношений.
+
+    Результаты спуска по иерархии запоминаются для каждой тройки
+    (понятие, тип отношения, часть речи), поэтому каждый обход
+    выполняется один раз. Циклы отношений обрабатываются как в поиске
+    компонент сильной связности Тарьяна: понятие остаётся в стеке обхода,
+    пока не завершится обход корня его компоненты, повторное попадание
+    в понятие из стека ничего не даёт. Все понятия компоненты достигают
+    одних и тех же отношений, поэтому результат корня запоминается для
+    каждого из них.
+    """
+
+    # Замыкание предусмотрено не для всех типов связей
+    HIERARCHY_RELATIONS = {"НИЖЕ", "ВЫШЕ"}
+
+    def __init__(self, graph):
+        self.graph = graph
+        self.closure = {}
+        # Стек обхода: тройки, компонента которых ещё не завершена
+        self.stack = []
+        # Положение троек в стеке
+        self.on_stack = {}
+        # Наименьшее положение в стеке, до которого дошёл обход
+        self.low = 0
+
+    def fix(self, relation, pos) -> tuple:
+        to_id = relation.to_id
+        if to_id not in self.graph:
+            return ()
+        if self.graph.pos_mask(to_id) & POS_BITS[pos]:
+            # Если у понятия есть текстовые входы запрошенного типа, значит отношение нам подходит
+            return (relation,)
+        # Отношение не подходит
+        if relation.name not in self.HIERARCHY_RELATIONS:
+            return ()
+        # Спускаемся ниже по иерархии
+        return self.descend(to_id, relation.name, pos)
+
+    def descend(self, concept_id, name, pos) -> tuple:
+        key = (concept_id, name, pos)
+        if key in self.closure:
+            return self.closure[key]
+        index = self.on_stack.get(key)
+        if index is not None:
+            # Цикл: компонента этого понятия ещё не завершена
+            self.low = min(self.low, index)
+            return ()
+        index = len(self.stack)
+        self.on_stack[key] = index
+        self.stack.append(key)
+        outer_low = self.low
+        self.low = index
+        relations = []
+        # Смотрим все отношения низлежащего понятия того же типа, что и исходное
+        for rel in self.graph.relations(concept_id, name):
+            relations += self.fix(rel, pos)
+        result = tuple(uniqify(relations, lambda r: (r.to_id, r.name)))
+        if self.low >= index:
+            # Корень компоненты: её обход завершён
+            for member in self.stack[index:]:
+                del self.on_stack[member]
+                self.closure[member] = result
+            del self.stack[index:]
+        self.low = min(outer_low, self.low)
+        return result
+
+    def fix_all(self, concept_id, pos) -> list:
+        """
+        Все отношения понятия после замыкания для части речи pos,
+        без повторов по паре (понятие, тип отношения)
+        """
+        relations = []
+        for relation in self.graph.relations(concept_id):
+            relations += self.fix(relation, pos)
+        return list(uniqify(relations, lambda r: (r.to_id, r.name)))
+
+
+def uniqify(seq, idfun=None):
+    # order preserving
+    if idfun is None:
+        idfun = lambda x: x
+
+    seen = set()
+    for item in seq:
+        marker = idfun(item)
+        if marker in seen:
+            continue
+        seen.add(marker)
+        yield item
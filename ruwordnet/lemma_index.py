@@ -0,0 +1,442 @@
+#!/usr/bin/env python3
+"""
+Индекс лемм и имён смыслов RuWordNet и текстовых входов РуТез.
+
+Индекс хранится в файле формата снимка (см. ruwordnet.snapshot) и
+открывается через mmap. В нём две таблицы записей:
+
+- senses: смыслы RuWordNet вместе с именем и частью речи синсета;
+- entries: текстовые входы РуТез, по записи на каждое понятие, в которое
+  вход входит (и одна запись без понятия для входов без связок).
+
+Для каждого пространства ключей из KEY_SPACES записаны таблица
+отсортированных нормализованных ключей (<пространство>_keys: ключ,
+начало и длина списка) и таблица списков номеров записей
+(<пространство>_postings). Точный поиск — двоичный поиск по ключам,
+поиск по префиксу — проход от первого ключа не меньше префикса.
+Пространства *_word содержат отдельные слова многословных лемм.
+Таблица source хранит число строк таблиц базы, по которым построен индекс:
+open_index и ensure_index строят индекс заново, если оно изменилось.
+
+    with LemmaIndex("ruwordnet.lemma_index") as index:
+        for sense in index.senses("ДЕНЬ"):
+            print(sense.id, sense.synset_name)
+"""
+
+import argparse
+import logging
+import os
+import tempfile
+from bisect import bisect_left
+from collections import defaultdict, namedtuple
+
+from psycopg2 import connect
+
+from ruwordnet.graph import StringTable
+from ruwordnet.snapshot import Snapshot, SnapshotError, encode_columns, write_tables
+
+SENSE_COLUMNS = (
+    ("id", "str"),
+    ("synset_id", "str"),
+    ("synset_name", "str"),
+    ("part_of_speech", "str"),
+    ("name", "str"),
+    ("lemma", "str"),
+)
+ENTRY_COLUMNS = (
+    ("id", "int"),
+    ("concept_id", "int"),
+    ("concept_name", "str"),
+    ("name", "str"),
+    ("lemma", "str"),
+)
+KEY_COLUMNS = (("key", "str"), ("start", "int"), ("count", "int"))
+POSTING_COLUMNS = (("item", "int"),)
+SOURCE_COLUMNS = (("table", "str"), ("rows", "int"))
+
+# Таблицы базы, из которых строится индекс
+SOURCE_TABLES = ("senses", "synsets", "text_entry", "synonyms", "concepts")
+
+Sense = namedtuple("Sense", [name for name, _ in SENSE_COLUMNS])
+Entry = namedtuple("Entry", [name for name, _ in ENTRY_COLUMNS])
+
+# Пространства ключей: имя, таблица записей, поле и признак разбиения на слова
+KEY_SPACES = (
+    ("sense_lemma", "senses", "lemma", False),
+    ("sense_name", "senses", "name", False),
+    ("sense_word", "senses", "lemma", True),
+    ("synset_name", "senses", "synset_name", False),
+    ("entry_lemma", "entries", "lemma", False),
+    ("entry_name", "entries", "name", False),
+    ("entry_word", "entries", "lemma", True),
+)
+
+SENSES_SQL = """
+    SELECT se.id, se.synset_id, sy.name, sy.part_of_speech, se.name, se.lemma
+    FROM senses se
+      INNER JOIN synsets sy
+        ON sy.id = se.synset_id
+    ORDER BY se.id"""
+
+ENTRIES_SQL = """
+    SELECT t.id, c.id, c.name, t.name, t.lemma
+    FROM text_entry t
+      LEFT JOIN synonyms s
+        ON s.entry_id = t.id
+      LEFT JOIN concepts c
+        ON c.id = s.concept_id
+    ORDER BY t.id, c.id"""
+
+SOURCE_SQL = " UNION ALL ".join(
+    "SELECT '{0}', count(*) FROM {0}".format(table) for table in SOURCE_TABLES
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Build the lemma index of RuWordNet senses and RuThes text entries"
+    )
+    connection_string = (
+        "host='localhost' dbname='ruwordnet' user='ruwordnet' password='ruwordnet'"
+    )
+    parser.add_argument(
+        "-c",
+        "--connection-string",
+        type=str,
+        help="Postgresql database connection string ({})".format(connection_string),
+        default=connection_string,
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        type=str,
+        help="Index file (default: ruwordnet.lemma_index)",
+        default="ruwordnet.lemma_index",
+    )
+    parser.add_argument(
+        "-s",
+        "--snapshot",
+        type=str,
+        help="Build the index from the snapshot file instead of the database",
+    )
+    parser.add_argument(
+        "--lookup",
+        type=str,
+        help="Do not build anything, look the key up in the existing index",
+    )
+    parser.add_argument(
+        "--prefix",
+        action="store_true",
+        help="With --lookup, search keys starting with the given value",
+    )
+    parser.add_argument(
+        "--space",
+        type=str,
+        choices=[space for space, _, _, _ in KEY_SPACES],
+        default="sense_lemma",
+        help="Key space for --lookup (default: sense_lemma)",
+    )
+    ARGS = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    if ARGS.lookup is not None:
+        with LemmaIndex(ARGS.output) as index:
+            if ARGS.prefix:
+                keys = [key for key, _ in index.prefix(ARGS.lookup, ARGS.space)]
+            else:
+                keys = [ARGS.lookup]
+            for key in keys:
+                for item in index.items(key, ARGS.space):
+                    print(key, *item, sep="\t")
+        return
+
+    logging.info("Start")
+    if ARGS.snapshot:
+        with Snapshot(ARGS.snapshot) as snapshot:
+            build_from_snapshot(snapshot, ARGS.output)
+    else:
+        build_from_database(connect(ARGS.connection_string), ARGS.output)
+    logging.info("Done")
+
+
+def normalize(value) -> str:
+    return " ".join(value.split()).upper()
+
+
+def open_index(filename, connection, rebuild=False) -> "LemmaIndex":
+    """
+    Открывает индекс из файла filename; если файла нет, он устарел или
+    задан rebuild, индекс сначала строится по базе (см. ensure_index).
+    Без filename индекс строится во временном файле, который удаляется
+    сразу после открытия.
+    """
+    if filename:
+        ensure_index(connection, filename, rebuild)
+        return LemmaIndex(filename)
+
+    descriptor, filename = tempfile.mkstemp(suffix=".lemma_index")
+    os.close(descriptor)
+    try:
+        build_from_database(connection, filename)
+        return LemmaIndex(filename)
+    finally:
+        os.remove(filename)
+
+
+def ensure_index(connection, filename, rebuild=False) -> bool:
+    """
+    Строит индекс в файле filename, если файла нет, задан rebuild или
+    число строк таблиц базы отличается от записанного в индексе.
+    Возвращает True, если индекс был построен.
+    """
+    reason = "rebuild requested"
+    if not rebuild:
+        reason = stale_reason(connection, filename)
+    if reason is None:
+        logging.info("Reusing the lemma index %s", filename)
+        return False
+    logging.info("Building the lemma index %s: %s", filename, reason)
+    build_from_database(connection, filename)
+    return True
+
+
+def stale_reason(connection, filename):
+    """
+    Причина, по которой индекс в файле filename нельзя использовать с базой,
+    или None, если индекс построен по её текущему состоянию
+    """
+    if not os.path.exists(filename):
+        return "the file does not exist"
+    try:
+        with LemmaIndex(filename) as index:
+            source = index.source
+    except SnapshotError as e:
+        return str(e)
+    if not source:
+        return "the index does not record the row counts of the database"
+    current = source_rows(connection)
+    changed = [
+        "{} {} -> {} rows".format(table, source.get(table), rows)
+        for table, rows in current.items()
+        if source.get(table) != rows
+    ]
+    if changed:
+        return "the database has changed ({})".format(", ".join(changed))
+    return None
+
+
+def source_rows(connection) -> dict:
+    """
+    Число строк таблиц базы, из которых строится индекс
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(SOURCE_SQL)
+        return dict(cursor.fetchall())
+
+
+def build_from_database(connection, filename):
+    source = source_rows(connection)
+    tables = {}
+    for name, sql in (("senses", SENSES_SQL), ("entries", ENTRIES_SQL)):
+        logging.info("Fetching %s...", name)
+        # Обычный курсор: скрипты работают с соединением в режиме autocommit
+        with connection.cursor() as cursor:
+            cursor.execute(sql)
+            tables[name] = cursor.fetchall()
+    write_index(filename, tables["senses"], tables["entries"], source)
+
+
+def build_from_snapshot(snapshot, filename):
+    synsets = {
+        synset_id: (name, part_of_speech)
+        for synset_id, name, part_of_speech in snapshot["synsets"].select(
+            "id", "name", "part_of_speech"
+        )
+    }
+    senses = []
+    for sense_id, synset_id, name, lemma in snapshot["senses"].select(
+        "id", "synset_id", "name", "lemma"
+    ):
+        if synset_id in synsets:
+            senses.append((sense_id, synset_id, *synsets[synset_id], name, lemma))
+
+    concept_names = dict(snapshot["concepts"].select("id", "name"))
+    entry_concepts = defaultdict(list)
+    for concept_id, entry_id in snapshot["synonyms"].select("concept_id", "entry_id"):
+        entry_concepts[entry_id].append(concept_id)
+    entries = []
+    for entry_id, name, lemma in snapshot["text_entry"].select("id", "name", "lemma"):
+        # Как в LEFT JOIN из ENTRIES_SQL: вход без связок и связки
+        # с несуществующими понятиями дают записи без понятия
+        linked = entry_concepts.get(entry_id, [None])
+        concepts = sorted(cid for cid in linked if cid in concept_names)
+        concepts += [None] * (len(linked) - len(concepts))
+        for concept_id in concepts:
+            entries.append(
+                (entry_id, concept_id, concept_names.get(concept_id), name, lemma)
+            )
+    source = {table: len(snapshot[table]) for table in SOURCE_TABLES}
+    write_index(filename, senses, entries, source)
+
+
+def write_index(filename, senses, entries, source):
+    """
+    Записывает индекс по записям senses и entries (кортежи в порядке
+    столбцов SENSE_COLUMNS и ENTRY_COLUMNS); source — число строк таблиц
+    базы, из которых они получены
+    """
+    items = {
+        "senses": [Sense._make(row) for row in senses],
+        "entries": [Entry._make(row) for row in entries],
+    }
+    strings = StringTable()
+    tables = [
+        ("senses", SENSE_COLUMNS, encode_columns(SENSE_COLUMNS, senses, strings)),
+        ("entries", ENTRY_COLUMNS, encode_columns(ENTRY_COLUMNS, entries, strings)),
+        (
+            "source",
+            SOURCE_COLUMNS,
+            encode_columns(SOURCE_COLUMNS, source.items(), strings),
+        ),
+    ]
+    for space, table, field, split in KEY_SPACES:
+        logging.info("Indexing %s...", space)
+        postings = defaultdict(list)
+        for number, item in enumerate(items[table]):
+            value = getattr(item, field)
+            if value is None:
+                continue
+            key = normalize(value)
+            if not split:
+                postings[key].append(number)
+                continue
+            words = key.split()
+            if len(words) > 1:
+                for word in dict.fromkeys(words):
+                    postings[word].append(number)
+
+        keys = []
+        items_column = []
+        for key in sorted(postings):
+            keys.append((key, len(items_column), len(postings[key])))
+            items_column.extend(postings[key])
+        tables.append(
+            (space + "_keys", KEY_COLUMNS, encode_columns(KEY_COLUMNS, keys, strings))
+        )
+        tables.append(
+            (
+                space + "_postings",
+                POSTING_COLUMNS,
+                encode_columns(
+                    POSTING_COLUMNS, ((item,) for item in items_column), strings
+                ),
+            )
+        )
+    write_tables(filename, tables, strings)
+    logging.info(
+        "Lemma index written to %s (%s bytes)", filename, os.path.getsize(filename)
+    )
+
+
+class LemmaIndex:
+    """
+    Открытый индекс лемм. Ключи при поиске нормализуются так же, как при
+    построении: пробелы схлопываются, буквы переводятся в верхний регистр.
+    """
+
+    def __init__(self, filename):
+        self.snapshot = Snapshot(filename)
+        try:
+            self.tables = {
+                "senses": self.snapshot["senses"],
+                "entries": self.snapshot["entries"],
+            }
+            self.spaces = {
+                space: (
+                    table,
+                    self.snapshot[space + "_keys"],
+                    self.snapshot[space + "_postings"].column("item").values,
+                )
+                for space, table, _, _ in KEY_SPACES
+            }
+        except SnapshotError:
+            self.snapshot.close()
+            raise SnapshotError("{}: not a lemma index".format(filename))
+        self.types = {"senses": Sense, "entries": Entry}
+        # В индексах, построенных до появления таблицы source, её нет
+        self.source = {}
+        if "source" in self.snapshot.tables:
+            self.source = dict(self.snapshot["source"].select("table", "rows"))
+
+    def lookup(self, key, space="sense_lemma") -> list:
+        """
+        Номера записей с ключом key в пространстве space
+        """
+        _, keys, postings = self.space(space)
+        key = normalize(key)
+        column = keys.column("key")
+        position = bisect_left(column, key)
+        if position == len(column) or column[position] != key:
+            return []
+        return self.postings(keys, postings, position)
+
+    def prefix(self, prefix, space="sense_lemma"):
+        """
+        Пары (ключ, номера записей) для ключей, начинающихся с prefix,
+        в порядке ключей
+        """
+        _, keys, postings = self.space(space)
+        prefix = normalize(prefix)
+        column = keys.column("key")
+        for position in range(bisect_left(column, prefix), len(column)):
+            key = column[position]
+            if not key.startswith(prefix):
+                break
+            yield key, self.postings(keys, postings, position)
+
+    def items(self, key, space="sense_lemma") -> list:
+        """
+        Записи (Sense или Entry, в зависимости от пространства) с ключом key
+        """
+        table = self.space(space)[0]
+        return [self.item(table, number) for number in self.lookup(key, space)]
+
+    def senses(self, key, space="sense_lemma") -> list:
+        return self.items(key, space)
+
+    def entries(self, key, space="entry_lemma") -> list:
+        return self.items(key, space)
+
+    def components(self, word) -> list:
+        """
+        Смыслы, в многословные леммы которых входит слово word
+        """
+        return self.items(word, "sense_word")
+
+    def item(self, table, number):
+        return self.types[table]._make(self.tables[table][number])
+
+    def space(self, space):
+        try:
+            return self.spaces[space]
+        except KeyError:
+            raise SnapshotError("There is no key space {} in the index".format(space))
+
+    @staticmethod
+    def postings(keys, postings, position) -> list:
+        start = keys.column("start")[position]
+        return postings[start : start + keys.column("count")[position]].tolist()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        self.snapshot.close()
+
+
+if __name__ == "__main__":
+    main()
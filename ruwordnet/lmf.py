@@ -0,0 +1,139 @@
+"""
+Проверка документов WN-LMF (sql2xml/sql2rwn_omw_xml.py) по WN-LMF-1.0.dtd
+по мере их записи.
+
+    validator = LmfValidator()
+    for data in chunks:
+        validator.feed(data)
+    errors = validator.close()
+"""
+
+import os
+
+from lxml import etree
+
+DTD_URL = "http://globalwordnet.github.io/schemas/WN-LMF-1.0.dtd"
+DTD_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "WN-LMF-1.0.dtd"
+)
+
+
+class LmfValidator:
+    """
+    Проверяет документ по WN-LMF-1.0.dtd по мере записи. Каждый
+    законченный LexicalEntry и Synset проверяется по DTD отдельно и
+    удаляется из дерева разбора, чтобы память не росла; Lexicon и
+    LexicalResource проверяются, когда закрываются, — к этому времени
+    в Lexicon остаются только первый и последний дочерние элементы, чего
+    достаточно для проверки его содержимого. Уникальность ID, ссылки IDREF
+    и порядок LexicalEntry и Synset проверяются здесь же: libxml2 видит
+    не весь документ сразу.
+    """
+
+    def __init__(self):
+        self.parser = etree.XMLPullParser(events=("end",), no_network=True)
+        self.dtd = etree.DTD(DTD_PATH)
+        self.id_attributes = {}
+        self.idref_attributes = {}
+        for element in self.dtd.iterelements():
+            for attribute in element.iterattributes():
+                if attribute.type == "id":
+                    self.id_attributes.setdefault(element.name, []).append(
+                        attribute.name
+                    )
+                elif attribute.type in ("idref", "idrefs"):
+                    self.idref_attributes.setdefault(element.name, []).append(
+                        attribute.name
+                    )
+        self.ids = set()
+        self.idrefs = set()
+        self.errors = []
+        self.reported = set()
+        self.in_synsets = False
+
+    def feed(self, data: bytes):
+        # Исключение из write() потерялось бы внутри etree.xmlfile,
+        # поэтому ошибки разбора собираются, а не пробрасываются
+        try:
+            self.parser.feed(data)
+        except etree.XMLSyntaxError as e:
+            self.add_errors(e.error_log)
+        self.read_events()
+
+    def read_events(self):
+        for _, element in self.parser.read_events():
+            self.check_ids(element)
+            self.check_order(element)
+            if element.tag in ("LexicalEntry", "Synset"):
+                self.check_dtd(element)
+                # Первый дочерний элемент Lexicon остаётся для проверки
+                # содержимого Lexicon
+                previous = element.getprevious()
+                if previous is not None and previous.getprevious() is not None:
+                    element.getparent().remove(previous)
+            elif element.tag in ("Lexicon", "LexicalResource"):
+                self.check_dtd(element)
+
+    def check_dtd(self, element):
+        if self.dtd.validate(element):
+            return
+        # lxml проверяет элемент как корень отдельного документа и переносит
+        # на него объявления пространств имён предков (xmlns:dc)
+        parent = element.getparent()
+        inherited = parent is not None and element.nsmap == parent.nsmap
+        self.add_errors(
+            error
+            for error in self.dtd.error_log
+            if not (
+                inherited
+                and error.type == etree.ErrorTypes.DTD_UNKNOWN_ATTRIBUTE
+                and "attribute xmlns" in error.message
+            )
+        )
+
+    def add_errors(self, error_log):
+        for error in error_log:
+            if error.type == etree.ErrorTypes.DTD_UNKNOWN_ID:
+                # Элементы с этими ID уже удалены из дерева; ссылки
+                # проверяются в close() по self.ids
+                continue
+            message = "line {}: {}".format(error.line, error.message)
+            if message not in self.reported:
+                self.reported.add(message)
+                self.errors.append(message)
+
+    def check_ids(self, element):
+        for name in self.id_attributes.get(element.tag, ()):
+            value = element.get(name)
+            if value in self.ids:
+                self.errors.append("ID {} already defined".format(value))
+            self.ids.add(value)
+        for name in self.idref_attributes.get(element.tag, ()):
+            value = element.get(name)
+            if value is not None:
+                self.idrefs.update(value.split())
+
+    def check_order(self, element):
+        if element.tag == "Synset":
+            self.in_synsets = True
+        elif element.tag == "LexicalEntry" and self.in_synsets:
+            self.errors.append(
+                "line {}: LexicalEntry {} follows Synset".format(
+                    element.sourceline, element.get("id")
+                )
+            )
+        elif element.tag == "Lexicon":
+            self.in_synsets = False
+
+    def close(self) -> list:
+        """Завершает проверку и возвращает список ошибок"""
+        try:
+            self.parser.close()
+        except etree.XMLSyntaxError as e:
+            self.add_errors(e.error_log)
+        self.read_events()
+        self.errors += [
+            'IDREF references an unknown ID "{}"'.format(idref)
+            for idref in sorted(self.idrefs - self.ids)
+        ]
+        return self.errors
@@ -0,0 +1,136 @@
+"""
+Определение частей речи слов текстовых входов с помощью pymorphy2.
+
+MorphService разбирает каждую словоформу один раз: результаты хранятся
+в LRU-кэше по словоформе, а parse_many принимает сразу много слов,
+убирает повторы и разбирает только отсутствующие в кэше, при workers > 1 —
+в пуле процессов. Исключения (слова, часть речи которых pymorphy2
+определяет неверно) задаются кортежами (слово, найденная часть речи,
+правильная часть речи) и собираются в словарь.
+
+    with MorphService(exceptions=POS_EXCEPTIONS) as service:
+        poses = service.parse_many(words)
+        print(service.pos("МАРШ"))
+"""
+
+import logging
+from multiprocessing import Pool
+from typing import Dict, Iterable, List
+
+import pymorphy2
+
+from ruwordnet.cache import LRUCache
+
+# Части речи pymorphy2 -> части речи РуТез
+POS_NAMES = {
+    None: "N",
+    "NOUN": "N",
+    "ADJF": "Adj",
+    "PRTF": "Adj",
+    "PRTS": "Adj",
+    "INFN": "V",
+    "ADVB": "Adv",
+    "PRCL": "Prtc",
+    "NPRO": "Pron",
+    "PREP": "Prep",
+    "CONJ": "Conj",
+}
+
+# Анализатор процесса пула (в основном процессе — анализатор сервиса)
+analyzer = None
+
+
+def init_analyzer():
+    global analyzer
+    if analyzer is None:
+        analyzer = pymorphy2.MorphAnalyzer()
+
+
+def parse_words(words: List[str]) -> List[str]:
+    """
+    Части речи pymorphy2 для слов (первый разбор каждого слова)
+    """
+    poses = [analyzer.parse(word)[0].tag.POS for word in words]
+    # Граммемы pymorphy2 — подкласс str, который не передаётся между процессами
+    return [None if pos is None else str(pos) for pos in poses]
+
+
+class MorphService:
+    def __init__(self, exceptions=(), cache_size=200000, workers=1, chunk_size=1000):
+        init_analyzer()
+        self.exceptions = {
+            (word, detected): correct for word, detected, correct in exceptions
+        }
+        self.cache = LRUCache(cache_size)
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self) -> None:
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+    def pos(self, word: str) -> str:
+        """
+        Часть речи слова в обозначениях РуТез
+        """
+        pos = self.cache.get(word)
+        if pos is None:
+            pos = self.rename(word, parse_words([word])[0])
+            self.cache.put(word, pos)
+        return pos
+
+    def poses(self, words: List[str]) -> List[str]:
+        poses = self.parse_many(words)
+        return [poses[word] for word in words]
+
+    def parse_many(self, words: Iterable[str]) -> Dict[str, str]:
+        """
+        Части речи всех слов words: каждое слово разбирается не больше
+        одного раза
+        """
+        result = {}
+        missing = []
+        for word in dict.fromkeys(words):
+            pos = self.cache.get(word)
+            if pos is None:
+                missing.append(word)
+            else:
+                result[word] = pos
+
+        if self.workers > 1 and len(missing) > self.chunk_size:
+            if self.pool is None:
+                # Процессы пула наследуют уже загруженные словари анализатора
+                self.pool = Pool(self.workers, initializer=init_analyzer)
+            chunks = [
+                missing[start : start + self.chunk_size]
+                for start in range(0, len(missing), self.chunk_size)
+            ]
+            detected = [
+                pos for poses in self.pool.map(parse_words, chunks) for pos in poses
+            ]
+        else:
+            detected = parse_words(missing)
+
+        for word, pos in zip(missing, detected):
+            pos = self.rename(word, pos)
+            self.cache.put(word, pos)
+            result[word] = pos
+        return result
+
+    def rename(self, word: str, pos) -> str:
+        correct = self.exceptions.get((word, pos))
+        if correct is not None:
+            return correct
+        if pos in POS_NAMES:
+            return POS_NAMES[pos]
+        logging.info("%s: %s", word, pos)
+        return str(pos)
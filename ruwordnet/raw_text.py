@@ -0,0 +1,257 @@
+"""
+Разбор исходных текстовых файлов РуТез (кодировка Windows-1251): понятий
+с глоссами, отношений, синонимов и текстовых входов. Разбор общий для
+raw2xml и raw2sql.
+
+Строка файла текстовых входов:
+
+    <id> <имя> 10|20 <лемма> [<synt_type> [<главное слово> <pos_string>]]
+
+Имя и лемма — последовательности слов из символов WORD_CHARS, разделённых
+не более чем двумя пробельными символами; поля разделяются любым числом
+пробельных символов. Раньше строка по очереди сопоставлялась с тремя
+регулярными выражениями с вложенными повторениями, которые на длинных
+строках перебирали границы имени и леммы с возвратами. Здесь строка
+один раз разбивается на слова, а граница имени и леммы выбирается так же,
+как её выбирали эти выражения (самое длинное имя, затем самая длинная
+лемма; сначала полная строка, затем строка без главного слова и pos_string,
+затем только лемма), но за время, линейное по длине строки.
+
+    with open(filename, encoding=ENCODING) as file:
+        for line in file:
+            entry = parse_text_entry(line)
+"""
+
+import logging
+import re
+from collections import namedtuple
+from typing import List, Optional
+
+ENCODING = "Cp1251"
+
+Concept = namedtuple("Concept", "id name gloss domain")
+Relation = namedtuple("Relation", "from_id to_id name asp")
+Synonym = namedtuple("Synonym", "concept_id entry_id")
+TextEntry = namedtuple("TextEntry", "id name lemma synt_type main_word pos_string")
+
+CONCEPT = re.compile(r"^(\d+)\s+(.+)\s+(\d+)$")
+# Коды предметных областей общей лексики
+GENERAL_DOMAINS = {8, 40, 264, 296, 2968}
+RELATION_NAMES = {10: "ВЫШЕ", 20: "ЦЕЛОЕ", 30: "НИЖЕ", 40: "ЧАСТЬ"}
+ASSOCIATION_NAMES = {"1": "АСЦ1", "2": "АСЦ2"}
+
+# Символы слов имени и леммы
+WORD_CHARS = r'[\w\-",()./]'
+# Слова, разделяющие имя и лемму
+SEPARATORS = {"10", "20"}
+# Наибольшее число пробельных символов между словами имени или леммы
+MAX_GAP = 2
+
+TOKEN = re.compile(r"(\S+)(\s*)")
+WORD = re.compile(WORD_CHARS + "+")
+# Обычная строка выгрузки с выравниванием по колонкам: имя и лемма отделены
+# от соседних полей не меньше чем тремя пробельными символами, поэтому их
+# границы однозначны и выражение не перебирает их с возвратами
+PHRASE = "{0}+(?:\\s{{1,{1}}}{0}+)*".format(WORD_CHARS, MAX_GAP)
+ALIGNED = re.compile(
+    r"(\d+)\s+({phrase})\s{{{gap}}}(?:10|20)\s+({phrase})\s{{{gap}}}"
+    r"([A-Za-z]+)\s+([А-Яа-я\-]+)\s+([A-Za-z ]+)".format(
+        phrase=PHRASE, gap="{},".format(MAX_GAP + 1)
+    )
+)
+LATIN = re.compile("[A-Za-z]+")
+CYRILLIC = re.compile(r"[А-Яа-я\-]+")
+POS_STRING = re.compile("[A-Za-z ]+")
+LATIN_LETTERS = frozenset("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz")
+
+
+def parse_text_entry(line: str) -> Optional[TextEntry]:
+    """
+    Текстовый вход из строки файла или None, если строка не разбирается.
+    Отсутствующие в строке поля — пустые строки
+    """
+    match = ALIGNED.match(line)
+    if match is not None:
+        return TextEntry(*match.groups())
+
+    if not line or line[0].isspace():
+        return None
+    # Слово i и промежуток после него (у последнего слова может быть пустым)
+    pairs = TOKEN.findall(line)
+    count = len(pairs)
+    if count < 4:
+        return None
+    words, gaps = zip(*pairs)
+    if not words[0].isdecimal():
+        return None
+
+    # Слова, целиком состоящие из WORD_CHARS, и последнее слово
+    # последовательности таких слов с промежутками не длиннее MAX_GAP
+    is_word = [word.isalnum() or WORD.fullmatch(word) is not None for word in words]
+    run_end = [None] * count
+    following = None
+    for i in range(count - 1, 0, -1):
+        if is_word[i]:
+            if following is None or len(gaps[i]) > MAX_GAP:
+                following = i
+            run_end[i] = following
+        else:
+            following = None
+    if not is_word[1]:
+        return None
+
+    # Возможные концы имени, от самого длинного имени к самому короткому
+    name_ends = [
+        j
+        for j in range(run_end[1], 0, -1)
+        if j + 2 < count and words[j + 1] in SEPARATORS
+    ]
+    if not name_ends:
+        return None
+
+    def find_lemma(is_valid):
+        """
+        Самое длинное имя и самая длинная при нём лемма, после которой
+        идут поля, для которых is_valid(конец леммы). Каждое слово
+        проверяется не больше одного раза
+        """
+        checked = {}
+        for j in name_ends:
+            start = j + 2
+            if not is_word[start]:
+                continue
+            end = run_end[start]
+            for k in range(checked.get(end, end + 1) - 1, start - 1, -1):
+                if is_valid(k):
+                    return j, k
+            checked[end] = start
+        return None
+
+    def is_full(k):
+        return (
+            k + 2 < count
+            and LATIN.fullmatch(words[k + 1]) is not None
+            and CYRILLIC.fullmatch(words[k + 2]) is not None
+            and (
+                k + 3 < count
+                and words[k + 3][0] in LATIN_LETTERS
+                or " " in gaps[k + 2][1:]
+            )
+        )
+
+    def is_short(k):
+        return k + 1 < count and words[k + 1][0] in LATIN_LETTERS
+
+    def join(first, last):
+        return "".join([words[i] + gaps[i] for i in range(first, last)] + [words[last]])
+
+    found = find_lemma(is_full)
+    if found is not None:
+        j, k = found
+        if k + 3 < count and words[k + 3][0] in LATIN_LETTERS:
+            pos_string = POS_STRING.match(join(k + 3, count - 1) + gaps[-1]).group()
+        else:
+            # Прежнее регулярное выражение в этом случае забирало в pos_string
+            # пробел из промежутка после главного слова
+            pos_string = " "
+        return TextEntry(
+            words[0], join(1, j), join(j + 2, k), words[k + 1], words[k + 2], pos_string
+        )
+
+    found = find_lemma(is_short)
+    if found is not None:
+        j, k = found
+        synt_type = LATIN.match(words[k + 1]).group()
+        return TextEntry(words[0], join(1, j), join(j + 2, k), synt_type, "", "")
+
+    for j in name_ends:
+        if is_word[j + 2]:
+            # Лемма без полей после неё может закончиться внутри следующего слова
+            k = run_end[j + 2]
+            lemma = join(j + 2, k)
+            if k + 1 < count and len(gaps[k]) <= MAX_GAP:
+                match = WORD.match(words[k + 1])
+                if match is not None:
+                    lemma += gaps[k] + match.group()
+        else:
+            match = WORD.match(words[j + 2])
+            if match is None:
+                continue
+            lemma = match.group()
+        return TextEntry(words[0], join(1, j), lemma, "", "", "")
+    return None
+
+
+def read_concepts(filename: str, gloss_filename: str) -> List[Concept]:
+    """
+    Понятия, упорядоченные по id (как строкам), с глоссами из второго файла.
+    В файле глосс строка «id<TAB>имя» начинает глоссу понятия, следующие
+    строки — её текст
+    """
+    concepts = {}
+    with open(filename, "r", encoding=ENCODING) as file:
+        for line in file:
+            # В файле вместо табуляций пробелы, поэтому он разбирается
+            # регулярным выражением
+            concept_id, name, domain = CONCEPT.findall(line)[0]
+            concepts[concept_id] = [name.strip(), "", domain_name(domain)]
+
+    def set_gloss(header, parts):
+        if not parts:
+            return
+        gloss = " " + " ".join(parts)
+        if header and header[0] in concepts:
+            concepts[header[0]][1] = gloss.strip()
+        elif header:
+            logging.warning("Concept not found %s %s", header, gloss)
+        else:
+            logging.warning("Gloss without concept %s", gloss)
+
+    header = None
+    parts = []
+    with open(gloss_filename, "r", encoding=ENCODING) as file:
+        for line in file:
+            fields = line.split("\t")
+            if len(fields) == 2:
+                set_gloss(header, parts)
+                header = fields
+                parts = []
+            else:
+                parts.append(line.strip())
+    set_gloss(header, parts)
+
+    return [Concept(key, *values) for key, values in sorted(concepts.items())]
+
+
+def domain_name(code: str) -> str:
+    code = int(code)
+    if code in GENERAL_DOMAINS:
+        return "GL"
+    if code == 2:
+        return "GEO"
+    return "SOC-POL"
+
+
+def parse_relation(line: str) -> Relation:
+    """
+    Строка «from to код [уточнение]»: код 50 — ассоциация, уточнение
+    1 или 2 задаёт её направление, уточнение В — аспект отношения.
+    Для неизвестного кода имя отношения — None
+    """
+    fields = re.split(r"\s+", line.strip())
+    code = int(fields[2])
+    extra = fields[3] if len(fields) == 4 else None
+    if code == 50:
+        name = ASSOCIATION_NAMES.get(extra, "АСЦ")
+    else:
+        name = RELATION_NAMES.get(code)
+    return Relation(fields[0], fields[1], name, "В" if extra == "В" else " ")
+
+
+def parse_synonym(line: str) -> Synonym:
+    """
+    Строка «id понятия  id текстового входа» (поля разделены хотя бы
+    двумя пробельными символами)
+    """
+    fields = re.split(r"\s{2,}", line.strip())
+    return Synonym(fields[0], fields[1])
@@ -0,0 +1,88 @@
+"""
+Xml-файлы РуТез (raw2xml/out), которые читает xml2sql/xml2sql.py.
+
+Элементы записываются в файл по одному, по мере разбора исходных текстовых
+файлов, поэтому дерево всего файла в памяти не строится. Результат
+совпадает с выводом etree.ElementTree.write(..., pretty_print=True).
+
+    with XmlWriter(filename, "entries") as writer:
+        for entry in entries:
+            writer.write(text_entry_element(entry))
+"""
+
+from contextlib import ExitStack
+
+from lxml import etree
+
+from ruwordnet.raw_text import Concept, Relation, Synonym, TextEntry
+
+INDENT = "  "
+
+
+class XmlWriter:
+    def __init__(self, filename: str, root_tag: str):
+        self.filename = filename
+        self.root_tag = root_tag
+        self.count = 0
+
+    def __enter__(self):
+        self.file = open(self.filename, "wb")
+        self.stack = ExitStack()
+        self.xml = self.stack.enter_context(etree.xmlfile(self.file, encoding="utf-8"))
+        self.stack.enter_context(self.xml.element(self.root_tag))
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        try:
+            if self.count and exc_type is None:
+                self.xml.write("\n")
+            # Закрываются корневой элемент и xml-файл
+            self.stack.__exit__(exc_type, exc_val, exc_tb)
+            if exc_type is None:
+                self.file.write(b"\n")
+        finally:
+            self.file.close()
+
+    def write(self, element) -> None:
+        etree.indent(element, space=INDENT, level=1)
+        self.xml.write("\n" + INDENT)
+        self.xml.write(element)
+        self.count += 1
+
+
+def concept_element(concept: Concept):
+    element = etree.Element("concept")
+    element.set("id", concept.id)
+    add_fields(element, concept, ("name", "gloss", "domain"))
+    return element
+
+
+def relation_element(relation: Relation):
+    element = etree.Element("rel")
+    element.set("from", relation.from_id)
+    element.set("to", relation.to_id)
+    if relation.name is not None:
+        element.set("name", relation.name)
+    element.set("asp", relation.asp)
+    return element
+
+
+def synonym_element(synonym: Synonym):
+    element = etree.Element("entry_rel")
+    element.set("concept_id", synonym.concept_id)
+    element.set("entry_id", synonym.entry_id)
+    return element
+
+
+def text_entry_element(entry: TextEntry):
+    element = etree.Element("entry")
+    element.set("id", entry.id)
+    add_fields(
+        element, entry, ("name", "lemma", "main_word", "synt_type", "pos_string")
+    )
+    return element
+
+
+def add_fields(element, record, fields) -> None:
+    for field in fields:
+        etree.SubElement(element, field).text = getattr(record, field)
@@ -0,0 +1,563 @@
+#!/usr/bin/env python3
+"""
+HTTP-сервис только для чтения: поиск по RuWordNet с ответами в JSON.
+
+Запросы (только GET):
+
+- /senses?lemma=<лемма> — смыслы с данной леммой (лемма нормализуется
+  так же, как в ruwordnet.lemma_index);
+- /senses/<id>/relations — отношения смысла (derived_from, composed_of
+  и другие из sense_relations) в обе стороны;
+- /synsets/<id> — синсет, его смыслы и отношения;
+- /synsets/<id>/hypernyms — пути по гиперонимам от синсета до вершин;
+- /synsets/<id>/ili — связи понятия синсета с WordNet из таблицы ili.
+
+Данные берутся из PostgreSQL через пул соединений (DatabaseBackend,
+запросы выполняются в потоках, чтобы не блокировать цикл событий) или
+из снимка базы (SnapshotBackend, всё в памяти, база не нужна). Готовые
+ответы хранятся в ограниченном LRU-кэше.
+
+    python -m ruwordnet.service --snapshot ruwordnet.snapshot --port 8000
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from psycopg2 import extras
+from psycopg2.pool import ThreadedConnectionPool
+
+from ruwordnet.cache import LRUCache
+from ruwordnet.lemma_index import normalize
+from ruwordnet.snapshot import Snapshot
+
+HYPERNYM_RELATIONS = ("hypernym", "instance hypernym")
+
+# Предел числа путей по гиперонимам в ответе
+MAX_PATHS = 100
+
+# Предел длины строки запроса и заголовков
+MAX_REQUEST_SIZE = 65536
+
+
+class NotFound(Exception):
+    pass
+
+
+class BadRequest(Exception):
+    pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Read-only RuWordNet HTTP service")
+    connection_string = (
+        "host='localhost' dbname='ruwordnet' user='ruwordnet' password='ruwordnet'"
+    )
+    parser.add_argument(
+        "-c",
+        "--connection-string",
+        type=str,
+        help="Postgresql database connection string ({})".format(connection_string),
+        default=connection_string,
+    )
+    parser.add_argument(
+        "-s",
+        "--snapshot",
+        type=str,
+        help="Serve data from the snapshot file instead of the database",
+    )
+    parser.add_argument(
+        "--host", type=str, help="Address to listen on", default="127.0.0.1"
+    )
+    parser.add_argument("--port", type=int, help="Port to listen on", default=8000)
+    parser.add_argument(
+        "--pool-size",
+        type=int,
+        help="Number of database connections (default: 8)",
+        default=8,
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        help="Number of responses kept in the LRU cache, 0 disables it "
+        "(default: 100000)",
+        default=100000,
+    )
+    ARGS = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    if ARGS.snapshot:
+        logging.info("Loading snapshot %s", ARGS.snapshot)
+        with Snapshot(ARGS.snapshot) as snapshot:
+            backend = SnapshotBackend(snapshot)
+    else:
+        backend = DatabaseBackend(ARGS.connection_string, ARGS.pool_size)
+
+    service = Service(backend, LRUCache(ARGS.cache_size))
+    try:
+        asyncio.run(service.serve(ARGS.host, ARGS.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        backend.close()
+
+
+class Service:
+    def __init__(self, backend, cache):
+        self.backend = backend
+        self.cache = cache
+        self.executor = None
+        if backend.blocking:
+            self.executor = ThreadPoolExecutor(max_workers=backend.pool_size)
+
+    async def serve(self, host, port):
+        server = await asyncio.start_server(
+            self.handle_connection, host, port, limit=MAX_REQUEST_SIZE
+        )
+        logging.info("Listening on http://%s:%s", host, port)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            if self.executor is not None:
+                self.executor.shutdown()
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+                    break
+                lines = head.decode("latin-1").split("\r\n")
+                try:
+                    method, target, version = lines[0].split(" ")
+                except ValueError:
+                    writer.write(
+                        make_response(HTTPStatus.BAD_REQUEST, error_body("Bad request"))
+                    )
+                    break
+                headers = {}
+                for line in lines[1:]:
+                    name, _, value = line.partition(":")
+                    headers[name.strip().lower()] = value.strip().lower()
+                keep_alive = (
+                    headers.get("connection") != "close"
+                    if version == "HTTP/1.1"
+                    else headers.get("connection") == "keep-alive"
+                )
+                # Тело запроса не читается: после него соединение закрывается,
+                # иначе тело было бы разобрано как следующий запрос
+                if (
+                    headers.get("content-length", "0") != "0"
+                    or "transfer-encoding" in headers
+                ):
+                    keep_alive = False
+
+                if method not in ("GET", "HEAD"):
+                    keep_alive = False
+                    status, body = (
+                        HTTPStatus.METHOD_NOT_ALLOWED,
+                        error_body("Only GET requests are supported"),
+                    )
+                else:
+                    status, body = await self.respond(target)
+                writer.write(
+                    make_response(status, body, keep_alive, head_only=method == "HEAD")
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def respond(self, target):
+        response = self.cache.get(target)
+        if response is not None:
+            return response
+
+        try:
+            handler, args = self.route(target)
+            if self.executor is None:
+                result = handler(*args)
+            else:
+                result = await asyncio.get_running_loop().run_in_executor(
+                    self.executor, handler, *args
+                )
+        except NotFound as e:
+            response = HTTPStatus.NOT_FOUND, error_body(str(e))
+        except BadRequest as e:
+            return HTTPStatus.BAD_REQUEST, error_body(str(e))
+        except Exception:
+            logging.exception("Failed to process %s", target)
+            return (
+                HTTPStatus.INTERNAL_SERVER_ERROR,
+                error_body("Internal server error"),
+            )
+        else:
+            response = (
+                HTTPStatus.OK,
+                json.dumps(result, ensure_ascii=False).encode("utf-8"),
+            )
+        self.cache.put(target, response)
+        return response
+
+    def route(self, target):
+        url = urlsplit(target)
+        parts = [unquote(part) for part in url.path.strip("/").split("/")]
+        backend = self.backend
+        if parts == ["senses"]:
+            lemma = parse_qs(url.query).get("lemma")
+            if not lemma:
+                raise BadRequest("Parameter lemma is required")
+            return backend.senses, (lemma[0],)
+        if len(parts) == 3 and parts[0] == "senses" and parts[2] == "relations":
+            return backend.sense_relations, (parts[1],)
+        if len(parts) == 2 and parts[0] == "synsets":
+            return backend.synset, (parts[1],)
+        if len(parts) == 3 and parts[0] == "synsets":
+            if parts[2] == "hypernyms":
+                return backend.hypernym_paths, (parts[1],)
+            if parts[2] == "ili":
+                return backend.ili, (parts[1],)
+        raise NotFound("Unknown path {}".format(url.path))
+
+
+def make_response(status, body, keep_alive=False, head_only=False) -> bytes:
+    head = (
+        "HTTP/1.1 {} {}\r\n"
+        "Content-Type: application/json; charset=utf-8\r\n"
+        "Content-Length: {}\r\n"
+        "Connection: {}\r\n"
+        "\r\n".format(
+            status.value,
+            status.phrase,
+            len(body),
+            "keep-alive" if keep_alive else "close",
+        )
+    ).encode("latin-1")
+    return head if head_only else head + body
+
+
+def error_body(message) -> bytes:
+    return json.dumps({"error": message}, ensure_ascii=False).encode("utf-8")
+
+
+class SnapshotBackend:
+    """
+    Все данные загружаются из снимка в словари при запуске, запросы
+    выполняются прямо в цикле событий
+    """
+
+    blocking = False
+
+    def __init__(self, snapshot):
+        self.synset_rows = {}
+        for synset_id, name, definition, part_of_speech, concept_id in snapshot[
+            "synsets"
+        ].select("id", "name", "definition", "part_of_speech", "concept_id"):
+            self.synset_rows[synset_id] = {
+                "id": synset_id,
+                "name": name,
+                "definition": definition,
+                "part_of_speech": part_of_speech,
+                "concept_id": concept_id,
+            }
+
+        self.sense_rows = {}
+        self.synset_senses = defaultdict(list)
+        self.lemma_senses = defaultdict(list)
+        for sense_id, synset_id, name, lemma in snapshot["senses"].select(
+            "id", "synset_id", "name", "lemma"
+        ):
+            if synset_id not in self.synset_rows:
+                continue
+            self.sense_rows[sense_id] = {
+                "id": sense_id,
+                "name": name,
+                "lemma": lemma,
+                "synset_id": synset_id,
+            }
+            self.synset_senses[synset_id].append(sense_id)
+            if lemma is not None:
+                self.lemma_senses[normalize(lemma)].append(sense_id)
+
+        self.synset_links = defaultdict(list)
+        for parent_id, child_id, name in snapshot["synset_relations"].select(
+            "parent_id", "child_id", "name"
+        ):
+            self.synset_links[parent_id].append((name, child_id))
+
+        self.sense_links = defaultdict(list)
+        for parent_id, child_id, name in snapshot["sense_relations"].select(
+            "parent_id", "child_id", "name"
+        ):
+            self.sense_links[parent_id].append((name, "out", child_id))
+            self.sense_links[child_id].append((name, "in", parent_id))
+
+        self.ili_links = defaultdict(list)
+        for row in snapshot["ili"]:
+            self.ili_links[row.concept_id].append(
+                {
+                    "link_type": row.link_type,
+                    "wn_lemma": row.wn_lemma,
+                    "wn_id": row.wn_id,
+                    "wn_gloss": row.wn_gloss,
+                    "source": row.source,
+                    "approved": row.approved,
+                }
+            )
+
+    def get_synset(self, synset_id):
+        try:
+            return self.synset_rows[synset_id]
+        except KeyError:
+            raise NotFound("Synset {} not found".format(synset_id))
+
+    def senses(self, lemma):
+        return [
+            self.sense_with_synset(sense_id)
+            for sense_id in sorted(self.lemma_senses.get(normalize(lemma), ()))
+        ]
+
+    def sense_with_synset(self, sense_id):
+        sense = self.sense_rows[sense_id]
+        synset = self.synset_rows[sense["synset_id"]]
+        return dict(
+            sense,
+            synset_name=synset["name"],
+            part_of_speech=synset["part_of_speech"],
+        )
+
+    def synset(self, synset_id):
+        synset = self.get_synset(synset_id)
+        return dict(
+            synset,
+            senses=[
+                self.sense_rows[sense_id]
+                for sense_id in sorted(self.synset_senses.get(synset_id, ()))
+            ],
+            relations=[
+                {"name": name, "synset_id": child_id}
+                for name, child_id in sorted(self.synset_links.get(synset_id, ()))
+            ],
+        )
+
+    def sense_relations(self, sense_id):
+        if sense_id not in self.sense_rows:
+            raise NotFound("Sense {} not found".format(sense_id))
+        return [
+            dict(self.sense_with_synset(other_id), relation=name, direction=direction)
+            for name, direction, other_id in sorted(self.sense_links.get(sense_id, ()))
+            if other_id in self.sense_rows
+        ]
+
+    def hypernym_paths(self, synset_id):
+        self.get_synset(synset_id)
+        paths = []
+        # Обход в глубину; путь обрывается на вершине или при цикле
+        stack = [[synset_id]]
+        while stack and len(paths) < MAX_PATHS:
+            path = stack.pop()
+            parents = sorted(
+                (
+                    child_id
+                    for name, child_id in self.synset_links.get(path[-1], ())
+                    if name in HYPERNYM_RELATIONS and child_id not in path
+                ),
+                reverse=True,
+            )
+            if not parents:
+                paths.append(path)
+            stack.extend(path + [parent] for parent in parents)
+        return [
+            [
+                {"id": node, "name": self.synset_rows[node]["name"]}
+                for node in path
+                if node in self.synset_rows
+            ]
+            for path in paths
+        ]
+
+    def ili(self, synset_id):
+        synset = self.get_synset(synset_id)
+        return sorted(
+            self.ili_links.get(synset["concept_id"], ()),
+            key=lambda link: (link["wn_id"], link["source"]),
+        )
+
+    def close(self):
+        pass
+
+
+class DatabaseBackend:
+    """
+    Запросы к PostgreSQL через пул соединений, каждый запрос выполняется
+    в отдельном потоке
+    """
+
+    blocking = True
+
+    def __init__(self, connection_string, pool_size):
+        self.pool_size = pool_size
+        self.pool = ThreadedConnectionPool(1, pool_size, connection_string)
+
+    def fetch(self, sql, params):
+        connection = self.pool.getconn()
+        try:
+            connection.autocommit = True
+            with connection.cursor(cursor_factory=extras.RealDictCursor) as cursor:
+                cursor.execute(sql, params)
+                return cursor.fetchall()
+        finally:
+            self.pool.putconn(connection)
+
+    def get_synset(self, synset_id):
+        rows = self.fetch(
+            """
+            SELECT id, name, definition, part_of_speech, concept_id
+            FROM synsets
+            WHERE id = %(synset_id)s""",
+            {"synset_id": synset_id},
+        )
+        if not rows:
+            raise NotFound("Synset {} not found".format(synset_id))
+        return rows[0]
+
+    def senses(self, lemma):
+        # В базе леммы уже нормализованы, см. normalize
+        return self.fetch(
+            """
+            SELECT se.id, se.name, se.lemma, se.synset_id,
+                   sy.name synset_name, sy.part_of_speech
+            FROM senses se
+              INNER JOIN synsets sy
+                ON sy.id = se.synset_id
+            WHERE se.lemma = %(lemma)s
+            ORDER BY se.id COLLATE "C"
+            """,
+            {"lemma": normalize(lemma)},
+        )
+
+    def synset(self, synset_id):
+        synset = self.get_synset(synset_id)
+        synset["senses"] = self.fetch(
+            """
+            SELECT id, name, lemma, synset_id
+            FROM senses
+            WHERE synset_id = %(synset_id)s
+            ORDER BY id COLLATE "C"
+            """,
+            {"synset_id": synset_id},
+        )
+        synset["relations"] = self.fetch(
+            """
+            SELECT name, child_id synset_id
+            FROM synset_relations
+            WHERE parent_id = %(synset_id)s
+            ORDER BY name COLLATE "C", child_id COLLATE "C"
+            """,
+            {"synset_id": synset_id},
+        )
+        return synset
+
+    def sense_relations(self, sense_id):
+        if not self.fetch(
+            "SELECT 1 FROM senses WHERE id = %(sense_id)s", {"sense_id": sense_id}
+        ):
+            raise NotFound("Sense {} not found".format(sense_id))
+        rows = self.fetch(
+            """
+            SELECT se.id, se.name, se.lemma, se.synset_id,
+                   sy.name synset_name, sy.part_of_speech,
+                   r.name relation, r.direction
+            FROM (
+              SELECT name, 'out' direction, child_id other_id
+              FROM sense_relations
+              WHERE parent_id = %(sense_id)s
+              UNION ALL
+              SELECT name, 'in', parent_id
+              FROM sense_relations
+              WHERE child_id = %(sense_id)s
+            ) r
+              INNER JOIN senses se
+                ON se.id = r.other_id
+              INNER JOIN synsets sy
+                ON sy.id = se.synset_id
+            ORDER BY r.name COLLATE "C", r.direction, r.other_id COLLATE "C"
+            """,
+            {"sense_id": sense_id},
+        )
+        return rows
+
+    def hypernym_paths(self, synset_id):
+        self.get_synset(synset_id)
+        rows = self.fetch(
+            """
+            WITH RECURSIVE tree (id, path) AS (
+              SELECT id, ARRAY[id]
+              FROM synsets
+              WHERE id = %(synset_id)s
+
+              UNION ALL
+
+              SELECT sr.child_id, tree.path || sr.child_id
+              FROM tree
+                INNER JOIN synset_relations sr
+                  ON sr.parent_id = tree.id
+              WHERE sr.name = ANY(%(names)s)
+                AND NOT sr.child_id = ANY(tree.path)
+            )
+            SELECT path
+            FROM tree
+            WHERE NOT EXISTS (
+              SELECT 1
+              FROM synset_relations sr
+              WHERE sr.parent_id = tree.id
+                AND sr.name = ANY(%(names)s)
+                AND NOT sr.child_id = ANY(tree.path)
+            )
+            ORDER BY path COLLATE "C"
+            LIMIT %(limit)s""",
+            {
+                "synset_id": synset_id,
+                "names": list(HYPERNYM_RELATIONS),
+                "limit": MAX_PATHS,
+            },
+        )
+        names = {}
+        for row in self.fetch(
+            "SELECT id, name FROM synsets WHERE id = ANY(%(ids)s)",
+            {"ids": list({node for row in rows for node in row["path"]})},
+        ):
+            names[row["id"]] = row["name"]
+        return [
+            [{"id": node, "name": names[node]} for node in row["path"]] for row in rows
+        ]
+
+    def ili(self, synset_id):
+        synset = self.get_synset(synset_id)
+        return self.fetch(
+            """
+            SELECT link_type, wn_lemma, wn_id, wn_gloss, source, approved
+            FROM ili
+            WHERE concept_id = %(concept_id)s
+            ORDER BY wn_id COLLATE "C", source COLLATE "C"
+            """,
+            {"concept_id": synset["concept_id"]},
+        )
+
+    def close(self):
+        self.pool.closeall()
+
+
+if __name__ == "__main__":
+    main()
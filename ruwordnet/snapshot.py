@@ -0,0 +1,503 @@
+#!/usr/bin/env python3
+"""
+Снимок базы РуТез/RuWordNet в двоичном файле, который открывается через mmap
+без разбора содержимого.
+
+Формат файла (все числа little-endian):
+
+- заголовок HEADER: сигнатура, версия формата, число таблиц, число строк
+  в таблице строк и положение её индекса и данных;
+- каталог: для каждой таблицы запись TABLE (имя, число строк, число
+  столбцов), за ней записи COLUMN (имя, тип, положение данных) её столбцов;
+- данные столбцов — массивы фиксированной ширины, выровненные по 8 байт:
+  int — int64, bool — int8, str — uint32, номер строки в общей таблице строк;
+- таблица строк: массив смещений uint64 (на одно больше числа строк)
+  и строки в utf-8 подряд.
+
+Каждая строка хранится в файле один раз. NULL хранится как INT_NULL,
+BOOL_NULL или STR_NULL. Строки таблиц идут в порядке ORDER BY из TABLES,
+на этот порядок опирается Graph.from_snapshot.
+"""
+
+import argparse
+import logging
+import mmap
+import os
+import struct
+import sys
+import time
+from array import array
+from collections import namedtuple
+
+from psycopg2 import connect
+
+from ruwordnet.graph import ITERSIZE, StringTable
+
+MAGIC = b"RWNSNAP\0"
+FORMAT_VERSION = 1
+
+HEADER = struct.Struct("<8sIIQQQ")
+TABLE = struct.Struct("<32sQI4x")
+COLUMN = struct.Struct("<32sc7xQ")
+
+ALIGNMENT = 8
+
+INT, BOOL, STR = "q", "b", "I"
+INT_NULL = -(2**63)
+BOOL_NULL = -1
+STR_NULL = 2**32 - 1
+
+COLUMN_TYPES = {"int": INT, "bool": BOOL, "str": STR}
+
+# Таблицы снимка: имя, столбцы с типами и запрос
+TABLES = (
+    (
+        "concepts",
+        (
+            ("id", "int"),
+            ("name", "str"),
+            ("gloss", "str"),
+            ("domain", "str"),
+            ("version", "str"),
+        ),
+        "SELECT id, name, gloss, domain, version FROM concepts ORDER BY id",
+    ),
+    (
+        "text_entry",
+        (
+            ("id", "int"),
+            ("name", "str"),
+            ("lemma", "str"),
+            ("main_word", "str"),
+            ("synt_type", "str"),
+            ("pos_string", "str"),
+            ("version", "str"),
+        ),
+        """
+        SELECT id, name, lemma, main_word, synt_type, pos_string, version
+        FROM text_entry
+        ORDER BY id""",
+    ),
+    (
+        "synonyms",
+        (("concept_id", "int"), ("entry_id", "int"), ("version", "str")),
+        """
+        SELECT s.concept_id, s.entry_id, s.version
+        FROM synonyms s
+          LEFT JOIN text_entry t
+            ON t.id = s.entry_id
+        ORDER BY s.concept_id, t.name, s.entry_id""",
+    ),
+    (
+        "relations",
+        (
+            ("from_id", "int"),
+            ("to_id", "int"),
+            ("name", "str"),
+            ("asp", "str"),
+            ("version", "str"),
+        ),
+        """
+        SELECT from_id, to_id, name, asp, version
+        FROM relations
+        ORDER BY name, from_id, to_id""",
+    ),
+    (
+        "synsets",
+        (
+            ("id", "str"),
+            ("name", "str"),
+            ("definition", "str"),
+            ("part_of_speech", "str"),
+            ("concept_id", "int"),
+        ),
+        """
+        SELECT id, name, definition, part_of_speech, concept_id
+        FROM synsets
+        ORDER BY id""",
+    ),
+    (
+        "senses",
+        (
+            ("id", "str"),
+            ("synset_id", "str"),
+            ("name", "str"),
+            ("lemma", "str"),
+            ("main_word", "str"),
+            ("synt_type", "str"),
+            ("poses", "str"),
+            ("meaning", "int"),
+            ("concept_id", "int"),
+            ("text_entry_id", "int"),
+        ),
+        """
+        SELECT id, synset_id, name, lemma, main_word, synt_type, poses, meaning,
+               concept_id, text_entry_id
+        FROM senses
+        ORDER BY id""",
+    ),
+    (
+        "sense_relations",
+        (("parent_id", "str"), ("child_id", "str"), ("name", "str")),
+        """
+        SELECT parent_id, child_id, name
+        FROM sense_relations
+        ORDER BY parent_id, child_id, name""",
+    ),
+    (
+        "synset_relations",
+        (("parent_id", "str"), ("child_id", "str"), ("name", "str")),
+        """
+        SELECT parent_id, child_id, name
+        FROM synset_relations
+        ORDER BY parent_id, child_id, name""",
+    ),
+    (
+        "ili",
+        (
+            ("link_type", "str"),
+            ("concept_id", "int"),
+            ("wn_lemma", "str"),
+            ("wn_id", "str"),
+            ("wn_gloss", "str"),
+            ("source", "str"),
+            ("approved", "bool"),
+        ),
+        """
+        SELECT link_type, concept_id, wn_lemma, wn_id, wn_gloss, source, approved
+        FROM ili
+        ORDER BY concept_id, wn_id, source""",
+    ),
+)
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Dump RuThes and RuWordNet tables into a binary snapshot"
+    )
+    connection_string = (
+        "host='localhost' dbname='ruwordnet' user='ruwordnet' password='ruwordnet'"
+    )
+    parser.add_argument(
+        "-c",
+        "--connection-string",
+        type=str,
+        help="Postgresql database connection string ({})".format(connection_string),
+        default=connection_string,
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        type=str,
+        help="Snapshot file (default: ruwordnet.snapshot)",
+        default="ruwordnet.snapshot",
+    )
+    parser.add_argument(
+        "--info",
+        action="store_true",
+        help="Do not dump anything, print tables of the existing snapshot",
+    )
+    ARGS = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    if ARGS.info:
+        print_info(ARGS.output)
+        return
+
+    connection = connect(ARGS.connection_string)
+    logging.info("Start")
+    write_snapshot(connection, ARGS.output)
+    logging.info("Done")
+
+
+def print_info(filename):
+    start = time.perf_counter()
+    with Snapshot(filename) as snapshot:
+        elapsed = time.perf_counter() - start
+        print(
+            "{0}: format version {1}, {2} strings, opened in {3:.2f} ms".format(
+                filename, FORMAT_VERSION, snapshot.string_count, elapsed * 1000
+            )
+        )
+        for table in snapshot.tables.values():
+            print(
+                "  {0}: {1} rows ({2})".format(
+                    table.name, len(table), ", ".join(table.columns)
+                )
+            )
+
+
+def write_snapshot(connection, filename):
+    strings = StringTable()
+    tables = []
+    for name, columns, sql in TABLES:
+        logging.info("Dumping %s...", name)
+        with connection.cursor(name="snapshot_" + name) as cursor:
+            cursor.itersize = ITERSIZE
+            cursor.execute(sql)
+            tables.append((name, columns, encode_columns(columns, cursor, strings)))
+        connection.commit()
+    write_tables(filename, tables, strings)
+    logging.info(
+        "Snapshot written to %s (%s bytes)", filename, os.path.getsize(filename)
+    )
+
+
+def write_tables(filename, tables, strings):
+    """
+    Записывает в файл формата снимка таблицы — тройки (имя, столбцы с типами,
+    массивы значений столбцов из encode_columns). Файл заменяется атомарно.
+    """
+    # Каталог имеет фиксированный размер, поэтому положение данных известно заранее
+    position = align(
+        HEADER.size
+        + sum(TABLE.size + COLUMN.size * len(columns) for _, columns, _ in tables)
+    )
+    directory = []
+    for name, columns, values in tables:
+        column_positions = []
+        for data in values:
+            column_positions.append(position)
+            position += align(len(data) * data.itemsize)
+        directory.append(column_positions)
+
+    encoded = [value.encode("utf-8") for value in strings.values]
+    string_index = array("Q", [0])
+    for value in encoded:
+        string_index.append(string_index[-1] + len(value))
+    string_index_position = position
+    string_data_position = align(position + len(string_index) * string_index.itemsize)
+
+    tmp_filename = filename + ".tmp"
+    with open(tmp_filename, "wb") as file:
+        file.write(
+            HEADER.pack(
+                MAGIC,
+                FORMAT_VERSION,
+                len(tables),
+                len(encoded),
+                string_index_position,
+                string_data_position,
+            )
+        )
+        for (name, columns, values), column_positions in zip(tables, directory):
+            file.write(TABLE.pack(name.encode(), len(values[0]), len(columns)))
+            for (column, kind), data, column_position in zip(
+                columns, values, column_positions
+            ):
+                file.write(
+                    COLUMN.pack(
+                        column.encode(), COLUMN_TYPES[kind].encode(), column_position
+                    )
+                )
+        for _, _, values in tables:
+            for data in values:
+                write_array(file, data)
+        write_array(file, string_index)
+        pad(file)
+        for value in encoded:
+            file.write(value)
+    os.replace(tmp_filename, filename)
+
+
+def encode_columns(columns, rows, strings) -> list:
+    """
+    Раскладывает строки таблицы по массивам столбцов, строковые значения
+    заменяются их номерами в таблице строк strings
+    """
+    values = [array(COLUMN_TYPES[kind]) for _, kind in columns]
+    encoders = [make_encoder(kind, strings) for _, kind in columns]
+    for row in rows:
+        for data, encode, value in zip(values, encoders, row):
+            data.append(encode(value))
+    return values
+
+
+def make_encoder(kind, strings):
+    if kind == "str":
+        return lambda value: STR_NULL if value is None else strings.code(value)
+    if kind == "bool":
+        return lambda value: BOOL_NULL if value is None else int(value)
+    return lambda value: INT_NULL if value is None else value
+
+
+def align(position) -> int:
+    return (position + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def pad(file):
+    file.write(b"\0" * (align(file.tell()) - file.tell()))
+
+
+def write_array(file, data):
+    pad(file)
+    if sys.byteorder != "little":
+        data = array(data.typecode, data)
+        data.byteswap()
+    data.tofile(file)
+
+
+class Snapshot:
+    """
+    Открытый снимок. Столбцы таблиц — представления memoryview поверх mmap,
+    значения декодируются только при обращении к ним. После close()
+    полученные из снимка столбцы использовать нельзя.
+
+        with Snapshot("ruwordnet.snapshot") as snapshot:
+            for sense_id, name in snapshot["senses"].select("id", "name"):
+                ...
+    """
+
+    def __init__(self, filename):
+        if sys.byteorder != "little":
+            raise SnapshotError("Snapshots can only be read on little-endian machines")
+        with open(filename, "rb") as file:
+            if os.fstat(file.fileno()).st_size < HEADER.size:
+                raise SnapshotError("{}: file is too short".format(filename))
+            self.mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.buffer = memoryview(self.mmap)
+        self.views = []
+        try:
+            self.read_tables(filename)
+        except struct.error:
+            self.close()
+            raise SnapshotError("{}: snapshot is truncated".format(filename))
+        except BaseException:
+            self.close()
+            raise
+
+    def read_tables(self, filename):
+        (
+            magic,
+            version,
+            table_count,
+            self.string_count,
+            string_index_position,
+            self.string_data_position,
+        ) = HEADER.unpack_from(self.mmap)
+        if magic != MAGIC:
+            raise SnapshotError("{}: not a RuWordNet snapshot".format(filename))
+        if version != FORMAT_VERSION:
+            raise SnapshotError(
+                "{}: unsupported snapshot format version {} (expected {})".format(
+                    filename, version, FORMAT_VERSION
+                )
+            )
+
+        self.string_index = self.view(string_index_position, self.string_count + 1, "Q")
+        self.string_cache = {}
+
+        self.tables = {}
+        position = HEADER.size
+        for _ in range(table_count):
+            name, row_count, column_count = TABLE.unpack_from(self.mmap, position)
+            position += TABLE.size
+            columns = {}
+            for _ in range(column_count):
+                column, kind, column_position = COLUMN.unpack_from(self.mmap, position)
+                position += COLUMN.size
+                kind = kind.decode()
+                columns[decode_name(column)] = Column(
+                    self, kind, self.view(column_position, row_count, kind)
+                )
+            table = Table(decode_name(name), row_count, columns)
+            self.tables[table.name] = table
+
+    def view(self, position, count, kind):
+        size = count * array(kind).itemsize
+        if position + size > len(self.mmap):
+            raise SnapshotError("Snapshot is truncated")
+        view = self.buffer[position : position + size].cast(kind)
+        self.views.append(view)
+        return view
+
+    def string(self, code) -> str:
+        value = self.string_cache.get(code)
+        if value is None:
+            start = self.string_data_position + self.string_index[code]
+            end = self.string_data_position + self.string_index[code + 1]
+            value = self.mmap[start:end].decode("utf-8")
+            self.string_cache[code] = value
+        return value
+
+    def __getitem__(self, name):
+        try:
+            return self.tables[name]
+        except KeyError:
+            raise SnapshotError("There is no table {} in the snapshot".format(name))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        for view in self.views:
+            view.release()
+        self.views = []
+        self.buffer.release()
+        self.mmap.close()
+
+
+class Table:
+    def __init__(self, name, row_count, columns):
+        self.name = name
+        self.row_count = row_count
+        self.columns = columns
+        self.Row = namedtuple(name + "_row", columns)
+
+    def __len__(self):
+        return self.row_count
+
+    def __iter__(self):
+        return map(self.Row._make, self.select(*self.columns))
+
+    def __getitem__(self, index):
+        return self.Row._make(column[index] for column in self.columns.values())
+
+    def column(self, name):
+        try:
+            return self.columns[name]
+        except KeyError:
+            raise SnapshotError("There is no column {} in {}".format(name, self.name))
+
+    def select(self, *names):
+        return zip(*(self.column(name) for name in names))
+
+
+class Column:
+    def __init__(self, snapshot, kind, values):
+        self.snapshot = snapshot
+        self.kind = kind
+        # Необработанные значения (номера строк для столбцов типа str)
+        self.values = values
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, index):
+        return self.decode(self.values[index])
+
+    def __iter__(self):
+        return map(self.decode, self.values)
+
+    def decode(self, value):
+        if self.kind == STR:
+            return None if value == STR_NULL else self.snapshot.string(value)
+        if self.kind == BOOL:
+            return None if value == BOOL_NULL else bool(value)
+        return None if value == INT_NULL else value
+
+
+def decode_name(name) -> str:
+    return name.rstrip(b"\0").decode()
+
+
+if __name__ == "__main__":
+    main()
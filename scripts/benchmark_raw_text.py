@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Замер скорости разбора файла текстовых входов РуТез (ruwordnet/raw_text.py).
+
+Порождает синтетические файлы в кодировке Windows-1251 из заданного числа
+строк и измеряет время разбора каждого из них: при линейном разборе время
+на строку не зависит от размера файла. С --legacy измеряется и прежний
+разбор тремя регулярными выражениями, а результаты обоих разборов
+сравниваются. --line-words задаёт длины (в словах) отдельных длинных строк,
+на которых прежний разбор растёт квадратично.
+"""
+
+import argparse
+import logging
+import os
+import random
+import re
+import tempfile
+import time
+import timeit
+
+from ruwordnet.raw_text import ENCODING, parse_text_entry
+
+LETTERS = "АБВГДЕЖЗИКЛМНОПРСТУФХЦЧШЩЭЮЯ"
+SYNT_TYPES = ("NG", "VG", "AdjG", "AdvG", "PrepG")
+POSES = ("N", "Adj", "V", "Adv", "Prep")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark parsing of RuThes text entries raw file"
+    )
+    parser.add_argument(
+        "--lines",
+        type=str,
+        help="Comma-separated sizes of synthetic files in lines (default: 1000000,2000000,4000000)",
+        default="1000000,2000000,4000000",
+    )
+    parser.add_argument(
+        "--line-words",
+        type=str,
+        help="Comma-separated lengths in words of single long lines (default: 500,1000,2000)",
+        default="500,1000,2000",
+    )
+    parser.add_argument(
+        "--legacy",
+        help="Also benchmark the former regular expressions and compare results",
+        action="store_true",
+    )
+    parser.add_argument(
+        "-d",
+        "--directory",
+        type=str,
+        help="Directory for synthetic files (default: temporary directory)",
+        default=None,
+    )
+    parser.add_argument("--seed", type=int, help="Random seed (default: 0)", default=0)
+    ARGS = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    parsers = [("raw_text", parse_text_entry)]
+    if ARGS.legacy:
+        parsers.append(("legacy", parse_legacy))
+
+    rng = random.Random(ARGS.seed)
+    with tempfile.TemporaryDirectory(dir=ARGS.directory) as directory:
+        for size in [int(value) for value in ARGS.lines.split(",")]:
+            filename = os.path.join(directory, "textentries_{}.txt".format(size))
+            write_file(filename, size, rng)
+            logging.info(
+                "%s lines, %.1f MB",
+                size,
+                os.path.getsize(filename) / 1024 / 1024,
+            )
+            results = []
+            for name, parse in parsers:
+                elapsed, entries = parse_file(filename, parse)
+                logging.info(
+                    "  %-8s %6.1fs  %6.2f us/line  %s entries",
+                    name,
+                    elapsed,
+                    elapsed / size * 1e6,
+                    sum(entry is not None for entry in entries),
+                )
+                results.append(entries)
+            if len(results) > 1 and results[0] != results[1]:
+                raise AssertionError("Parsers results differ")
+            os.remove(filename)
+
+    for words in [int(value) for value in ARGS.line_words.split(",")]:
+        line = long_line(words)
+        for name, parse in parsers:
+            elapsed = min(timeit.repeat(lambda: parse(line), repeat=5, number=1))
+            logging.info("%s words in one line: %-8s %.4fs", words, name, elapsed)
+
+
+def parse_file(filename, parse):
+    """
+    Разбирает файл построчно, возвращает время и разобранные строки
+    """
+    started = time.perf_counter()
+    entries = []
+    with open(filename, "r", encoding=ENCODING) as file:
+        for line in file:
+            entry = parse(line)
+            entries.append(None if entry is None else tuple(entry))
+    return time.perf_counter() - started, entries
+
+
+def write_file(filename, size, rng):
+    with open(filename, "w", encoding=ENCODING) as file:
+        for number in range(1, size + 1):
+            file.write(synthetic_line(number, rng))
+
+
+def synthetic_line(number, rng) -> str:
+    """
+    Строка в формате выгрузки РуТез: поля выровнены по колонкам, часть
+    строк без главного слова и pos_string, часть — без synt_type,
+    немного неразбираемых строк
+    """
+    words = [
+        "".join(rng.choice(LETTERS) for _ in range(rng.randint(2, 12)))
+        for _ in range(rng.randint(1, 4))
+    ]
+    name = " ".join(words)
+    lemma = " ".join(words)
+    kind = rng.random()
+    line = "{:<8}{:<60}{:<4}{:<60}".format(
+        number, name, rng.choice(("10", "20")), lemma
+    )
+    if kind < 0.8:
+        poses = " ".join(rng.choice(POSES) for _ in words)
+        line += "{:<8}{:<20}{}".format(rng.choice(SYNT_TYPES), words[-1], poses)
+    elif kind < 0.95:
+        line += rng.choice(SYNT_TYPES)
+    elif kind < 0.99:
+        line = line.rstrip()
+    else:
+        line = "#" + line
+    return line + "\n"
+
+
+def long_line(words) -> str:
+    """
+    Строка, в которой имя и лемма перемежаются разделителями 10, а после
+    леммы нет ни synt_type, ни главного слова
+    """
+    return "1 " + " ".join(["СЛОВО 10"] * words) + "   СЛОВО!\n"
+
+
+word_chars = '[А-Яа-я\\d\\w\\-",\\(\\)\\./]'
+pp = (
+    "(\\d+)\\s+((?:\\s{0,2}"
+    + word_chars
+    + ")+)\\s+(?:10|20)\\s+((?:\\s{0,2}"
+    + word_chars
+    + ")+)"
+)
+pattern0 = re.compile(pp)
+pp += "\\s+([A-Za-z]+)"
+pattern1 = re.compile(pp)
+pp += "\\s+([А-Яа-я\\-]+)\\s+([A-Za-z ]+)"
+pattern2 = re.compile(pp)
+
+
+def parse_legacy(line):
+    """
+    Прежний разбор raw2xml/text_entries.py и raw2sql/raw2sql.py
+    """
+    match_obj = pattern2.match(line)
+    if match_obj is not None:
+        return match_obj.groups()
+    match_obj = pattern1.match(line)
+    if match_obj is not None:
+        return match_obj.groups() + ("", "")
+    match_obj = pattern0.match(line)
+    if match_obj is not None:
+        return match_obj.groups() + ("", "", "")
+    return None
+
+
+if __name__ == "__main__":
+    main()
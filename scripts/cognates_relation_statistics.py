@@ -4,16 +4,23 @@
 # pylint: disable=C0111
 
 import argparse
+import hashlib
+import json
 import logging
 import os
+import sqlite3
 import sys
-from multiprocessing import JoinableQueue, Process, cpu_count
+import tempfile
+from collections import defaultdict
 from typing import Dict, List
 
 from psycopg2 import connect, extras
 from psycopg2.errors import UniqueViolation
 from tqdm import tqdm
 
+from ruwordnet.executor import Executor, TaskWorker
+from ruwordnet.lemma_index import LemmaIndex, ensure_index
+
 logging.basicConfig(level="INFO")
 
 PKG_ROOT = os.path.dirname(os.path.abspath(__file__))
@@ -38,6 +45,50 @@ parser.add_argument(
     help="Only show found relations, don't insert new relations in database",
     action="store_true",
 )
+parser.add_argument(
+    "--lemma-index",
+    type=str,
+    help="Lemma index file (ruwordnet/lemma_index.py), built from the database "
+    "if it does not exist or the row counts of the database tables have changed. "
+    "Without it, the index is built in a temporary file",
+)
+parser.add_argument(
+    "--rebuild-index",
+    help="Rebuild the --lemma-index file even if it is up to date",
+    action="store_true",
+)
+parser.add_argument(
+    "--cache-file",
+    type=str,
+    help="File (sqlite) with cognate decisions shared by worker processes and "
+    "kept between runs. Decisions for words whose roots or predefined cognates "
+    "have changed are dropped at start",
+)
+parser.add_argument(
+    "-b",
+    "--batch",
+    help="Search candidates for many senses per query in the main process "
+    "instead of running a query per sense in worker processes",
+    action="store_true",
+)
+parser.add_argument(
+    "--batch-size",
+    type=int,
+    help="Number of senses processed with one query in batch mode (default: 2000)",
+    default=2000,
+)
+parser.add_argument(
+    "-w",
+    "--workers",
+    type=int,
+    help="Number of worker processes (default: number of CPUs - 1)",
+)
+parser.add_argument(
+    "--chunk-size",
+    type=int,
+    help="Number of senses passed to a worker process at once (default: 50)",
+    default=50,
+)
 
 ARGS = parser.parse_args()
 
@@ -216,6 +267,13 @@ prefix_exceptions = (
     "ЗАВИСТ",
 )
 
+# Переходы для рекурсивного поиска: типы отношений, с которых начинается путь,
+# и типы, по которым можно продолжить его на один шаг
+TRANSITIONS = (
+    (["ВЫШЕ", "ЦЕЛОЕ"], ["АСЦ", "АСЦ1", "АСЦ2", "ЧАСТЬ"]),
+    (["НИЖЕ", "ЧАСТЬ"], ["АСЦ", "АСЦ1", "АСЦ2"]),
+)
+
 dictionary_roots = {}
 verified_roots = {}
 predefined_cognates = {}
@@ -347,19 +405,131 @@ def prepare_search_cognates_transitionally(cursor):
     cursor.execute("PREPARE search_cognates_transitionally AS " + sql)
 
 
-def prepare_search_sense(cursor):
-    sql = """
-        SELECT
-          se.id,
-          se.name,
-          se.synset_id
-        FROM senses se
-          INNER JOIN synsets sy
-            ON sy.id = se.synset_id
-        WHERE se.name = $1
-          AND sy.name = $2"""
+def search_cognates_batch(cursor, rows):
+    """
+    То же, что search_cognates, сразу для пачки смыслов; в результате
+    добавлен столбец sense_id
+    """
+    sql = r"""
+        WITH input (sense_id, synset_id, word, synset_name) AS (
+          SELECT *
+          FROM unnest(
+            %(sense_ids)s::text[], %(synset_ids)s::text[],
+            %(words)s::text[], %(synset_names)s::text[]
+          )
+        )
+        SELECT i.sense_id, s.name, s.rel_name, s.synset_name
+        FROM input i
+          CROSS JOIN LATERAL (
+               SELECT
+                 name,
+                 i.synset_name synset_name,
+                 'synset' rel_name
+               FROM senses se
+               WHERE id != i.sense_id
+                 AND synset_id = i.synset_id
+
+               UNION
+
+               SELECT
+                 se.name,
+                 (SELECT name FROM synsets WHERE id = se.synset_id) synset_name,
+                 sr.name
+               FROM senses se
+                 INNER JOIN synset_relations sr
+                   ON sr.child_id = se.synset_id
+               WHERE sr.parent_id = i.synset_id
+
+               UNION
 
-    cursor.execute("PREPARE search_sense AS " + sql)
+               SELECT
+                 t2.name,
+                 (SELECT name FROM concepts WHERE id = s2.concept_id) synset_name,
+                 r.name
+               FROM text_entry t1
+                 INNER JOIN synonyms s1 ON s1.entry_id = t1.id
+                 INNER JOIN concepts c ON c.id = s1.concept_id
+                 INNER JOIN relations r ON r.from_id = s1.concept_id
+                 INNER JOIN synonyms s2 ON s2.concept_id = r.to_id
+                 INNER JOIN text_entry t2 ON t2.id = s2.entry_id
+               WHERE t1.name = i.word
+                 AND c.name = i.synset_name
+             ) s
+        WHERE array_length(regexp_split_to_array(s.name, '\s+'), 1) = 1"""
+    cursor.execute(
+        sql,
+        {
+            "sense_ids": [row["id"] for row in rows],
+            "synset_ids": [row["synset_id"] for row in rows],
+            "words": [row["name"] for row in rows],
+            "synset_names": [row["synset_name"] for row in rows],
+        },
+    )
+    return cursor.fetchall()
+
+
+def search_cognates_transitionally_batch(cursor, synset_names, names, tail_names):
+    """
+    То же, что search_cognates_transitionally, сразу для нескольких имён
+    синсетов; в результате добавлен столбец root_name
+    """
+    sql = r"""
+        WITH RECURSIVE tree (root_name, id, name, id_path, name_path, relation_path) AS (
+          SELECT
+            name,
+            id,
+            name,
+            ARRAY[id] id_path,
+            ARRAY[name] name_path,
+            ARRAY[]::text[] relation_path
+          FROM concepts
+          WHERE name = ANY(%(synset_names)s)
+
+          UNION ALL
+
+          SELECT
+            tree.root_name,
+            c.id,
+            c.name,
+            array_append(tree.id_path, c.id),
+            array_append(tree.name_path, c.name),
+            array_append(tree.relation_path, r.name)
+          FROM tree
+            INNER JOIN relations r
+              ON r.from_id = tree.id
+            INNER JOIN concepts c
+              ON c.id = r.to_id
+          WHERE r.name = ANY(%(tail_names)s)
+            AND (
+              tree.relation_path[array_upper(tree.relation_path, 1)] = ANY(%(names)s)
+              OR array_upper(tree.relation_path, 1) IS NULL
+            )
+            AND array_length(tree.relation_path, 1) <= 50
+        )
+
+        SELECT
+          tree.root_name,
+          t.name,
+          tree.name synset_name,
+          tree.name_path,
+          tree.relation_path
+        FROM tree
+          INNER JOIN synonyms s
+            ON s.concept_id = tree.id
+          INNER JOIN text_entry t
+            ON t.id = s.entry_id
+        WHERE tree.name != tree.root_name
+          AND array_length(relation_path, 1) >= 1
+          AND array_length(regexp_split_to_array(t.name, '\s+'), 1) = 1"""
+    cursor.execute(
+        sql,
+        {
+            "synset_names": synset_names,
+            "names": names,
+            "tail_names": names + tail_names,
+        },
+    )
+    return cursor.fetchall()
 
 
 def make_insert_query(table, fields, cur):
@@ -383,6 +553,156 @@ def make_insert_query(table, fields, cur):
 
 cached_results = {}
 
+# Кэш решений в файле (--cache-file), в каждом процессе открывается свой
+decision_cache = None
+
+
+class DecisionCache:
+    """
+    Решения is_cognates в файле sqlite: файл открывают все процессы-обработчики,
+    и он сохраняется между запусками. Решение для пары слов зависит от
+    правил (префиксы, группы корней, исключения) и от того, что известно
+    о каждом из слов (проверенный корень, корень по словарю, заранее
+    заданные однокоренные слова). При изменении правил кэш очищается
+    полностью, при изменении сведений о слове — только решения с этим словом.
+    """
+
+    # Меняется при изменении алгоритма is_cognates
+    VERSION = 1
+    FLUSH_SIZE = 1000
+
+    def __init__(self, filename: str):
+        self.connection = sqlite3.connect(filename, timeout=600)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)"
+            )
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS words (word TEXT PRIMARY KEY, state TEXT)"
+            )
+            self.connection.execute("""
+                CREATE TABLE IF NOT EXISTS decisions (
+                  word1  TEXT,
+                  word2  TEXT,
+                  result INTEGER,
+                  PRIMARY KEY (word1, word2)
+                )""")
+        self.pending = []
+        self.hits = 0
+        self.misses = 0
+
+    def sync(self, rules: str, word_states: Dict[str, str]) -> None:
+        """
+        Удаляет устаревшие решения; выполняется один раз до запуска
+        процессов-обработчиков
+        """
+        with self.connection:
+            row = self.connection.execute(
+                "SELECT value FROM meta WHERE key = 'rules'"
+            ).fetchone()
+            if row is None or row[0] != rules:
+                logging.info("Cognate rules have changed, clearing the cache")
+                self.connection.execute("DELETE FROM decisions")
+                self.connection.execute("DELETE FROM words")
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO meta VALUES ('rules', ?)", (rules,)
+                )
+
+            stored = dict(self.connection.execute("SELECT word, state FROM words"))
+            changed = [
+                word
+                for word in set(stored) | set(word_states)
+                if stored.get(word) != word_states.get(word)
+            ]
+            self.connection.execute("CREATE TEMP TABLE changed (word TEXT PRIMARY KEY)")
+            self.connection.executemany(
+                "INSERT INTO changed VALUES (?)", ((word,) for word in changed)
+            )
+            deleted = self.connection.execute("""
+                DELETE FROM decisions
+                WHERE word1 IN (SELECT word FROM changed)
+                   OR word2 IN (SELECT word FROM changed)""").rowcount
+            self.connection.execute("DROP TABLE changed")
+            self.connection.execute("DELETE FROM words")
+            self.connection.executemany(
+                "INSERT INTO words VALUES (?, ?)", word_states.items()
+            )
+        count = self.connection.execute("SELECT count(*) FROM decisions").fetchone()[0]
+        logging.info(
+            "Cognate cache: %s decisions, %s dropped for %s changed words",
+            count,
+            deleted,
+            len(changed),
+        )
+
+    def get(self, key):
+        row = self.connection.execute(
+            "SELECT result FROM decisions WHERE word1 = ? AND word2 = ?", key
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return bool(row[0])
+
+    def put(self, key, result: bool) -> None:
+        self.pending.append((*key, int(result)))
+        if len(self.pending) >= self.FLUSH_SIZE:
+            self.flush()
+
+    def flush(self) -> None:
+        if self.pending:
+            with self.connection:
+                self.connection.executemany(
+                    "INSERT OR REPLACE INTO decisions VALUES (?, ?, ?)", self.pending
+                )
+            self.pending = []
+
+    def close(self) -> None:
+        self.flush()
+        self.connection.close()
+
+
+def get_cache_rules() -> str:
+    """
+    Отпечаток правил, от которых зависят все решения is_cognates
+    """
+    rules = json.dumps(
+        [DecisionCache.VERSION, prefixes, roots_groups, prefix_exceptions],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(rules.encode("utf-8")).hexdigest()
+
+
+def get_word_states() -> Dict[str, str]:
+    """
+    Сведения о словах из словарей корней и заранее заданных однокоренных слов
+    """
+    words = set(verified_roots) | set(dictionary_roots) | set(predefined_cognates)
+    return {
+        word: json.dumps(
+            [
+                verified_roots.get(word),
+                dictionary_roots.get(word),
+                sorted(predefined_cognates.get(word, ())),
+            ],
+            ensure_ascii=False,
+        )
+        for word in words
+    }
+
+
+def log_cache_stats(cache: DecisionCache, name: str) -> None:
+    # Логгеры обработчиков требуют полей word и seq, поэтому пишем в корневой
+    logging.info(
+        "%s: cognate cache: %s decisions found, %s computed",
+        name,
+        cache.hits,
+        cache.misses,
+    )
+
 
 def cache_result(func):
     def get_key_and_needle(word1, word2):
@@ -396,7 +716,13 @@ def cache_result(func):
                 return cached_results[key][needle]
         else:
             cached_results[key] = {}
-        result = func(word1, word2)
+        result = None
+        if decision_cache is not None:
+            result = decision_cache.get((key, needle))
+        if result is None:
+            result = func(word1, word2)
+            if decision_cache is not None:
+                decision_cache.put((key, needle), result)
         cached_results[key][needle] = result
         # logging.debug('added to cache')
         return result
@@ -428,70 +754,134 @@ def is_cognates(word1, word2):
     ):
         logging.debug("from dictionary: %s %s", word1, word2)
         return True
-    words1 = remove_prefixes(word1)
-    words2 = remove_prefixes(word2)
-    for sub1 in words1:
-        for sub2 in words2:
-            if check_substrings(sub1, sub2):
-                logging.debug("are cognates: %s %s", word1, word2)
-                return True
-    logging.debug("aren't cognates: %s %s", word1, word2)
-    return False
-
-
-def check_substrings(word1, word2):
-    match_len = min(len(word1), len(word2), 3)
-    logging.debug("words after processing: %s %s", word1[:match_len], word2[:match_len])
-    if word1[:match_len] == word2[:match_len]:
-        logging.debug("beginnings are equal")
+    if matcher.match(word1, word2):
+        logging.debug("are cognates: %s %s", word1, word2)
         return True
-    for root in get_roots_group(word1):
-        if word2.find(root) == 0:
-            logging.debug("root is found %s", root)
-            return True
+    logging.debug("aren't cognates: %s %s", word1, word2)
     return False
 
 
-def get_roots_group(word):
-    for group in roots_groups:
-        for root in group:
-            if word.find(root) == 0:
-                return group
-    return []
+def is_cognates_many(word: str, candidates: List[str]) -> List[bool]:
+    """
+    Решения is_cognates для слова word и каждого из кандидатов. Разбор
+    слова word делается один раз, повторяющиеся кандидаты проверяются
+    один раз.
+    """
+    matcher.profile(word)
+    decisions = {}
+    for candidate in candidates:
+        if candidate not in decisions:
+            decisions[candidate] = is_cognates(word, candidate)
+    return [decisions[candidate] for candidate in candidates]
+
+
+class CognateMatcher:
+    """
+    Сравнение слов по началу основы. Приставки, исключения и корни из групп
+    чередующихся корней собраны в таблицы по длине: проверка того, с чего
+    начинается слово, — это один поиск в множестве на каждую длину вместо
+    прохода по всем спискам. Разбор слова (основы без приставок и группа
+    корней каждой из них) запоминается.
+    """
+
+    VOWELS = frozenset("АОИЕЁЭЫУЮЯ")
+
+    def __init__(self, prefixes, prefix_exceptions, roots_groups):
+        self.prefixes = self.by_length(prefixes)
+        self.exceptions = self.by_length(prefix_exceptions)
+        self.roots_groups = tuple(tuple(group) for group in roots_groups)
+        # Корень -> номер первой группы, в которой он встречается
+        roots = {}
+        for number, group in enumerate(self.roots_groups):
+            for root in group:
+                roots.setdefault(root, number)
+        self.roots = [
+            (length, {root: roots[root] for root in table})
+            for length, table in self.by_length(roots)
+        ]
+        self.profiles = {}
+
+    @staticmethod
+    def by_length(words):
+        """
+        Пары (длина, множество слов этой длины) по убыванию длины
+        """
+        tables = defaultdict(set)
+        for word in words:
+            tables[len(word)].add(word)
+        return [(length, frozenset(tables[length])) for length in sorted(tables)[::-1]]
+
+    def remove_prefixes(self, word) -> List[str]:
+        for length, exceptions in self.exceptions:
+            if word[:length] in exceptions:
+                return [word]
+        # После отделения приставки должно остаться не меньше трёх букв
+        # и хотя бы одна гласная: гласные ищутся один раз для всего слова
+        last_vowel = -1
+        for position, letter in enumerate(word):
+            if letter in self.VOWELS:
+                last_vowel = position
+        forms = []
+        for length, prefixes in self.prefixes:
+            if (
+                word[:length] in prefixes
+                and len(word) - length >= 3
+                and last_vowel >= length
+            ):
+                forms.append(word[length:])
+        return forms if forms else [word]
+
+    def get_roots_group(self, word) -> tuple:
+        number = None
+        for length, roots in self.roots:
+            found = roots.get(word[:length])
+            if found is not None and (number is None or found < number):
+                number = found
+        return () if number is None else self.roots_groups[number]
+
+    def profile(self, word) -> tuple:
+        """
+        Основы слова без приставок с группами корней, с которых они начинаются
+        """
+        profile = self.profiles.get(word)
+        if profile is None:
+            profile = tuple(
+                (form, self.get_roots_group(form))
+                for form in self.remove_prefixes(word)
+            )
+            self.profiles[word] = profile
+        return profile
+
+    def match(self, word1, word2) -> bool:
+        profile2 = self.profile(word2)
+        for form1, group1 in self.profile(word1):
+            for form2, _ in profile2:
+                match_len = min(len(form1), len(form2), 3)
+                if form1[:match_len] == form2[:match_len]:
+                    return True
+                # Вторая основа начинается с корня из той же группы
+                if group1 and form2.startswith(group1):
+                    return True
+        return False
 
 
-def remove_prefixes(word):
-    for exception in prefix_exceptions:
-        if word.find(exception) == 0:
-            return [word]
-    forms = []
-    for prefix in prefixes:
-        if word.startswith(prefix):
-            trimmed = word.replace(prefix, "", 1)
-            if len(trimmed) >= 3 and set(trimmed) & set("АОИЕЁЭЫУЮЯ"):
-                forms.append(trimmed)
-    return forms if forms else [word]
+matcher = CognateMatcher(prefixes, prefix_exceptions, roots_groups)
 
 
 def main():
+    global decision_cache
     conn = connect(ARGS.connection_string)
     conn.autocommit = True
 
-    with conn.cursor(cursor_factory=extras.RealDictCursor) as cur:
-        logging.debug("prepare workers")
-        workers_count = cpu_count() - 1
-        queue = JoinableQueue(workers_count * 10)
-        for i in range(workers_count):
-            wlogger = logging.getLogger(f"w-{i}")
-            handler = logging.StreamHandler()
-            handler.setFormatter(
-                logging.Formatter('"%(word)-31s %(name)-4s %(seq)-3s %(message)s"')
-            )
-            wlogger.addHandler(handler)
-            worker = Worker()
-            worker.set(queue, ARGS.connection_string, wlogger, ARGS.test)
-            worker.daemon = True
-            worker.start()
+    with tempfile.TemporaryDirectory() as tmp_dir, conn.cursor(
+        cursor_factory=extras.RealDictCursor
+    ) as cur:
+        # Смыслы для новых отношений ищутся по индексу лемм, каждый процесс
+        # открывает его файл через mmap
+        index_file = None
+        if not ARGS.test:
+            index_file = ARGS.lemma_index or os.path.join(tmp_dir, "lemma_index")
+            ensure_index(conn, index_file, ARGS.rebuild_index)
 
         logging.debug("retrieve list of verified roots")
         sql = r"""
@@ -523,6 +913,12 @@ def main():
             len(set(dictionary_roots.values())),
         )
 
+        if ARGS.cache_file:
+            logging.debug("synchronize decision cache")
+            cache = DecisionCache(ARGS.cache_file)
+            cache.sync(get_cache_rules(), get_word_states())
+            cache.close()
+
         logging.debug("search non collocations")
         sql = r"""
           SELECT
@@ -537,32 +933,171 @@ def main():
         cur.execute(sql)
         rows = cur.fetchall()
 
-        if logging.root.level > logging.DEBUG:
-            rows = tqdm(rows, file=sys.stdout)
+        if ARGS.batch:
+            if ARGS.cache_file:
+                decision_cache = DecisionCache(ARGS.cache_file)
+            process_batches(cur, rows, index_file, ARGS.batch_size, ARGS.test)
+            if decision_cache is not None:
+                log_cache_stats(decision_cache, "main")
+                decision_cache.close()
+        else:
+            # Обработчики запускаются после загрузки словарей корней: они
+            # получают их копию при создании процесса
+            logging.debug("start workers")
+            with Executor(
+                lambda number: Worker(
+                    ARGS.connection_string,
+                    index_file,
+                    make_logger(f"w-{number}"),
+                    ARGS.test,
+                    ARGS.cache_file,
+                ),
+                workers_count=ARGS.workers,
+                chunk_size=ARGS.chunk_size,
+                show_progress=logging.root.level > logging.DEBUG,
+            ) as executor:
+                executor.run(rows)
 
-        logging.debug("start looping")
-        for row in rows:
-            queue.put(row)
+    logging.debug("Done")
 
-        queue.join()
 
-    logging.debug("Done")
+def make_logger(name: str) -> logging.Logger:
+    logger = logging.getLogger(name)
+    handler = logging.StreamHandler()
+    handler.setFormatter(
+        logging.Formatter('"%(word)-31s %(name)-4s %(seq)-3s %(message)s"')
+    )
+    logger.addHandler(handler)
+    return logger
+
+
+def process_batches(cur, rows, index_file, batch_size, is_test=False) -> None:
+    """
+    Пакетный режим: кандидаты ищутся сразу для batch_size смыслов (одним
+    запросом search_cognates_batch и по одному запросу на каждый переход из
+    TRANSITIONS), однокоренные слова отбираются в памяти, а найденные
+    отношения записываются одним многострочным INSERT на пачку
+    """
+    logger = make_logger("b")
+    index = None if is_test else LemmaIndex(index_file)
+    progress = None
+    if logging.root.level > logging.DEBUG:
+        progress = tqdm(total=len(rows), file=sys.stdout)
+
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start : start + batch_size]
+
+        cognates = defaultdict(list)
+        for cognate in search_cognates_batch(cur, batch):
+            cognates[cognate["sense_id"]].append(cognate)
+
+        synset_names = sorted({row["synset_name"] for row in batch})
+        chains = defaultdict(list)
+        for names, tail_names in TRANSITIONS:
+            for senses_chain in search_cognates_transitionally_batch(
+                cur, synset_names, names, tail_names
+            ):
+                chains[senses_chain["root_name"]].append(senses_chain)
+
+        relations = set()
+        for row in batch:
+            lexemes = collect_lexemes(
+                row, cognates[row["id"]], chains[row["synset_name"]], logger
+            )
+            if is_test:
+                continue
+            for lexeme in lexemes:
+                row_lexeme = search_sense(index, *lexeme)
+                if row_lexeme:
+                    relations.add((row["id"], row_lexeme.id, "derived_from"))
+
+        if relations:
+            extras.execute_values(
+                cur,
+                """
+                INSERT INTO sense_relations (parent_id, child_id, name)
+                VALUES %s
+                ON CONFLICT DO NOTHING""",
+                sorted(relations),
+                page_size=len(relations),
+            )
+        if progress is not None:
+            progress.update(len(batch))
+
+    if progress is not None:
+        progress.close()
+    if index is not None:
+        index.close()
+
+
+def collect_lexemes(row, cognates, chains, logger: logging.Logger) -> set:
+    """
+    Отбирает среди кандидатов (строк search_cognates и
+    search_cognates_transitionally) слова, однокоренные слову смысла row,
+    и возвращает их пары (имя, имя синсета)
+    """
+
+    def e(word):
+        e.counter += 1
+        return {"word": word, "seq": e.counter}
+
+    e.counter = 0
+    logger.info("%s (%s)", row["name"], row["synset_name"], extra=e(row["name"]))
+
+    names = [item["name"] for item in [*cognates, *chains]]
+    decisions = dict(zip(names, is_cognates_many(row["name"], names)))
+
+    lexemes = set()
+    for cognate in cognates:
+        if decisions[cognate["name"]]:
+            logger.info(
+                "    " + cognate["name"] + ": " + cognate["rel_name"],
+                extra=e(row["name"]),
+            )
+            lexemes.add((cognate["name"], cognate["synset_name"]))
+
+    for senses_chain in chains:
+        if decisions[senses_chain["name"]]:
+            chain = build_chain(
+                senses_chain["name_path"], senses_chain["relation_path"]
+            )
+            logger.info(
+                "    " + senses_chain["name"] + ":" + chain, extra=e(row["name"])
+            )
+            lexemes.add((senses_chain["name"], senses_chain["synset_name"]))
+    return lexemes
 
 
-class Worker(Process):
-    def set(
+def search_sense(index: LemmaIndex, name: str, synset_name: str):
+    for sense in index.senses(name, "sense_name"):
+        if sense.synset_name == synset_name:
+            return sense
+    return None
+
+
+class Worker(TaskWorker):
+    def __init__(
         self,
-        queue: JoinableQueue,
         connection_string: str,
+        index_file: str,
         logger: logging.Logger,
         is_test=False,
+        cache_file: str = None,
     ) -> None:
-        self.queue = queue
+        super().__init__(name=logger.name)
         self.connection_string = connection_string
+        self.index_file = index_file
         self.logger = logger
         self.is_test = is_test
+        self.cache_file = cache_file
+
+    def setup(self) -> None:
+        global decision_cache
+        if self.cache_file:
+            # Соединение sqlite нельзя передавать через fork, поэтому
+            # каждый обработчик открывает файл кэша сам
+            decision_cache = DecisionCache(self.cache_file)
 
-    def conn_up(self) -> None:
         self.conn = connect(self.connection_string)
         self.conn.autocommit = True
         self.cursor = self.conn.cursor(cursor_factory=extras.RealDictCursor)
@@ -573,40 +1108,22 @@ class Worker(Process):
         prepare_search_cognates_transitionally(self.cursor)
 
         if not self.is_test:
-            self.logger.debug("prepare_search_sense")
-            prepare_search_sense(self.cursor)
+            self.index = LemmaIndex(self.index_file)
             self.insert_relation_sql = make_insert_query(
                 "sense_relations", ("parent_id", "child_id", "name"), self.cursor
             )
 
-    def conn_down(self) -> None:
+    def teardown(self) -> None:
+        if decision_cache is not None:
+            log_cache_stats(decision_cache, self.logger.name)
+            decision_cache.close()
+        if not self.is_test:
+            self.index.close()
         self.cursor.close()
         self.conn.close()
 
-    def run(self) -> None:
-        self.conn_up()
-        while True:
-            task = self.queue.get()
-            if task is None:
-                self.conn_down()
-                break
-            self.process(task)
-            self.queue.task_done()
-
     def process(self, row: Dict[str, str]) -> None:
-        def e(word):
-            e.counter += 1
-            return {"word": word, "seq": e.counter}
-
-        e.counter = 0
-        test = self.is_test
         cur2 = self.cursor
-        self.logger.info(
-            "%s (%s)", row["name"], row["synset_name"], extra=e(row["name"])
-        )
-
-        if not test:
-            lexemes = []
 
         params = {
             "sense_id": row["id"],
@@ -618,23 +1135,10 @@ class Worker(Process):
             "EXECUTE search_cognates(%(sense_id)s, %(synset_id)s, %(word)s, %(synset_name)s)",
             params,
         )
-        for cognate in cur2:
-            if is_cognates(row["name"], cognate["name"]):
-                self.logger.info(
-                    "    " + cognate["name"] + ": " + cognate["rel_name"],
-                    extra=e(row["name"]),
-                )
-                if not test:
-                    lexemes.append((cognate["name"], cognate["synset_name"]))
-
-        for i in range(2):
-            if i == 0:
-                names = ["ВЫШЕ", "ЦЕЛОЕ"]
-                tail_names = ["АСЦ", "АСЦ1", "АСЦ2", "ЧАСТЬ"]
-            else:
-                names = ["НИЖЕ", "ЧАСТЬ"]
-                tail_names = ["АСЦ", "АСЦ1", "АСЦ2"]
+        cognates = cur2.fetchall()
 
+        chains = []
+        for names, tail_names in TRANSITIONS:
             params = {
                 "names": names,
                 "tail_names": names + tail_names,
@@ -645,33 +1149,19 @@ class Worker(Process):
                     %(synset_name)s, %(names)s, %(tail_names)s)""",
                 params,
             )
-            for senses_chain in cur2:
-                if is_cognates(row["name"], senses_chain["name"]):
-                    chain = build_chain(
-                        senses_chain["name_path"], senses_chain["relation_path"]
-                    )
-                    self.logger.info(
-                        "    " + senses_chain["name"] + ":" + chain,
-                        extra=e(row["name"]),
-                    )
-                    if not test:
-                        lexemes.append(
-                            (senses_chain["name"], senses_chain["synset_name"])
-                        )
+            chains.extend(cur2.fetchall())
 
-        if not test and lexemes:
+        lexemes = collect_lexemes(row, cognates, chains, self.logger)
+
+        if not self.is_test and lexemes:
             params = {"parent_id": row["id"], "name": "derived_from"}
-            for lexeme in set(lexemes):
-                cur2.execute(
-                    "EXECUTE search_sense(%(name)s, %(synset_name)s)",
-                    {"name": lexeme[0], "synset_name": lexeme[1]},
-                )
-                row_lexeme = cur2.fetchone()
+            for lexeme in lexemes:
+                row_lexeme = search_sense(self.index, *lexeme)
                 if row_lexeme:
                     try:
                         cur2.execute(
                             self.insert_relation_sql,
-                            {"child_id": row_lexeme["id"], **params},
+                            {"child_id": row_lexeme.id, **params},
                         )
                     except UniqueViolation:
                         # Если такое отношение уже есть, не останавливаем выполнение
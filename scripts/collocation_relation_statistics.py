@@ -1,13 +1,18 @@
 #!/usr/bin/env python3
 
 import argparse
+import os
 import sys
+import tempfile
 from collections import defaultdict
-from typing import List, Optional, Tuple
+from typing import Dict, List, Optional, Tuple
 
 from psycopg2 import IntegrityError, connect, extras
 from tqdm import tqdm
 
+from ruwordnet.executor import Executor, TaskWorker
+from ruwordnet.lemma_index import LemmaIndex, ensure_index
+
 parser = argparse.ArgumentParser(
     description="Extract collocation composition information from RuThes and RuWordNet."
 )
@@ -32,6 +37,33 @@ parser.add_argument(
     help="Print collocations without matched components to stdout",
     action="store_true",
 )
+parser.add_argument(
+    "--lemma-index",
+    type=str,
+    help="Lemma index file (ruwordnet/lemma_index.py), built from the database "
+    "if it does not exist or the row counts of the database tables have changed. "
+    "Without it, the index is built in a temporary file",
+)
+parser.add_argument(
+    "--rebuild-index",
+    help="Rebuild the --lemma-index file even if it is up to date",
+    action="store_true",
+)
+parser.add_argument(
+    "-w",
+    "--workers",
+    type=int,
+    help="Number of worker processes; with 1 (default) collocations are processed "
+    "in the main process",
+    default=1,
+)
+parser.add_argument(
+    "--chunk-size",
+    type=int,
+    help="Number of collocations whose words are searched with one query "
+    "(default: 200)",
+    default=200,
+)
 
 ARGS = parser.parse_args()
 
@@ -187,51 +219,6 @@ conn = connect(ARGS.connection_string)
 conn.autocommit = True
 
 
-def prepare_search_sense_query(cursor):
-    sql = """
-        SELECT
-          se.id,
-          se.name,
-          se.synset_id
-        FROM senses se
-          INNER JOIN synsets sy
-            ON sy.id = se.synset_id
-        WHERE se.lemma = $1
-          AND sy.name = $2"""
-
-    cursor.execute("PREPARE search_sense AS " + sql)
-
-
-def prepare_rwn_word_relation_query(cursor):
-    sql = """
-      -- 1: synset_id (of the current collocation)
-      -- 2: word (particular word in the collocation)
-      -- Searching for collocations in rwn relations neighborhood
-
-      -- Search for a sense with the same lemma as input word
-      -- through a one step down relation
-      SELECT
-        sr.name,
-        (SELECT name FROM synsets WHERE id = se.synset_id) synset_name
-      FROM senses se
-        INNER JOIN synset_relations sr
-          ON sr.child_id = se.synset_id
-      WHERE sr.parent_id = $1
-        AND se.lemma = $2
-
-      UNION ALL
-
-      -- Search in the same synset
-      SELECT
-        'synset',
-        (SELECT name FROM synsets WHERE id = synset_id) synset_name
-      FROM senses
-      WHERE lemma = $2
-        AND synset_id = $1
-      LIMIT 1"""
-    cursor.execute("PREPARE select_rwn_word_relation AS " + sql)
-
-
 def prepare_rwn_relation_query(cursor):
     sql = r"""
         SELECT
@@ -264,31 +251,6 @@ def prepare_rwn_relation_query(cursor):
     cursor.execute("PREPARE select_rwn_relation AS " + sql)
 
 
-def prepare_ruthes_relation_query(cursor):
-    sql = """
-      -- 1: word (particular word in the current collocation)
-      -- 2: synset_name (synset_name of the collocation)
-      -- Search for a source word in RuThes relations neighborhood one step down
-
-      SELECT
-        r.name,
-        r.asp,
-        c.name as synset_name
-      FROM text_entry t
-        INNER JOIN synonyms s
-          ON s.entry_id = t.id
-        INNER JOIN concepts c
-          ON c.id = s.concept_id
-        INNER JOIN relations r
-          ON r.to_id = s.concept_id
-        INNER JOIN concepts c2
-          ON c2.id = r.from_id
-      WHERE t.lemma = $1
-        AND c2.name = $2
-      LIMIT 1"""
-    cursor.execute("PREPARE select_ruthes_relation AS " + sql)
-
-
 def prepare_transitional_relation_query(cursor):
     sql = """
       -- 1: word (particular word in the current collocation)
@@ -420,14 +382,6 @@ def prepare_bitransitional_relation_query(cursor):
     cursor.execute("PREPARE select_bitransited_relation AS " + sql)
 
 
-def prepare_sense_existence_check_query(cursor):
-    sql = """
-      SELECT
-        (SELECT count(1) FROM senses WHERE lemma = $1) sense,
-        (SELECT count(1) FROM text_entry WHERE lemma = $1) entry"""
-    cursor.execute("PREPARE check_sense_existence AS " + sql)
-
-
 def make_insert_query(table, fields, cur):
     fields_str = ", ".join(str(v) for v in fields)
     dollars = ", ".join("$" + str(i + 1) for i in range(len(fields)))
@@ -448,32 +402,16 @@ def make_insert_query(table, fields, cur):
 
 
 def main():
-    test = ARGS.test
-    without_matches = ARGS.without_matches
-
-    with conn.cursor(cursor_factory=extras.RealDictCursor) as cur, conn.cursor(
+    # Поиск смыслов и текстовых входов по лемме выполняется по индексу,
+    # каждый процесс открывает его файл через mmap
+    with tempfile.TemporaryDirectory() as tmp_dir, conn.cursor(
         cursor_factory=extras.RealDictCursor
-    ) as cur2:
-
-        print("prepare_rwn_word_relation_query", flush=True)
-        prepare_rwn_word_relation_query(cur2)
-        print("prepare_rwn_relation_query", flush=True)
-        prepare_rwn_relation_query(cur2)
-        print("prepare_ruthes_relation_query", flush=True)
-        prepare_ruthes_relation_query(cur2)
-        print("prepare_transitional_relation_query", flush=True)
-        prepare_transitional_relation_query(cur2)
-        print("prepare_bitransitional_relation_query", flush=True)
-        prepare_bitransitional_relation_query(cur2)
-        print("prepare_sense_existence_check_query", flush=True)
-        prepare_sense_existence_check_query(cur2)
-
-        if not test:
-            print("prepare_search_sense_query", flush=True)
-            prepare_search_sense_query(cur2)
-            insert_relation_sql = make_insert_query(
-                "sense_relations", ("parent_id", "child_id", "name"), cur
-            )
+    ) as cur:
+        index_file = ARGS.lemma_index or os.path.join(tmp_dir, "lemma_index")
+        if ensure_index(conn, index_file, ARGS.rebuild_index):
+            print("lemma index built", flush=True)
+        else:
+            print("reuse lemma index {}".format(index_file), flush=True)
 
         print("search collocations", flush=True)
         sql = r"""
@@ -492,15 +430,6 @@ def main():
         # Fetch all right away to have total count of rows for tqdm progressbar
         rows = cur.fetchall()
 
-        counters = {
-            "collocations": 0,
-            "collocationsNoRelations": 0,
-            "collocationsAllRelations": 0,
-            "noRelation": 0,
-            "wordPresented": 0,
-            "relations": defaultdict(int),
-        }
-
         # Approximate algorithm:
         # 1. Find multiword sense
         # 2. For each word not in the blacklist search one source word:
@@ -508,192 +437,389 @@ def main():
         #    2. in RWN relations (one step up + in the same synset)
         #    3. in RuThes relations
         #    4. in RuThes relations transitionally
+        # Steps 2.2 and 2.3 are done with one query for a chunk of collocations
 
         print("start looping")
-        for row in tqdm(rows, file=sys.stdout):
-            print(flush=True, file=sys.stderr)
-            print("{} ({}):".format(row["name"], row["synset_name"]), file=sys.stderr)
-            counters["collocations"] += 1
-
-            words_with_relations = 0
-            checked_words = 0
-
-            words = row["lemma"].split()
-            detailed_words = []
-            word_results = []
-            for word in words:
-                if word in blacklist:
-                    continue
-                checked_words += 1
-                synset_name = None
-                relation_name = None
-                result = "нет"
-
-                cur2.execute("EXECUTE check_sense_existence(%(word)s)", {"word": word})
-                res = cur2.fetchone()
-                sense_count = int(res["sense"])
-                entries_count = int(res["entry"])
-
-                if sense_count or entries_count:
-                    synset_name, relation_name, result = search_everywhere(
-                        cur2, word, row["synset_id"], row["synset_name"], row["lemma"]
-                    )
-
-                    if synset_name is None:
-                        result = "нет"
-                        counters["noRelation"] += 1
-                        counters["wordPresented"] += 1
-                        existence_strings = []
-                        if sense_count:
-                            existence_strings.append("есть в РуТез")
-                        if entries_count:
-                            existence_strings.append("есть в RWN")
-                        result += " (" + (", ".join(existence_strings)) + ")"
-                    else:
-                        detailed_words.append((word, synset_name))
-                        counters["relations"][relation_name] += 1
-                        words_with_relations += 1
-
-                print(f"{word} — {result}", file=sys.stderr)
-                word_results.append(f"{word} — {result}")
-
-            if words_with_relations > 0:
-                counters["collocationsAllRelations"] += 1
-                if not test:
-                    params = {"parent_id": row["id"], "name": "composed_of"}
-                    for word, synset_name in detailed_words:
-                        cur2.execute(
-                            "EXECUTE search_sense(%(word)s, %(synset_name)s)",
-                            {"word": word, "synset_name": synset_name},
-                        )
-                        row_lexeme = cur2.fetchone()
-                        if row_lexeme:
-                            try:
-                                cur2.execute(
-                                    insert_relation_sql,
-                                    {"child_id": row_lexeme["id"], **params},
-                                )
-                            except IntegrityError:
-                                # Бывают словосочетания, образованные из одного слова (МАТЬ → МАТЬ МАТЕРИ)
-                                pass
-                        else:
-                            print(
-                                f"Лексема не найдена: {word} ({synset_name})",
-                                file=sys.stderr,
-                            )
-                        #     return
-
-            elif without_matches:
-                counters["collocationsNoRelations"] += 1
-                print(flush=True)
-                print("{} ({}):".format(row["name"], row["synset_name"]))
-                print("\n".join(word_results))
-
-                if test:
-                    params = {"synset_id": row["synset_id"]}
-                    cur2.execute("EXECUTE select_rwn_relation(%(synset_id)s)", params)
-                    for rel_row in cur2:
-                        print(
-                            " -- "
-                            + rel_row["rel_name"]
-                            + ": "
-                            + ", ".join(rel_row["senses"])
+        failures = []
+        if ARGS.workers > 1:
+            with Executor(
+                lambda number: Worker(ARGS.connection_string, index_file),
+                workers_count=ARGS.workers,
+                chunk_size=ARGS.chunk_size,
+            ) as executor:
+                stats = executor.run(rows)
+            counters = new_counters()
+            for worker_counters in executor.results.values():
+                merge_counters(counters, worker_counters)
+            # Пачка с ошибкой отбрасывается целиком, а счётчики аварийно
+            # завершившегося обработчика теряются: отчёт был бы неполным
+            errors = sum(worker_errors for _, worker_errors, _ in stats.values())
+            if errors:
+                failures.append("{} collocations failed".format(errors))
+            for worker in executor.workers:
+                if worker.name not in stats:
+                    failures.append(
+                        "{} exited with code {} without results".format(
+                            worker.name, worker.exitcode
                         )
-
-        print(flush=True)
-        print("Словосочетаний: " + str(counters["collocations"]))
-        print("    — со всеми связями: " + str(counters["collocationsAllRelations"]))
-        print("    — без связей: " + str(counters["collocationsNoRelations"]))
-        print()
+                    )
+        else:
+            with LemmaIndex(index_file) as index:
+                analyzer = CollocationAnalyzer(cur, index)
+                progress = tqdm(total=len(rows), file=sys.stdout)
+                for start in range(0, len(rows), ARGS.chunk_size):
+                    chunk = rows[start : start + ARGS.chunk_size]
+                    analyzer.process(chunk)
+                    progress.update(len(chunk))
+                progress.close()
+                counters = analyzer.counters
+
+        print_counters(counters)
+
+    if failures:
+        for failure in failures:
+            print(failure, file=sys.stderr)
         print(
-            "Слов без отношений: "
-            + str(counters["noRelation"])
-            + " ("
-            + str(counters["wordPresented"])
-            + " слов представлены в тезаурусе)"
+            "Counters and sense_relations are incomplete, see errors above",
+            file=sys.stderr,
         )
-        print("Количество связей:")
-        for relation, count in counters["relations"].items():
-            print(relation + " — " + str(count))
-
+        sys.exit(1)
     print("Done", flush=True)
 
 
-def search_everywhere(
-    cur: extras.DictCursorBase,
-    word: str,
-    c_synset_id: str,
-    c_synset_name: str,
-    c_lemma: str,
-) -> Tuple[Optional[str], Optional[str], Optional[str]]:
-    synset_name, relation_name = search_in_rwn(cur, word, c_synset_id)
-    if synset_name is not None:
-        return synset_name, relation_name, relation_name
+def new_counters() -> dict:
+    return {
+        "collocations": 0,
+        "collocationsNoRelations": 0,
+        "collocationsAllRelations": 0,
+        "noRelation": 0,
+        "wordPresented": 0,
+        "relations": defaultdict(int),
+    }
 
-    synset_name, relation_name = search_in_ruthes(cur, word, c_lemma, c_synset_name)
-    if synset_name is not None:
-        return synset_name, relation_name, relation_name
 
-    synset_name, relation_name, extra = search_in_ruthes_transitionally(
-        cur, word, c_synset_name
-    )
-    if synset_name is not None:
-        return synset_name, relation_name, extra
+def merge_counters(counters: dict, other: dict) -> None:
+    for key, value in other.items():
+        if isinstance(value, dict):
+            for relation, count in value.items():
+                counters[key][relation] += count
+        else:
+            counters[key] += value
 
-    # synset_name, relation_name, extra = search_in_ruthes_bitransitionally(cur, word, c_synset_name)
-    # if synset_name is not None:
-    # return synset_name, relation_name, extra
 
-    return None, None, None
+def print_counters(counters: dict) -> None:
+    print(flush=True)
+    print("Словосочетаний: " + str(counters["collocations"]))
+    print("    — со всеми связями: " + str(counters["collocationsAllRelations"]))
+    print("    — без связей: " + str(counters["collocationsNoRelations"]))
+    print()
+    print(
+        "Слов без отношений: "
+        + str(counters["noRelation"])
+        + " ("
+        + str(counters["wordPresented"])
+        + " слов представлены в тезаурусе)"
+    )
+    print("Количество связей:")
+    for relation, count in counters["relations"].items():
+        print(relation + " — " + str(count))
+
+
+class CollocationAnalyzer:
+    """
+    Поиск исходных слов для словосочетаний и запись отношений composed_of.
+    Словосочетания обрабатываются пачками: отношения слов в RWN и в РуТез
+    ищутся одним запросом на пачку, рекурсивный поиск — по слову.
+    Вывод по словосочетанию печатается одним блоком.
+    """
+
+    def __init__(self, cursor: extras.DictCursorBase, index: LemmaIndex):
+        self.cursor = cursor
+        self.index = index
+        self.test = ARGS.test
+        self.without_matches = ARGS.without_matches
+        self.counters = new_counters()
+
+        prepare_transitional_relation_query(cursor)
+        prepare_bitransitional_relation_query(cursor)
+        if self.without_matches and self.test:
+            prepare_rwn_relation_query(cursor)
+        if not self.test:
+            self.insert_relation_sql = make_insert_query(
+                "sense_relations", ("parent_id", "child_id", "name"), cursor
+            )
 
+    def process(self, rows: List[Dict[str, str]]) -> None:
+        results = self.search(rows)
+        for row in rows:
+            self.process_row(row, results)
 
-def search_in_rwn(
-    cur: extras.DictCursorBase, word: str, synset_id: str
-) -> Tuple[Optional[str], Optional[str]]:
-    params = {"word": word}
-    cur.execute(
+    def search(self, rows: List[Dict[str, str]]) -> dict:
         """
-        SELECT sy.name
-        FROM senses se
-        JOIN synsets sy ON sy.id = se.synset_id
-        WHERE se.lemma = %(word)s
-        """,
-        params,
-    )
-    res = cur.fetchall()
-    if len(res) == 1:
-        return (res[0]["name"], "single")
-
-    params = {"synset_id": synset_id, "word": word}
-    cur.execute("EXECUTE select_rwn_word_relation(%(synset_id)s, %(word)s)", params)
-    res = cur.fetchone()
-    return (res["synset_name"], res["name"]) if res else (None, None)
+        Результаты поиска (synset_name, relation_name, result) для пар
+        (id смысла словосочетания, слово) из всех словосочетаний пачки
+        """
+        results = {}
+        words = {}
+        for row in rows:
+            for word in row["lemma"].split():
+                if word in blacklist or word in words:
+                    continue
+                words[word] = (
+                    self.index.senses(word),
+                    [e for e in self.index.entries(word) if e.concept_id is not None],
+                    len({entry.id for entry in self.index.entries(word)}),
+                )
+
+        # 1. Слова с единственным значением в RWN и отношения в RWN
+        rwn_pairs = set()
+        for row in rows:
+            for word in row["lemma"].split():
+                if word not in words:
+                    continue
+                senses, _, entries_count = words[word]
+                if not senses and not entries_count:
+                    continue
+                if len(senses) == 1:
+                    results[row["id"], word] = (
+                        senses[0].synset_name,
+                        "single",
+                        "single",
+                    )
+                else:
+                    rwn_pairs.add((row["synset_id"], word))
+        rwn_found = search_in_rwn_batch(self.cursor, rwn_pairs)
+
+        # 2. Слова с единственным понятием в РуТез и отношения в РуТез
+        unresolved = []
+        ruthes_pairs = set()
+        for row in rows:
+            for word in row["lemma"].split():
+                if word not in words or (row["id"], word) in results:
+                    continue
+                senses, entries, entries_count = words[word]
+                if not senses and not entries_count:
+                    continue
+                if (row["synset_id"], word) in rwn_found:
+                    synset_name, name = rwn_found[row["synset_id"], word]
+                    results[row["id"], word] = (synset_name, name, name)
+                elif len(entries) == 1:
+                    results[row["id"], word] = (
+                        entries[0].concept_name,
+                        "single",
+                        "single",
+                    )
+                else:
+                    unresolved.append((row, word))
+                    ruthes_pairs.add((word, row["synset_name"]))
+        ruthes_found = search_in_ruthes_batch(self.cursor, ruthes_pairs)
+
+        # 3. Рекурсивный поиск по отношениям РуТез
+        for row, word in unresolved:
+            if (word, row["synset_name"]) in ruthes_found:
+                synset_name, name = ruthes_found[word, row["synset_name"]]
+                results[row["id"], word] = (synset_name, name, name)
+            else:
+                results[row["id"], word] = search_in_ruthes_transitionally(
+                    self.cursor, word, row["synset_name"]
+                )
+        return results
+
+    def process_row(self, row: Dict[str, str], results: dict) -> None:
+        counters = self.counters
+        log = ["", "{} ({}):".format(row["name"], row["synset_name"])]
+        counters["collocations"] += 1
+
+        words_with_relations = 0
+        detailed_words = []
+        word_results = []
+        for word in row["lemma"].split():
+            if word in blacklist:
+                continue
+            result = "нет"
+
+            if (row["id"], word) in results:
+                synset_name, relation_name, result = results[row["id"], word]
+
+                if synset_name is None:
+                    result = "нет"
+                    counters["noRelation"] += 1
+                    counters["wordPresented"] += 1
+                    existence_strings = []
+                    if self.index.senses(word):
+                        existence_strings.append("есть в РуТез")
+                    if self.index.entries(word):
+                        existence_strings.append("есть в RWN")
+                    result += " (" + (", ".join(existence_strings)) + ")"
+                else:
+                    detailed_words.append((word, synset_name))
+                    counters["relations"][relation_name] += 1
+                    words_with_relations += 1
+
+            log.append(f"{word} — {result}")
+            word_results.append(f"{word} — {result}")
+
+        if words_with_relations > 0:
+            counters["collocationsAllRelations"] += 1
+            if not self.test:
+                params = {"parent_id": row["id"], "name": "composed_of"}
+                for word, synset_name in detailed_words:
+                    row_lexeme = search_sense(self.index, word, synset_name)
+                    if row_lexeme:
+                        try:
+                            self.cursor.execute(
+                                self.insert_relation_sql,
+                                {"child_id": row_lexeme.id, **params},
+                            )
+                        except IntegrityError:
+                            # Бывают словосочетания, образованные из одного слова (МАТЬ → МАТЬ МАТЕРИ)
+                            pass
+                    else:
+                        log.append(f"Лексема не найдена: {word} ({synset_name})")
+        # Одной записью, чтобы вывод разных процессов не перемешивался
+        sys.stderr.write("\n".join(log) + "\n")
+        sys.stderr.flush()
+
+        if words_with_relations == 0 and self.without_matches:
+            counters["collocationsNoRelations"] += 1
+            output = ["", "{} ({}):".format(row["name"], row["synset_name"])]
+            output.extend(word_results)
+
+            if self.test:
+                params = {"synset_id": row["synset_id"]}
+                self.cursor.execute(
+                    "EXECUTE select_rwn_relation(%(synset_id)s)", params
+                )
+                for rel_row in self.cursor:
+                    output.append(
+                        " -- "
+                        + rel_row["rel_name"]
+                        + ": "
+                        + ", ".join(rel_row["senses"])
+                    )
+            sys.stdout.write("\n".join(output) + "\n")
+            sys.stdout.flush()
+
+
+class Worker(TaskWorker):
+    def __init__(self, connection_string: str, index_file: str) -> None:
+        super().__init__()
+        self.connection_string = connection_string
+        self.index_file = index_file
+
+    def setup(self) -> None:
+        self.conn = connect(self.connection_string)
+        self.conn.autocommit = True
+        self.cursor = self.conn.cursor(cursor_factory=extras.RealDictCursor)
+        self.index = LemmaIndex(self.index_file)
+        self.analyzer = CollocationAnalyzer(self.cursor, self.index)
+
+    def process_chunk(self, chunk: list) -> int:
+        self.analyzer.process(chunk)
+        return 0
+
+    def teardown(self) -> None:
+        self.index.close()
+        self.cursor.close()
+        self.conn.close()
+
+    def result(self) -> dict:
+        return self.analyzer.counters
+
+
+def search_sense(index: LemmaIndex, word: str, synset_name: str):
+    for sense in index.senses(word):
+        if sense.synset_name == synset_name:
+            return sense
+    return None
+
+
+def search_in_rwn_batch(
+    cur: extras.DictCursorBase, pairs
+) -> Dict[Tuple[str, str], Tuple[str, str]]:
+    """
+    Отношения в RWN для пар (синсет словосочетания, слово): один шаг вниз
+    по отношениям синсетов или тот же синсет
+    """
+    if not pairs:
+        return {}
+    synset_ids, words = zip(*pairs)
+    sql = """
+      SELECT
+        p.synset_id,
+        p.word,
+        r.name,
+        r.synset_name
+      FROM unnest(%(synset_ids)s::text[], %(words)s::text[]) p (synset_id, word)
+        CROSS JOIN LATERAL (
+          SELECT
+            sr.name,
+            (SELECT name FROM synsets WHERE id = se.synset_id) synset_name
+          FROM senses se
+            INNER JOIN synset_relations sr
+              ON sr.child_id = se.synset_id
+          WHERE sr.parent_id = p.synset_id
+            AND se.lemma = p.word
 
+          UNION ALL
 
-def search_in_ruthes(
-    cur: extras.DictCursorBase, word: str, collocation_lemma: str, synset_name: str
-) -> Tuple[Optional[str], Optional[str]]:
-    params = {"word": word}
-    cur.execute(
-        """
-        SELECT c.name
-        FROM text_entry t
-          INNER JOIN synonyms s
-            ON s.entry_id = t.id
-          INNER JOIN concepts c
-            ON c.id = s.concept_id
-        WHERE t.lemma = %(word)s
-        """,
-        params,
-    )
-    res = cur.fetchall()
-    if len(res) == 1:
-        return (res[0]["name"], "single")
-
-    params = {"word": word, "synset_name": synset_name}
-    cur.execute("EXECUTE select_ruthes_relation(%(word)s, %(synset_name)s)", params)
-    res = cur.fetchone()
-    return (res["synset_name"], res["name"]) if res else (None, None)
+          SELECT
+            'synset',
+            (SELECT name FROM synsets WHERE id = synset_id) synset_name
+          FROM senses
+          WHERE lemma = p.word
+            AND synset_id = p.synset_id
+          LIMIT 1
+        ) r"""
+    cur.execute(sql, {"synset_ids": list(synset_ids), "words": list(words)})
+    return {
+        (row["synset_id"], row["word"]): (row["synset_name"], row["name"])
+        for row in cur
+    }
+
+
+def search_in_ruthes_batch(
+    cur: extras.DictCursorBase, pairs
+) -> Dict[Tuple[str, str], Tuple[str, str]]:
+    """
+    Отношения в РуТез для пар (слово, имя синсета словосочетания): один шаг
+    вниз от понятия словосочетания
+    """
+    if not pairs:
+        return {}
+    words, synset_names = zip(*pairs)
+    sql = """
+      SELECT
+        p.word,
+        p.synset_name collocation_synset_name,
+        r.name,
+        r.synset_name
+      FROM unnest(%(words)s::text[], %(synset_names)s::text[]) p (word, synset_name)
+        CROSS JOIN LATERAL (
+          SELECT
+            r.name,
+            c.name as synset_name
+          FROM text_entry t
+            INNER JOIN synonyms s
+              ON s.entry_id = t.id
+            INNER JOIN concepts c
+              ON c.id = s.concept_id
+            INNER JOIN relations r
+              ON r.to_id = s.concept_id
+            INNER JOIN concepts c2
+              ON c2.id = r.from_id
+          WHERE t.lemma = p.word
+            AND c2.name = p.synset_name
+          LIMIT 1
+        ) r"""
+    cur.execute(sql, {"words": list(words), "synset_names": list(synset_names)})
+    return {
+        (row["word"], row["collocation_synset_name"]): (
+            row["synset_name"],
+            row["name"],
+        )
+        for row in cur
+    }
 
 
 def search_in_ruthes_transitionally(
@@ -2,13 +2,16 @@
 
 import argparse
 import csv
+import io
 import logging
 import sys
 from collections import namedtuple
 
-import pymorphy2
 from psycopg2 import connect, extras
 
+from ruwordnet.bulk import copy_value
+from ruwordnet.morph import MorphService
+
 parser = argparse.ArgumentParser(
     description="Extracts morphological info from text_entries"
 )
@@ -25,6 +28,23 @@ parser.add_argument(
 parser.add_argument(
     "--apply", help="Apply morph data to database entries", action="store_true"
 )
+parser.add_argument(
+    "--all",
+    help="Process all entries of v2_text_entry, not only new multiword ones",
+    action="store_true",
+)
+parser.add_argument(
+    "--changed-only",
+    help="Output or apply only entries whose morph data differs from the database",
+    action="store_true",
+)
+parser.add_argument(
+    "-w",
+    "--workers",
+    type=int,
+    help="Number of processes for morphological analysis (default: 1)",
+    default=1,
+)
 
 ARGS = parser.parse_args()
 
@@ -151,46 +171,28 @@ PREDEFINED_MORPHS = (
     ),
 )
 
-morph = pymorphy2.MorphAnalyzer()
+# (concept, lemma) -> MorphData
+PREDEFINED_MORPH_DATA = {}
+for concept, _, lemma, morph_data in PREDEFINED_MORPHS:
+    PREDEFINED_MORPH_DATA.setdefault((concept, lemma), morph_data)
+
+morph = MorphService(exceptions=POS_EXCEPTIONS, workers=ARGS.workers)
 
 
 def get_pos(word) -> str:
-    pos = morph.parse(word)[0].tag.POS  # type: ignore
-
-    for rule in POS_EXCEPTIONS:
-        if rule[0] == word and rule[1] == pos:
-            return rule[2]
-
-    # More general rules for renaming POSes
-    if pos == "NOUN" or pos is None:
-        return "N"
-    if pos in {"ADJF", "PRTF", "PRTS"}:
-        return "Adj"
-    if pos == "INFN":
-        return "V"
-    if pos == "ADVB":
-        return "Adv"
-    if pos == "PRCL":
-        return "Prtc"
-    if pos == "NPRO":
-        return "Pron"
-    if pos in {"PREP", "CONJ"}:
-        return pos.capitalize()
-
-    logging.info("%s: %s", word, pos)
-    return str(pos)
+    return morph.pos(word)
 
 
 def get_poses(word: str) -> str:
-    return " ".join(get_pos(part) for part in word.split(" "))
+    return " ".join(morph.poses(word.split(" ")))
 
 
 def get_morph_data(word, concept) -> MorphData:
-    for predefined_morph in PREDEFINED_MORPHS:
-        if concept == predefined_morph[0] and word == predefined_morph[2]:
-            return predefined_morph[3]
+    predefined_morph = PREDEFINED_MORPH_DATA.get((concept, word))
+    if predefined_morph is not None:
+        return predefined_morph
     parts = word.split(" ")
-    poses = [get_pos(part) for part in parts]
+    poses = morph.poses(parts)
     if len(parts) == 1:
         return MorphData(poses[0], word, poses[0])
     if "V" in poses:
@@ -212,26 +214,51 @@ def get_main_noun(parts, poses) -> str:
 
 def get_data(conn):
     with conn.cursor(cursor_factory=extras.RealDictCursor) as cur:
-        cur.execute(
-            """
-                select c2.name concept_name, t.name entry_name, t.lemma, t.id
-                from (
-                    select t2.*
-                    from v2_text_entry t2
-                    left join text_entry t on t.id = t2.id or t.name = t2.name or t.lemma = t2.lemma
-                    where t.id is null
-                ) t
+        if ARGS.all:
+            cur.execute(
+                """
+                select c.name concept_name, t.name entry_name, t.lemma, t.id,
+                       t.pos_string current_pos_string,
+                       t.main_word current_main_word,
+                       t.synt_type current_synt_type
+                from v2_text_entry t
                 join v2_synonyms s on s.entry_id = t.id
-                join v2_concepts c2 on c2.id = s.concept_id
-                left join concepts c on c.id = c2.id
-                where c2.id > 0
-                  and c.id is null
-                  and is_multiword(t.lemma)
+                join v2_concepts c on c.id = s.concept_id
+                where c.id > 0
+                  and t.lemma is not null
                 order by 1, 2
             """
-        )
-
-        for row in cur:
+            )
+        else:
+            cur.execute(
+                """
+                    select c2.name concept_name, t.name entry_name, t.lemma, t.id,
+                           t.pos_string current_pos_string,
+                           t.main_word current_main_word,
+                           t.synt_type current_synt_type
+                    from (
+                        select t2.*
+                        from v2_text_entry t2
+                        left join text_entry t on t.id = t2.id or t.name = t2.name or t.lemma = t2.lemma
+                        where t.id is null
+                    ) t
+                    join v2_synonyms s on s.entry_id = t.id
+                    join v2_concepts c2 on c2.id = s.concept_id
+                    left join concepts c on c.id = c2.id
+                    where c2.id > 0
+                      and c.id is null
+                      and is_multiword(t.lemma)
+                    order by 1, 2
+                """
+            )
+
+        rows = cur.fetchall()
+
+        # Все слова разбираются заранее, каждое — один раз
+        logging.info("Analyzing words of %s entries", len(rows))
+        morph.parse_many(part for row in rows for part in row["lemma"].split(" "))
+
+        for row in rows:
             morph_data = get_morph_data(row["lemma"], row["concept_name"])
             row["pos_string"] = morph_data.pos_string
             row["main_word"] = morph_data.main_word
@@ -239,6 +266,10 @@ def get_data(conn):
             yield row
 
 
+def is_changed(row) -> bool:
+    return any(row[field] != row["current_" + field] for field in MorphData._fields)
+
+
 def write_csv(conn):
     writer = csv.DictWriter(
         sys.stdout,
@@ -257,33 +288,60 @@ def write_csv(conn):
     writer.writeheader()
 
     for row in get_data(conn):
-        writer.writerow(row)
+        if not ARGS.changed_only or is_changed(row):
+            writer.writerow(row)
 
 
 def update_database(conn):
+    """
+    Все данные копируются (COPY) во временную таблицу и переносятся
+    в v2_text_entry одним UPDATE в одной транзакции
+    """
+    # Вход может встречаться в нескольких понятиях: как и при построчном
+    # обновлении, остаются данные последней строки
+    rows = {row["id"]: row for row in get_data(conn)}
+    if ARGS.changed_only:
+        rows = {key: row for key, row in rows.items() if is_changed(row)}
+    buffer = io.StringIO()
+    for row in rows.values():
+        values = [row["id"], row["synt_type"], row["main_word"], row["pos_string"]]
+        buffer.write("\t".join(copy_value(value) for value in values) + "\n")
+    buffer.seek(0)
+
     with conn.cursor() as cur:
-        for row in get_data(conn):
-            try:
-                cur.execute(
-                    """UPDATE v2_text_entry
-                   SET synt_type = %(synt_type)s,
-                       main_word = %(main_word)s,
-                       pos_string = %(pos_string)s
-                   WHERE id = %(id)s""",
-                    row,
-                )
-                conn.commit()
-            except:
-                logging.exception("Something went wrong with %s", row)
-                conn.rollback()
+        cur.execute(
+            """CREATE TEMP TABLE morph_data (
+                   id INTEGER PRIMARY KEY,
+                   synt_type TEXT,
+                   main_word TEXT,
+                   pos_string TEXT
+               ) ON COMMIT DROP"""
+        )
+        cur.copy_expert(
+            "COPY morph_data (id, synt_type, main_word, pos_string) FROM STDIN",
+            buffer,
+        )
+        cur.execute(
+            """UPDATE v2_text_entry t
+               SET synt_type = m.synt_type,
+                   main_word = m.main_word,
+                   pos_string = m.pos_string
+               FROM morph_data m
+               WHERE t.id = m.id
+                 AND (t.synt_type, t.main_word, t.pos_string)
+                     IS DISTINCT FROM (m.synt_type, m.main_word, m.pos_string)"""
+        )
+        logging.info("Updated %s of %s entries", cur.rowcount, len(rows))
+    conn.commit()
 
 
 def main():
     conn = connect(ARGS.connection_string)
-    if ARGS.apply:
-        update_database(conn)
-    else:
-        write_csv(conn)
+    with morph:
+        if ARGS.apply:
+            update_database(conn)
+        else:
+            write_csv(conn)
 
 
 main()
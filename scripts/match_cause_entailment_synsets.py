@@ -3,28 +3,28 @@
 import argparse
 import os
 import re
-from typing import List
+from typing import Dict, List
 
-from psycopg2 import connect, extras
+from psycopg2 import connect
+
+from ruwordnet.lemma_index import LemmaIndex, open_index
 
 
 class Matcher:
-    def __init__(self, connection, source_file):
-        self.connection = connection
+    def __init__(self, index: LemmaIndex, source_file):
+        self.index = index
         self.source_file = source_file
         self.re_synset = re.compile(r"^.:\s+(.*)$")
 
     def run(self):
-        with open(self.source_file) as file, self.connection.cursor(
-            cursor_factory=extras.DictCursor
-        ) as dict_cur:
+        with open(self.source_file) as file:
 
             for line_a in file:
                 senses_a = self.extract_senses(line_a.strip())
                 senses_b = self.extract_senses(file.readline().strip())
 
-                result_a = self.search_matches(dict_cur, senses_a)
-                result_b = self.search_matches(dict_cur, senses_b)
+                result_a = self.search_matches(senses_a)
+                result_b = self.search_matches(senses_b)
 
                 if result_a or result_b:
                     print("A: {}".format("; ".join(senses_a)))
@@ -43,12 +43,11 @@ class Matcher:
 
         return sorted(sense.strip() for sense in senses_match.group(1).split(";"))
 
-    @classmethod
-    def search_matches(cls, cur, senses: List[str]) -> str:
+    def search_matches(self, senses: List[str]) -> str:
         result = ""
-        exact_matches = cls.search_exact_matches(cur, senses)
+        exact_matches = self.search_exact_matches(senses)
         if not exact_matches:
-            loose_matches = cls.search_loose_matches(cur, senses)
+            loose_matches = self.search_loose_matches(senses)
             if loose_matches:
                 result += "    Точных совпадений не найдено, неточные совпадения:\n"
                 for match in loose_matches:
@@ -69,52 +68,46 @@ class Matcher:
                 )
         return result
 
-    @staticmethod
-    def search_exact_matches(cur, senses: List[str]):
-        cur.execute(
-            """
-            WITH extended_synsets(name, part_of_speech, senses) AS (
-                SELECT
-                    sy.name,
-                    sy.part_of_speech,
-                    array_agg(se.name ORDER BY se.name) senses
-                FROM synsets sy
-                JOIN senses se ON se.synset_id = sy.id
-                GROUP BY sy.name, sy.part_of_speech
-            )
-            SELECT *
-            FROM extended_synsets
-            WHERE senses @> ARRAY[%s] AND senses <@ ARRAY[%s]
-            """,
-            (senses, senses),
-        )
-        return cur.fetchall()
-
-    @staticmethod
-    def search_loose_matches(cur, senses: List[str]):
-        cur.execute(
-            """
-            WITH extended_synsets(name, part_of_speech, senses) AS (
-                SELECT
-                    sy.name,
-                    sy.part_of_speech,
-                    array_agg(se.name ORDER BY se.name) senses
-                FROM synsets sy
-                JOIN senses se ON se.synset_id = sy.id
-                GROUP BY sy.name, sy.part_of_speech
-            )
-            SELECT *
-            FROM extended_synsets
-            WHERE senses && ARRAY[%s]
-            """,
-            (senses,),
-        )
+    def search_exact_matches(self, senses: List[str]):
+        # Синсет с тем же набором смыслов содержит и первый из них
+        return [
+            synset
+            for synset in self.search_synsets(senses[:1])
+            if set(synset["senses"]) == set(senses)
+        ]
+
+    def search_loose_matches(self, senses: List[str]):
         return sorted(
-            cur,
+            self.search_synsets(senses),
             key=lambda x: len(set(x["senses"]).intersection(set(senses))),
             reverse=True,
         )
 
+    def search_synsets(self, senses: List[str]) -> List[Dict]:
+        """
+        Синсеты (объединённые по имени и части речи), в которые входит хотя бы
+        один из смыслов senses, со всеми своими смыслами
+        """
+        synsets = {}
+        for sense in senses:
+            for row in self.index.senses(sense, "sense_name"):
+                if row.name != sense:
+                    continue
+                key = (row.synset_name, row.part_of_speech)
+                if key not in synsets:
+                    synsets[key] = {
+                        "name": row.synset_name,
+                        "part_of_speech": row.part_of_speech,
+                        "senses": sorted(
+                            member.name
+                            for member in self.index.senses(
+                                row.synset_name, "synset_name"
+                            )
+                            if (member.synset_name, member.part_of_speech) == key
+                        ),
+                    }
+        return list(synsets.values())
+
 
 def main():
     parser = argparse.ArgumentParser(
@@ -131,6 +124,18 @@ def main():
         help="Postgresql database connection string ({})".format(connection_string),
         default=connection_string,
     )
+    parser.add_argument(
+        "--lemma-index",
+        type=str,
+        help="Lemma index file (ruwordnet/lemma_index.py), built from the database "
+        "if it does not exist or the row counts of the database tables have changed. "
+        "Without it, the index is built in a temporary file",
+    )
+    parser.add_argument(
+        "--rebuild-index",
+        help="Rebuild the --lemma-index file even if it is up to date",
+        action="store_true",
+    )
 
     ARGS = parser.parse_args()
 
@@ -141,7 +146,8 @@ def main():
         exit()
 
     conn = connect(ARGS.connection_string)
-    Matcher(conn, filename).run()
+    with open_index(ARGS.lemma_index, conn, ARGS.rebuild_index) as index:
+        Matcher(index, filename).run()
     print("Done")
 
 
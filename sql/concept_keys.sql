@@ -0,0 +1,25 @@
+-- Миграция: целочисленные ключи понятия и текстового входа в синсетах и смыслах.
+-- Новые базы получают эти столбцы из prepare_database.sql, а заполняет их
+-- sql2sql/sql2sql.py; для существующих данных они восстанавливаются
+-- из идентификаторов вида <понятие>-<часть речи>[-<текстовый вход>].
+
+ALTER TABLE synsets ADD COLUMN IF NOT EXISTS concept_id INTEGER;
+
+ALTER TABLE senses
+  ADD COLUMN IF NOT EXISTS concept_id INTEGER,
+  ADD COLUMN IF NOT EXISTS text_entry_id INTEGER;
+
+UPDATE synsets
+   SET concept_id = substring(id, '^\d+')::INTEGER
+ WHERE concept_id IS NULL
+   AND id ~ '^\d+-\w+$';
+
+UPDATE senses
+   SET concept_id    = substring(id, '^\d+')::INTEGER,
+       text_entry_id = substring(id, '\d+$')::INTEGER
+ WHERE concept_id IS NULL
+   AND id ~ '^\d+-\w+-\d+$';
+
+CREATE INDEX IF NOT EXISTS synsets_concept_id_int_idx ON synsets (concept_id);
+CREATE INDEX IF NOT EXISTS senses_concept_id_idx ON senses (concept_id);
+CREATE INDEX IF NOT EXISTS senses_text_entry_id_idx ON senses (text_entry_id);
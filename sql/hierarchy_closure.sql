@@ -0,0 +1,25 @@
+-- Транзитивное замыкание иерархий РуТез (ВЫШЕ) и RuWordNet (hypernym, instance hypernym).
+-- Для каждой пары предок-потомок хранятся длина кратчайшего пути (depth) и сам путь
+-- от предка к потомку (path). Таблицы заполняет и обновляет ruwordnet/closure.py
+-- (python -m ruwordnet.closure, make hierarchy-closure); пересчитываются только потомки
+-- понятий и синсетов, у которых изменились непосредственные предки.
+
+CREATE TABLE IF NOT EXISTS ruthes_closure (
+  ancestor_id   INTEGER  NOT NULL,
+  descendant_id INTEGER  NOT NULL,
+  depth         SMALLINT NOT NULL,
+  path          INTEGER[] NOT NULL,
+  PRIMARY KEY (ancestor_id, descendant_id)
+);
+
+CREATE INDEX IF NOT EXISTS ruthes_closure_descendant_idx ON ruthes_closure (descendant_id, depth);
+
+CREATE TABLE IF NOT EXISTS synset_closure (
+  ancestor_id   TEXT     NOT NULL,
+  descendant_id TEXT     NOT NULL,
+  depth         SMALLINT NOT NULL,
+  path          TEXT[]   NOT NULL,
+  PRIMARY KEY (ancestor_id, descendant_id)
+);
+
+CREATE INDEX IF NOT EXISTS synset_closure_descendant_idx ON synset_closure (descendant_id, depth);
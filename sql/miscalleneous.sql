@@ -6,42 +6,21 @@ WHERE NOT exists(SELECT 1
                  WHERE from_id = c.id AND name = 'ВЫШЕ');
 
 -- Извлечение этапов процессов
-WITH RECURSIVE ctree(id, name, root_id, root_name) AS (
+-- Поддеревья ВЫШЕ-НИЖЕ берутся из ruthes_closure (sql/hierarchy_closure.sql, make hierarchy-closure)
+WITH ctree(id, name) AS (
   SELECT
     c.id,
-    c.name,
-    c.id   root_id,
-    c.name root_name
+    c.name
   FROM concepts c
-  WHERE c.id IN (153471)
-  UNION
+  WHERE c.id = 153471
+     OR c.id IN (SELECT descendant_id FROM ruthes_closure WHERE ancestor_id = 153471)
+), ctree2(id, name) AS (
   SELECT
     c.id,
-    c.name,
-    ct.root_id,
-    ct.root_name
+    c.name
   FROM concepts c
-    INNER JOIN relations r ON r.from_id = c.id
-    INNER JOIN ctree ct ON ct.id = r.to_id
-  WHERE r.name = 'ВЫШЕ'
-), ctree2(id, name, root_id, root_name) AS (
-  SELECT
-    c.id,
-    c.name,
-    c.id   root_id,
-    c.name root_name
-  FROM concepts c
-  WHERE c.id IN (106562)
-  UNION
-  SELECT
-    c.id,
-    c.name,
-    ct.root_id,
-    ct.root_name
-  FROM concepts c
-    INNER JOIN relations r ON r.from_id = c.id
-    INNER JOIN ctree2 ct ON ct.id = r.to_id
-  WHERE r.name = 'ВЫШЕ'
+  WHERE c.id = 106562
+     OR c.id IN (SELECT descendant_id FROM ruthes_closure WHERE ancestor_id = 106562)
 ), ctree3 (id, name) AS (
   SELECT
     id,
@@ -67,24 +46,13 @@ WHERE r.name = 'ЧАСТЬ';
 
 -- 1. Сторится дерево отношений ВЫШЕ-НИЖЕ от корневого понятие «СВОЙСТВО, ХАРАКТЕРИСТИКА».
 -- 2. Выбираются понятия отношений ЧАСТЬ-ЦЕЛОЕ с частью в вышеуказанном дереве.
-WITH RECURSIVE ctree(id, name, root_id, root_name) AS (
-  SELECT
-    c.id,
-    c.name,
-    c.id   root_id,
-    c.name root_name
-  FROM concepts c
-  WHERE c.id IN (106768)
-  UNION
+WITH ctree(id, name) AS (
   SELECT
     c.id,
-    c.name,
-    ct.root_id,
-    ct.root_name
+    c.name
   FROM concepts c
-    INNER JOIN relations r ON r.from_id = c.id
-    INNER JOIN ctree ct ON ct.id = r.to_id
-  WHERE r.name = 'ВЫШЕ'
+  WHERE c.id = 106768
+     OR c.id IN (SELECT descendant_id FROM ruthes_closure WHERE ancestor_id = 106768)
 )
 SELECT
   DISTINCT
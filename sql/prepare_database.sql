@@ -62,27 +62,33 @@ CREATE TABLE synsets (
   name           TEXT,
   definition     TEXT,
   part_of_speech TEXT,
+  concept_id     INTEGER, -- REFERENCES concepts (id)
   UNIQUE (name, part_of_speech)
 );
 
 CREATE INDEX ON synsets (name);
 CREATE INDEX ON synsets (part_of_speech);
 CREATE INDEX synsets_concept_id_idx ON synsets (substring(id, '^\d+'));
+CREATE INDEX synsets_concept_id_int_idx ON synsets (concept_id);
 
 CREATE TABLE senses (
-  id        TEXT PRIMARY KEY,
-  synset_id TEXT REFERENCES synsets (id),
-  name      TEXT,
-  lemma     TEXT,
-  main_word TEXT,
-  synt_type TEXT,
-  poses     TEXT,
-  meaning   SMALLINT,
+  id            TEXT PRIMARY KEY,
+  synset_id     TEXT REFERENCES synsets (id),
+  name          TEXT,
+  lemma         TEXT,
+  main_word     TEXT,
+  synt_type     TEXT,
+  poses         TEXT,
+  meaning       SMALLINT,
+  concept_id    INTEGER, -- REFERENCES concepts (id)
+  text_entry_id INTEGER, -- REFERENCES text_entry (id)
   UNIQUE (name, synset_id)
 );
 
 CREATE INDEX ON senses (name);
 CREATE INDEX ON senses (lemma);
+CREATE INDEX ON senses (concept_id);
+CREATE INDEX ON senses (text_entry_id);
 CREATE INDEX senses_is_multiword ON senses (is_multiword(name));
 CREATE INDEX senses_words ON senses USING GIN (regexp_split_to_array(name, '\s+')) WHERE is_multiword(name);
 
@@ -0,0 +1,86 @@
+-- Журнал изменённых понятий РуТез для инкрементальной конвертации
+-- (sql2sql/sql2sql.py --changes-table). Таблица заполняется триггерами,
+-- обработанные записи удаляются конвертером.
+
+CREATE TABLE IF NOT EXISTS ruthes_changes (
+  id         SERIAL PRIMARY KEY,
+  concept_id INTEGER NOT NULL,
+  changed_at TIMESTAMP NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS ruthes_changes_concept_id_idx ON ruthes_changes (concept_id);
+
+CREATE OR REPLACE FUNCTION log_concept_change()
+RETURNS TRIGGER AS $$
+    BEGIN
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            INSERT INTO ruthes_changes (concept_id) VALUES (OLD.id);
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            INSERT INTO ruthes_changes (concept_id) VALUES (NEW.id);
+        END IF;
+        RETURN NULL;
+    END;
+$$ LANGUAGE PLPGSQL;
+
+CREATE OR REPLACE FUNCTION log_relation_change()
+RETURNS TRIGGER AS $$
+    BEGIN
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            INSERT INTO ruthes_changes (concept_id) VALUES (OLD.from_id), (OLD.to_id);
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            INSERT INTO ruthes_changes (concept_id) VALUES (NEW.from_id), (NEW.to_id);
+        END IF;
+        RETURN NULL;
+    END;
+$$ LANGUAGE PLPGSQL;
+
+-- Изменение связки меняет номера значений многозначного текстового входа,
+-- поэтому отмечаются все понятия, связанные с этим входом
+CREATE OR REPLACE FUNCTION log_synonym_change()
+RETURNS TRIGGER AS $$
+    BEGIN
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            INSERT INTO ruthes_changes (concept_id) VALUES (OLD.concept_id);
+            INSERT INTO ruthes_changes (concept_id)
+                SELECT concept_id FROM synonyms WHERE entry_id = OLD.entry_id;
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            INSERT INTO ruthes_changes (concept_id)
+                SELECT concept_id FROM synonyms WHERE entry_id = NEW.entry_id;
+        END IF;
+        RETURN NULL;
+    END;
+$$ LANGUAGE PLPGSQL;
+
+CREATE OR REPLACE FUNCTION log_text_entry_change()
+RETURNS TRIGGER AS $$
+    BEGIN
+        INSERT INTO ruthes_changes (concept_id)
+            SELECT concept_id
+              FROM synonyms
+             WHERE entry_id = CASE WHEN TG_OP = 'DELETE' THEN OLD.id ELSE NEW.id END;
+        RETURN NULL;
+    END;
+$$ LANGUAGE PLPGSQL;
+
+DROP TRIGGER IF EXISTS concepts_log_change ON concepts;
+CREATE TRIGGER concepts_log_change
+    AFTER INSERT OR UPDATE OR DELETE ON concepts
+    FOR EACH ROW EXECUTE PROCEDURE log_concept_change();
+
+DROP TRIGGER IF EXISTS relations_log_change ON relations;
+CREATE TRIGGER relations_log_change
+    AFTER INSERT OR UPDATE OR DELETE ON relations
+    FOR EACH ROW EXECUTE PROCEDURE log_relation_change();
+
+DROP TRIGGER IF EXISTS synonyms_log_change ON synonyms;
+CREATE TRIGGER synonyms_log_change
+    AFTER INSERT OR UPDATE OR DELETE ON synonyms
+    FOR EACH ROW EXECUTE PROCEDURE log_synonym_change();
+
+DROP TRIGGER IF EXISTS text_entry_log_change ON text_entry;
+CREATE TRIGGER text_entry_log_change
+    AFTER INSERT OR UPDATE OR DELETE ON text_entry
+    FOR EACH ROW EXECUTE PROCEDURE log_text_entry_change();
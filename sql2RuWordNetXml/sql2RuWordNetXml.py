@@ -167,7 +167,7 @@ def generate_lex_file_empty(pos):
         print()
 
 
-def generate_lex_file(pos):
+def generate_lex_file(pos, graph, closure):
     all_types = {
         "N": ("N", "NG", "NGprep", "PrepG"),
         "V": ("V", "VG", "VGprep", "Prdc"),
@@ -183,134 +183,64 @@ def generate_lex_file(pos):
 
     print("Output file: " + filename)
 
-    with conn.cursor(cursor_factory=extras.RealDictCursor) as cur, open(
-        filename, "w", encoding="utf-8"
-    ) as file:
-
-        print("Finding entries...")
-
-        sql = """
-          SELECT
-            c.id   c_id,
-            c.name c_name,
-            c.gloss,
-            t.id,
-            t.name,
-            t.synt_type,
-            array_remove(
-                array_agg(DISTINCT s2.concept_id),
-                NULL
-            )      concept_ids,
-            array_remove(
-                array_agg(DISTINCT s3.entry_id),
-                NULL
-            )      entry_ids
-          FROM synonyms s
-            LEFT JOIN text_entry t
-              ON t.id = s.entry_id
-              --AND t.synt_type IN %(types)s
-            LEFT JOIN synonyms s2
-              ON s2.entry_id = t.id
-            INNER JOIN synonyms s3
-              ON s3.concept_id = s.concept_id
-            INNER JOIN concepts c
-              ON c.id = s.concept_id
-          GROUP BY t.id, c.id
-          ORDER BY t.name NULLS LAST"""
-        cur.execute(sql, {"types": types})
-
+    with open(filename, "w", encoding="utf-8") as file:
         rgxSpace = re.compile('([,()"\s]+)')
-        rgxEscape = re.compile("([,()])")
-        empty_cnt = 0
-        concepts = {}
-        for row in cur:
-            cid = row["c_id"]
-            if row["id"] is None:
-                empty_cnt += 1
-            else:
-                row["name"] = rgxSpace.sub("_", row["name"].strip())
-                # row['name'] = rgxEscape.sub(r'\\\1', row['name'])
-                if len(row["concept_ids"]) > 1:
-                    row["name"] += str(row["concept_ids"].index(cid) + 1)
-            if cid not in concepts:
-                concept = {
-                    "id": cid,
-                    "name": row["c_name"],
-                    "gloss": row["gloss"],
-                    "relations": [],
-                    "entries": [],
-                    "all_entries": [],
-                }
-                concepts[cid] = concept
-            concepts[cid]["all_entries"].append(
-                {k: row[k] for k in ("id", "name", "synt_type")}
-            )
-            # Фильтруем текстовые входы, оставляя только определённую часть речи
-            if row["synt_type"] in types:
-                concepts[cid]["entries"].append(
-                    {k: row[k] for k in ("id", "name", "synt_type")}
-                )
 
-        print("{0} entries found. {1} are empty.".format(cur.rowcount, empty_cnt))
-
-        print("Selecting relations...")
-        sql = """
-          SELECT r.*
-          FROM relations r
-            INNER JOIN concepts cf
-              ON cf.id = r.from_id
-            INNER JOIN concepts ct
-              ON ct.id = r.to_id
-          --WHERE r.name IN('ВЫШЕ', 'НИЖЕ')
-        """
-        cur.execute(sql)
-
-        for relation in cur:
-            concepts[relation["from_id"]]["relations"].append(relation)
+        def get_entries(cid):
+            entries = []
+            for entry in graph.entries(cid):
+                name = rgxSpace.sub("_", entry.name.strip())
+                if entry.meaning:
+                    name += str(entry.meaning)
+                entries.append(
+                    {"id": entry.id, "name": name, "synt_type": entry.synt_type}
+                )
+            return entries
 
         synset_tpl = "{{{words},{pointers} ({gloss})}}"
 
-        count = len(concepts)
+        count = len(graph)
         i = 0
         print("Processing concepts ({0}) and relations...".format(count))
-        for cid, concept in concepts.items():
+        for cid in graph:
             i += 1
 
-            concept["entries"] = [
-                entry for entry in concept["entries"] if entry["id"] is not None
-            ]
+            all_entries = get_entries(cid)
+            # Фильтруем текстовые входы, оставляя только определённую часть речи
+            entries = [entry for entry in all_entries if entry["synt_type"] in types]
 
             # Если у понятия нет текстовых входов необходимой части речи, пропускаем его.
-            if len(concept["entries"]) == 0:
+            if len(entries) == 0:
                 continue
 
-            gloss = concept["name"] + (
-                " | " + xstr(concept["gloss"]) if concept["gloss"] is not None else ""
+            concept_gloss = graph.gloss(cid)
+            gloss = graph.concept_name(cid) + (
+                " | " + xstr(concept_gloss) if concept_gloss is not None else ""
             )
             gloss = rgxSpace.sub("_", gloss)
 
-            relations = []
-            for relation in concept["relations"]:
-                relations += fix_relation(concepts, relation)
-
             pointers = []
-            for relation in relations:
-                ptr_chr = get_pointer(relation["name"], relation["asp"], pos)
+            for relation in closure.fix_all(cid, pos):
+                ptr_chr = get_pointer(relation.name, relation.asp, pos)
                 if ptr_chr is not None:
-                    toc = concepts[relation["to_id"]]
-                    ptr_word = get_pointer_word(toc["entries"])
+                    to_entries = [
+                        entry
+                        for entry in get_entries(relation.to_id)
+                        if entry["synt_type"] in types
+                    ]
+                    ptr_word = get_pointer_word(to_entries)
                     pointers.append(ptr_word + "," + ptr_chr)
 
             # Отдельно добавляем указатели для словообразовательных отношений
             for key, type_set in all_types.items():
                 if key == pos:
                     continue
-                for entry in concept["all_entries"]:
+                for entry in all_entries:
                     if entry["synt_type"] in type_set:
                         pointers.append(entry["name"] + ",+")
                         break
 
-            words = [entry["name"] for entry in concept["entries"]]
+            words = [entry["name"] for entry in entries]
             synset = synset_tpl.format(
                 words=",".join(words), pointers=" ".join(pointers), gloss=gloss
             )
@@ -323,49 +253,6 @@ def generate_lex_file(pos):
         print()
 
 
-def fix_relation(concepts, relation, path=None) -> object:
-    """
-    Проверяем текущее отношение - оно должно указывать на понятие
-    с не пустыми текстовыми входами. Если отношение не проходит
-    проверку, спускаемся по иерархии отношений вниз и повторяем
-    проверку для низлежащих отношений.
-
-    :param path:
-    :param concepts:
-    :param relation:
-    :return:
-    """
-    if path is None:
-        path = []
-    # Это отношение уже рассматривалось
-    if relation in path:
-        return []
-    path.append(relation)
-    if relation["to_id"] in concepts:
-        # Берём понятие, на которое указывает данное отношение
-        toc = concepts[relation["to_id"]]
-        if len([entry for entry in toc["entries"] if entry["id"] is not None]) > 0:
-            # Если у понятия есть не пустые текстовые входы, значит отношение нам подходит
-            return [relation]
-        # Отношение не подходит
-        # Замыкание предусмотрено не для всех типов связей
-        if relation["name"] not in [
-            "НИЖЕ",
-            "ВЫШЕ",
-        ]:  # , 'ЭКЗЕМПЛЯР', 'КЛАСС', 'ЦЕЛОЕ', 'ЧАСТЬ']:
-            return []
-        # Спускаемся ниже по иерархии
-        relations = []
-        # Смотрим все отношения низлежащего понятия
-        for rel in toc["relations"]:
-            # Проверяем, чтобы тип отношения совпадал с исходным отношением
-            if rel["name"] == relation["name"]:
-                # И запускаем проверку этого отношения
-                relations += fix_relation(concepts, rel, path)
-        return relations
-    return []
-
-
 def get_pointer(rel_type, asp, pos):
     rel_map = {
         "АСЦ2": None,
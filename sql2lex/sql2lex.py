@@ -3,7 +3,10 @@ import os
 import re
 import sys
 
-from psycopg2 import connect, extras
+from psycopg2 import connect
+
+from ruwordnet.graph import Graph, HierarchyClosure
+from ruwordnet.snapshot import Snapshot
 
 PKG_ROOT = os.path.split(__file__)[0]
 OUT_ROOT = os.path.join(PKG_ROOT, "out")
@@ -21,11 +24,12 @@ dbconfig = {
 def main(argv):
     global OUT_ROOT, conn
 
-    help_str = "Usage: {0} [-h] [--out-dir=<output_directory>]".format(
-        os.path.split(__file__)[1]
-    )
+    help_str = (
+        "Usage: {0} [-h] [--out-dir=<output_directory>] [--snapshot=<snapshot_file>]"
+    ).format(os.path.split(__file__)[1])
+    snapshot_file = None
     try:
-        opts, args = getopt.getopt(argv, "h", ["out-dir="])
+        opts, args = getopt.getopt(argv, "h", ["out-dir=", "snapshot="])
     except getopt.GetoptError:
         print(help_str)
         sys.exit(2)
@@ -35,28 +39,40 @@ def main(argv):
             sys.exit()
         elif opt == "--out-dir":
             OUT_ROOT = arg
+        elif opt == "--snapshot":
+            snapshot_file = arg
 
-    try:
-        conn = connect(**dbconfig)
-    except:
-        print("I am unable to connect to the database")
-        exit(1)
+    # Со снимком базы (ruwordnet/snapshot.py) подключение к базе не нужно
+    if snapshot_file is None:
+        try:
+            conn = connect(**dbconfig)
+        except:
+            print("I am unable to connect to the database")
+            exit(1)
 
     print("Start")
 
+    # Граф загружается один раз и используется для всех частей речи
+    if snapshot_file is None:
+        graph = Graph.from_database(conn)
+    else:
+        with Snapshot(snapshot_file) as snapshot:
+            graph = Graph.from_snapshot(snapshot)
+    closure = HierarchyClosure(graph)
+
     print("Generating lexfile for nouns")
-    generate_lex_file("N")
+    generate_lex_file("N", graph, closure)
 
     print("Generating lexfile for verbs")
-    generate_lex_file("V")
+    generate_lex_file("V", graph, closure)
 
     print("Generating lexfile for adjectives")
-    generate_lex_file("Adj")
+    generate_lex_file("Adj", graph, closure)
 
     print("Done")
 
 
-def generate_lex_file(pos):
+def generate_lex_file(pos, graph, closure):
     all_types = {
         "N": ("N", "NG", "NGprep", "PrepG"),
         "V": ("V", "VG", "VGprep", "Prdc"),
@@ -82,133 +98,64 @@ def generate_lex_file(pos):
 
     print("Output file: " + filename)
 
-    with conn.cursor(cursor_factory=extras.RealDictCursor) as cur, open(
-        filename, "w", encoding="utf-8"
-    ) as file:
-
-        print("Finding entries...")
-
-        sql = """
-          SELECT
-            c.id   c_id,
-            c.name c_name,
-            c.gloss,
-            t.id,
-            t.name,
-            t.synt_type,
-            array_remove(
-                array_agg(DISTINCT s2.concept_id),
-                NULL
-            )      concept_ids,
-            array_remove(
-                array_agg(DISTINCT s3.entry_id),
-                NULL
-            )      entry_ids
-          FROM synonyms s
-            INNER JOIN text_entry t
-              ON t.id = s.entry_id
-            INNER JOIN synonyms s2
-              ON s2.entry_id = t.id
-            INNER JOIN synonyms s3
-              ON s3.concept_id = s.concept_id
-            INNER JOIN concepts C
-              ON C.id = s.concept_id
-          GROUP BY t.id, C.id
-          ORDER BY t.name NULLS LAST"""
-        cur.execute(sql)
-
+    with open(filename, "w", encoding="utf-8") as file:
         rgxSpace = re.compile('([,()"\s]+)')
-        empty_cnt = 0
-        concepts = {}
-        for row in cur:
-            cid = row["c_id"]
-            if row["id"] is None:
-                empty_cnt += 1
-            else:
-                row["name"] = rgxSpace.sub("_", row["name"].strip())
-                # row['name'] = rgxEscape.sub(r'\\\1', row['name'])
-                if len(row["concept_ids"]) > 1:
-                    row["name"] += str(row["concept_ids"].index(cid) + 1)
-            if cid not in concepts:
-                concept = {
-                    "id": cid,
-                    "name": row["c_name"],
-                    "gloss": row["gloss"],
-                    "relations": [],
-                    "entries": [],
-                    "all_entries": [],
-                }
-                concepts[cid] = concept
-            concepts[cid]["all_entries"].append(
-                {k: row[k] for k in ("id", "name", "synt_type")}
-            )
-            # Фильтруем текстовые входы, оставляя только определённую часть речи
-            if row["synt_type"] in types:
-                concepts[cid]["entries"].append(
-                    {k: row[k] for k in ("id", "name", "synt_type")}
-                )
 
-        print("{0} entries found. {1} are empty.".format(cur.rowcount, empty_cnt))
-
-        print("Selecting relations...")
-        sql = """
-          SELECT r.*
-          FROM relations r
-            INNER JOIN concepts cf
-              ON cf.id = r.from_id
-            INNER JOIN concepts ct
-              ON ct.id = r.to_id
-        """
-        cur.execute(sql)
-
-        for relation in cur:
-            concepts[relation["from_id"]]["relations"].append(relation)
+        def get_entries(cid):
+            entries = []
+            for entry in graph.entries(cid):
+                name = rgxSpace.sub("_", entry.name.strip())
+                if entry.meaning:
+                    name += str(entry.meaning)
+                entries.append(
+                    {"id": entry.id, "name": name, "synt_type": entry.synt_type}
+                )
+            return entries
 
         if pos == "V":
             synset_tpl = "{{{words},{pointers} frames: 1 ({gloss})}}"
         else:
             synset_tpl = "{{{words},{pointers} ({gloss})}}"
 
-        count = len(concepts)
+        count = len(graph)
         i = 0
         print("Processing concepts ({0}) and relations...".format(count))
-        for cid, concept in concepts.items():
+        for cid in graph:
             i += 1
 
-            concept["entries"] = [
-                entry for entry in concept["entries"] if entry["id"] is not None
-            ]
+            all_entries = get_entries(cid)
+            # Фильтруем текстовые входы, оставляя только определённую часть речи
+            entries = [entry for entry in all_entries if entry["synt_type"] in types]
 
             # Если у понятия нет текстовых входов необходимой части речи, пропускаем его.
-            if len(concept["entries"]) == 0:
+            if len(entries) == 0:
                 continue
 
-            gloss = concept["name"] + (
-                " | " + xstr(concept["gloss"]) if concept["gloss"] is not None else ""
+            concept_gloss = graph.gloss(cid)
+            gloss = graph.concept_name(cid) + (
+                " | " + xstr(concept_gloss) if concept_gloss is not None else ""
             )
             gloss = rgxSpace.sub("_", gloss)
 
-            relations = []
-            for relation in concept["relations"]:
-                relations += fix_relation(concepts, relation)
-
-            relations = uniqify(relations, lambda r: "{to_id}|{name}".format(**r))
-
             pointers = []
-            for relation in relations:
-                ptr_chr = get_pointer(relation["name"], relation["asp"], pos)
+            for relation in closure.fix_all(cid, pos):
+                ptr_chr = get_pointer(relation.name, relation.asp, pos)
                 if ptr_chr is not None:
-                    toc = concepts[relation["to_id"]]
-                    ptr_word = get_pointer_word(toc["entries"])
+                    to_entries = [
+                        entry
+                        for entry in get_entries(relation.to_id)
+                        if entry["synt_type"] in types
+                    ]
+                    ptr_word = get_pointer_word(to_entries)
                     pointers.append(ptr_word + "," + ptr_chr)
 
             # Отдельно добавляем указатели для словообразовательных отношений
             if derivational_types:
                 pointers += gen_derivational_pointers(
-                    derivational_types, concept, d_file
+                    derivational_types, all_entries, d_file
                 )
             else:
-                for entry in concept["all_entries"]:
+                for entry in all_entries:
                     est = entry["synt_type"]
                     if est in all_types["N"]:
                         d_file = lex_files["N"]
@@ -220,7 +167,7 @@ def generate_lex_file(pos):
                         continue
                     pointers += ["{0}:{1},{2}".format(d_file, entry["name"], ptr_chr)]
 
-            words = [entry["name"] for entry in concept["entries"]]
+            words = [entry["name"] for entry in entries]
             synset = synset_tpl.format(
                 words=",".join(words), pointers=" ".join(pointers), gloss=gloss
             )
@@ -233,75 +180,14 @@ def generate_lex_file(pos):
         print()
 
 
-def gen_derivational_pointers(derivational_types, concept, d_file):
+def gen_derivational_pointers(derivational_types, all_entries, d_file):
     for d_type in derivational_types:
-        for entry in concept["all_entries"]:
+        for entry in all_entries:
             if entry["synt_type"] == d_type:
                 return ["{0}:{1},+".format(d_file, entry["name"])]
     return []
 
 
-def uniqify(seq, idfun=None):
-    # order preserving
-    if idfun is None:
-
-        def idfun(x):
-            return x
-
-    seen = {}
-    result = []
-    for item in seq:
-        marker = idfun(item)
-        if marker in seen:
-            continue
-        seen[marker] = 1
-        result.append(item)
-    return result
-
-
-def fix_relation(concepts, relation, path=None) -> object:
-    """
-    Проверяем текущее отношение - оно должно указывать на понятие
-    с не пустыми текстовыми входами. Если отношение не проходит
-    проверку, спускаемся по иерархии отношений вниз и повторяем
-    проверку для низлежащих отношений.
-
-    :param path:
-    :param concepts:
-    :param relation:
-    :return:
-    """
-    if path is None:
-        path = []
-    # Это отношение уже рассматривалось
-    if relation in path:
-        return []
-    path.append(relation)
-    if relation["to_id"] in concepts:
-        # Берём понятие, на которое указывает данное отношение
-        toc = concepts[relation["to_id"]]
-        if len([entry for entry in toc["entries"] if entry["id"] is not None]) > 0:
-            # Если у понятия есть не пустые текстовые входы, значит отношение нам подходит
-            return [relation]
-        # Отношение не подходит
-        # Замыкание предусмотрено не для всех типов связей
-        if relation["name"] not in [
-            "НИЖЕ",
-            "ВЫШЕ",
-        ]:  # , 'ЭКЗЕМПЛЯР', 'КЛАСС', 'ЦЕЛОЕ', 'ЧАСТЬ']:
-            return []
-        # Спускаемся ниже по иерархии
-        relations = []
-        # Смотрим все отношения низлежащего понятия
-        for rel in toc["relations"]:
-            # Проверяем, чтобы тип отношения совпадал с исходным отношением
-            if rel["name"] == relation["name"]:
-                # И запускаем проверку этого отношения
-                relations += fix_relation(concepts, rel, path)
-        return relations
-    return []
-
-
 def get_pointer(rel_type, asp, pos):
     rel_map = {
         "N": {
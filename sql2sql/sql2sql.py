@@ -1,10 +1,15 @@
 #!/usr/bin/env python3
 
 import argparse
+import functools
 import logging
+import operator
 import os
+from collections import defaultdict, deque
 
-from psycopg2 import connect, errors, extras
+from psycopg2 import connect, extras
+
+from ruwordnet.graph import POS_BITS, Graph, HierarchyClosure, uniqify
 
 PKG_ROOT = os.path.split(__file__)[0]
 
@@ -12,15 +17,26 @@ logging.basicConfig(level=logging.INFO)
 
 conn = None
 
-POS_TYPE_MAP = {
-    "N": {"N", "NG", "NGprep", "PrepG"},
-    "V": {"V", "VG", "VGprep", "Prdc"},
-    "Adj": {"Adj", "AdjG", "AdjGprep"},
+# Связи с понятием-доменом особенные: они могут идти из различных
+# частей речи к существительным, поэтому будут добавлены отдельно
+SKIPPED_RELATIONS = {"ДОМЕН"}
+
+# Отношения между синсетами, которые порождаются конвертером и post-conversion.sql.
+# При инкрементальной конвертации устаревшие отношения только этих типов удаляются,
+# отношения из других источников (например, cause и entailment) не трогаются.
+GENERATED_RELATIONS = {
+    "POS-synonymy",
+    "hypernym",
+    "hyponym",
+    "instance hypernym",
+    "instance hyponym",
+    "part holonym",
+    "part meronym",
+    "antonym",
+    "domain",
+    "related",
 }
 
-# все типы текстовых входов, которые можно экспортировать
-ALL_TYPES = set().union(*POS_TYPE_MAP.values())
-
 
 def main():
     global conn
@@ -39,225 +55,263 @@ def main():
     )
 
     parser.add_argument("-n", "--dry-run", action="store_true")
+    parser.add_argument(
+        "-b",
+        "--batch-size",
+        type=int,
+        help="Number of rows written to the database at once",
+        default=10000,
+    )
+
+    # Инкрементальная конвертация: пересчитываются только затронутые понятия
+    changes = parser.add_mutually_exclusive_group()
+    changes.add_argument(
+        "--changed-concepts",
+        type=str,
+        help="Comma separated ids of changed RuThes concepts",
+    )
+    changes.add_argument(
+        "--changed-concepts-query",
+        type=str,
+        help="SQL file returning changed concepts in columns named 'id' "
+        "(e.g. sql/queries/ruthes_diff.sql)",
+    )
+    changes.add_argument(
+        "--changes-table",
+        action="store_true",
+        help="Take changed concepts from ruthes_changes table (sql/ruthes_changes.sql)",
+    )
 
     ARGS = parser.parse_args()
 
     conn = connect(ARGS.connection_string)
 
     logging.info("Start")
-    transform_ruthes_to_ruwordnet(ARGS.dry_run)
+    changed_concepts = None
+    last_change_id = None
+    if ARGS.changed_concepts is not None:
+        changed_concepts = {int(cid) for cid in ARGS.changed_concepts.split(",") if cid}
+    elif ARGS.changed_concepts_query is not None:
+        with open(ARGS.changed_concepts_query) as file:
+            changed_concepts = query_changed_concepts(file.read())
+    elif ARGS.changes_table:
+        changed_concepts, last_change_id = load_changes()
+
+    transform_ruthes_to_ruwordnet(ARGS.dry_run, ARGS.batch_size, changed_concepts)
+
+    if last_change_id is not None and not ARGS.dry_run:
+        with conn.cursor() as cur:
+            cur.execute("DELETE FROM ruthes_changes WHERE id <= %s", (last_change_id,))
+        conn.commit()
     logging.info("Done")
 
 
-def transform_ruthes_to_ruwordnet(dry_run):
-
-    inserter = SoftInserter(conn)
-
-    with conn.cursor(cursor_factory=extras.RealDictCursor) as cur:
-
-        logging.info("Fetching entries...")
-
-        sql = """
-          SELECT
-            c.id   c_id,
-            c.name c_name,
-            c.gloss,
-            t.id,
-            t.name,
-            t.lemma,
-            t.main_word,
-            t.pos_string,
-            t.synt_type,
+def query_changed_concepts(sql) -> set:
+    """
+    Выполняет запрос и собирает идентификаторы понятий из всех его столбцов
+    с именем id (в запросе ruthes_diff.sql их два — по одному на версию).
+    """
+    with conn.cursor() as cur:
+        cur.execute(sql)
+        columns = [i for i, column in enumerate(cur.description) if column.name == "id"]
+        return {row[i] for row in cur for i in columns if row[i] is not None}
 
-            -- Все понятия, связанные с текущим текстовым входом (многозначный текстовый вход)
-            array_remove(
-                array_agg(DISTINCT s2.concept_id),
-                NULL
-            )      concept_ids,
 
-            -- Все текстовые входы, связанные с текущим понятием (синонимы)
-            array_remove(
-                array_agg(DISTINCT s3.entry_id),
-                NULL
-            )      entry_ids
+def load_changes():
+    """
+    Возвращает изменённые понятия из журнала ruthes_changes
+    и номер последней прочитанной записи журнала.
+    """
+    with conn.cursor() as cur:
+        cur.execute(
+            "SELECT max(id), array_agg(DISTINCT concept_id) FROM ruthes_changes"
+        )
+        last_change_id, concept_ids = cur.fetchone()
+    return set(concept_ids or ()), last_change_id
 
-          -- Связка "текстовый вход - понятие"
-          FROM synonyms s
-            INNER JOIN text_entry t
-              ON t.id = s.entry_id
-            INNER JOIN concepts c
-              ON c.id = s.concept_id
 
-            -- Остальные связки от текущего текстового входа
-            INNER JOIN synonyms s2
-              ON s2.entry_id = t.id
+def transform_ruthes_to_ruwordnet(dry_run, batch_size=10000, changed_concepts=None):
+    """
+    Если передан changed_concepts, конвертация инкрементальная: граф РуТез
+    загружается целиком (он нужен для замыкания отношений), но синсеты,
+    смыслы и отношения пересчитываются и записываются только для понятий,
+    затронутых изменениями. После неё, как и после полной конвертации,
+    нужно выполнить sql/post-conversion.sql.
+    """
+    graph = Graph.from_database(conn)
+    closure = HierarchyClosure(graph)
+
+    affected = None
+    if changed_concepts is not None:
+        affected = expand_changed_concepts(graph, changed_concepts)
+        logging.info(
+            "%s concepts changed, %s concepts affected",
+            len(changed_concepts),
+            len(affected),
+        )
+    inserter = SoftInserter(conn, batch_size, affected)
+
+    # Синсеты понятий по частям речи
+    synset_ids = {}
+
+    count = len(graph)
+    i = 0
+    logging.info("Processing concepts (%s)...", count)
+    for cid in graph:
+        i += 1
+
+        # Текстовые входы тех типов, которые можно экспортировать
+        entries = [entry for entry in graph.entries(cid) if entry.part_of_speech]
+
+        # Определение, в каких частях речи представлено понятие
+        poses = {entry.part_of_speech for entry in entries}
+
+        pos_to_concept_id = {}
+
+        # Создание синсета для каждой из частей речи
+        for pos in poses:
+            synset_data = {
+                "id": gen_synset_index(cid, pos),
+                "name": graph.concept_name(cid),
+                "definition": graph.gloss(cid),
+                "part_of_speech": pos,
+                "concept_id": cid,
+            }
+            pos_to_concept_id[pos] = synset_data["id"]
+            if affected is not None and cid not in affected:
+                continue
+            if dry_run:
+                logging.info(synset_data)
+            else:
+                inserter.insert_synset(synset_data)
 
-            -- Остальные связки от текущего понятия
-            INNER JOIN synonyms s3
-              ON s3.concept_id = s.concept_id
+        synset_ids[cid] = pos_to_concept_id
 
-          GROUP BY t.id, c.id
-          ORDER BY t.name NULLS LAST"""
-        cur.execute(sql)
+        if affected is not None and cid not in affected:
+            continue
 
-        concepts = {}
-        # обработка данных из БД
-        for row in cur:
-            cid = row["c_id"]
-            row["name"] = row["name"].strip()
-            row["poses"] = row["pos_string"]
-            # если текстовый вход многозначный — проставляем номер значения
-            if len(row["concept_ids"]) > 1:
-                row["meaning"] = sorted(row["concept_ids"]).index(cid) + 1
+        # Создание понятий
+        for entry in entries:
+            sense_data = {
+                "id": gen_sense_index(cid, entry.part_of_speech, entry.id),
+                "synset_id": gen_synset_index(cid, entry.part_of_speech),
+                "name": entry.name.strip(),
+                "lemma": entry.lemma,
+                "synt_type": entry.synt_type,
+                "meaning": entry.meaning,
+                "main_word": entry.main_word,
+                "poses": entry.poses,
+                "concept_id": cid,
+                "text_entry_id": entry.id,
+            }
+            if dry_run:
+                logging.info(sense_data)
             else:
-                row["meaning"] = 0
-            # накопление понятий
-            if cid not in concepts:
-                concept = {
-                    "id": cid,
-                    "name": row["c_name"],
-                    "gloss": row["gloss"],
-                    "relations": [],
-                    "entries": [],
-                }
-                concepts[cid] = concept
-            # если текстовый вход имеет тип из списка для экспорта, он добавляется к понятию
-            if row["synt_type"] in ALL_TYPES:
-                entry = {
-                    k: row[k]
-                    for k in (
-                        "id",
-                        "name",
-                        "lemma",
-                        "synt_type",
-                        "meaning",
-                        "main_word",
-                        "poses",
-                    )
-                }
-                entry["part_of_speech"] = get_part_of_speech(entry["synt_type"])
-                concepts[cid]["entries"].append(entry)
-
-        logging.info("{0} entries found.".format(cur.rowcount))
-
-        logging.info("Fetching relations...")
-        sql = """
-          SELECT r.*
-          FROM relations r
-          INNER JOIN concepts c1
-            ON c1.id = r.from_id
-          INNER JOIN concepts c2
-            ON c2.id = r.to_id
-          -- Связи с понятием-доменом особенные: они могут идти из различных
-          -- частей речи к существительным, поэтому будут добавлены отдельно
-          WHERE r.name != 'ДОМЕН'"""
-        cur.execute(sql)
-        # распределение отношений по понятиям
-        for relation in cur:
-            concepts[relation["from_id"]]["relations"].append(relation)
-
-        count = len(concepts)
-        i = 0
-        logging.info("Processing concepts (%s)...", count)
-        for cid, concept in concepts.items():
-            i += 1
-
-            # Определение, в каких частях речи представлено понятие
-            poses = {entry["part_of_speech"] for entry in concept["entries"]}
-
-            pos_to_concept_id = {}
-
-            # Создание синсета для каждой из частей речи
-            for pos in poses:
-                synset_data = {
-                    "id": gen_synset_index(cid, pos),
-                    "name": concept["name"],
-                    "definition": concept["gloss"],
-                    "part_of_speech": pos,
-                }
-                if dry_run:
-                    logging.info(synset_data)
-                else:
-                    inserter.insert_synset(synset_data)
-                pos_to_concept_id[pos] = synset_data["id"]
-
-            concepts[cid]["synset_ids"] = pos_to_concept_id
-
-            # Создание понятий
-            for entry in concept["entries"]:
-                sense_data = {
-                    "id": gen_sense_index(cid, entry["part_of_speech"], entry["id"]),
-                    "synset_id": gen_synset_index(cid, entry["part_of_speech"]),
-                    "name": entry["name"],
-                    "lemma": entry["lemma"],
-                    "synt_type": entry["synt_type"],
-                    "meaning": entry["meaning"],
-                    "main_word": entry["main_word"],
-                    "poses": entry["poses"],
-                }
-                if dry_run:
-                    logging.info(sense_data)
-                else:
-                    inserter.insert_sense(sense_data)
-
-            if not dry_run:
-                print(
-                    "\rProgress: {0}% ({1})".format(round(i / count * 100), i),
-                    end="",
-                    flush=True,
-                )
+                inserter.insert_sense(sense_data)
 
-        print()
-        logging.info("Processing relations...")
-        i = 0
-        for cid, concept in concepts.items():
-            i += 1
-            # Частеречная синонимия
-            for parent_pos, parent_id in concept["synset_ids"].items():
-                for child_pos, child_id in concept["synset_ids"].items():
-                    if parent_pos != child_pos:
+        if not dry_run:
+            print(
+                "\rProgress: {0}% ({1})".format(round(i / count * 100), i),
+                end="",
+                flush=True,
+            )
+
+    print()
+    logging.info("Processing relations...")
+    i = 0
+    for cid in graph:
+        i += 1
+        if affected is not None and cid not in affected:
+            continue
+        # Частеречная синонимия
+        for parent_pos, parent_id in synset_ids[cid].items():
+            for child_pos, child_id in synset_ids[cid].items():
+                if parent_pos != child_pos:
+                    relation_data = {
+                        "parent_id": parent_id,
+                        "child_id": child_id,
+                        "name": "POS-synonymy",
+                    }
+                    if dry_run:
+                        logging.info(relation_data)
+                    else:
+                        inserter.insert_synset_relation(relation_data)
+
+        # Остальные отношения
+        for pos, synset_id in synset_ids[cid].items():
+            relations = []
+            for relation in graph.relations(cid):
+                if relation.name not in SKIPPED_RELATIONS:
+                    relations += closure.fix(relation, pos)
+
+            relations = uniqify(relations, lambda r: (r.to_id, r.name))
+
+            for relation in relations:
+                # NOTE Возможно это проверка лишняя
+                if pos in synset_ids[relation.to_id]:
+                    relation_name = get_relation_name(relation, pos)
+                    if relation_name is not None:
                         relation_data = {
-                            "parent_id": parent_id,
-                            "child_id": child_id,
-                            "name": "POS-synonymy",
+                            "parent_id": synset_id,
+                            "child_id": gen_synset_index(relation.to_id, pos),
+                            "name": relation_name,
                         }
                         if dry_run:
                             logging.info(relation_data)
                         else:
                             inserter.insert_synset_relation(relation_data)
 
-            # Остальные отношения
-            for pos, synset_id in concept["synset_ids"].items():
-                relations = []
-                for relation in concept["relations"]:
-                    relations += fix_relation(concepts, relation, POS_TYPE_MAP[pos])
-
-                relations = uniqify(relations, lambda r: "{to_id}|{name}".format(**r))
-
-                for relation in relations:
-                    to_concept = concepts[relation["to_id"]]
-                    # NOTE Возможно это проверка лишняя
-                    if pos in to_concept["synset_ids"]:
-                        relation_name = get_relation_name(relation, pos)
-                        if relation_name is not None:
-                            relation_data = {
-                                "parent_id": synset_id,
-                                "child_id": gen_synset_index(to_concept["id"], pos),
-                                "name": relation_name,
-                            }
-                            if dry_run:
-                                logging.info(relation_data)
-                            else:
-                                inserter.insert_synset_relation(relation_data)
-
-            if not dry_run:
-                print(
-                    "\rProgress: {0}% ({1})".format(round(i / count * 100), i),
-                    end="",
-                    flush=True,
-                )
-        conn.commit()
-        print()
+        if not dry_run:
+            print(
+                "\rProgress: {0}% ({1})".format(round(i / count * 100), i),
+                end="",
+                flush=True,
+            )
+    print()
+    if affected is not None and not dry_run:
+        inserter.delete_stale()
+    inserter.flush()
+    conn.commit()
+
+
+def expand_changed_concepts(graph, changed_concepts) -> set:
+    """
+    Определяет понятия, синсеты и отношения которых нужно пересчитать:
+    - сами изменённые понятия;
+    - понятия с общими многозначными текстовыми входами (номера значений);
+    - понятия, у которых есть отношения к изменённым;
+    - понятия, отношения которых могут дойти до изменённых через замыкание
+      ВЫШЕ/НИЖЕ (см. HierarchyClosure): от каждого затронутого понятия, в котором
+      представлены не все части речи, идём дальше против направления отношений.
+    Изменённые понятия считаются проходными, их прежний состав неизвестен.
+    """
+    incoming = defaultdict(list)
+    for relation in graph.all_relations():
+        if relation.name not in SKIPPED_RELATIONS:
+            incoming[relation.to_id].append(relation)
+
+    affected = set(changed_concepts)
+    for cid in changed_concepts:
+        if cid in graph:
+            for entry in graph.entries(cid):
+                affected.update(graph.concepts_of_entry(entry.id))
+
+    all_poses = functools.reduce(operator.or_, POS_BITS.values())
+    queue = deque(affected)
+    passed = set(affected)
+    while queue:
+        cid = queue.popleft()
+        for relation in incoming[cid]:
+            from_id = relation.from_id
+            affected.add(from_id)
+            if (
+                relation.name in HierarchyClosure.HIERARCHY_RELATIONS
+                and graph.pos_mask(from_id) != all_poses
+                and from_id not in passed
+            ):
+                passed.add(from_id)
+                queue.append(from_id)
+    return affected
 
 
 def gen_synset_index(concept_id, part_of_speech) -> str:
@@ -269,17 +323,51 @@ def gen_sense_index(concept_id, part_of_speech, entry_id) -> str:
 
 
 class SoftInserter:
-    def __init__(self, connection):
+    """
+    Накапливает строки для каждой таблицы и записывает их пачками
+    (многострочный INSERT ... ON CONFLICT DO NOTHING). Уже существующие
+    в базе записи отсеиваются по кэшам ещё до записи.
+
+    Если передан concept_ids, кэши заполняются только записями этих понятий
+    (инкрементальный режим): изменившиеся синсеты и смыслы обновляются,
+    а не порождённые заново записи удаляются в delete_stale(). Всё
+    записывается одной транзакцией при вызове flush().
+    """
+
+    # Порядок важен: смыслы и отношения ссылаются на синсеты
+    FIELDS = {
+        "synsets": ("id", "name", "definition", "part_of_speech", "concept_id"),
+        "senses": (
+            "id",
+            "synset_id",
+            "name",
+            "lemma",
+            "synt_type",
+            "meaning",
+            "main_word",
+            "poses",
+            "concept_id",
+            "text_entry_id",
+        ),
+        "synset_relations": ("parent_id", "child_id", "name"),
+    }
+
+    def __init__(self, connection, batch_size=10000, concept_ids=None):
         self.connection = connection
-        self.cursor = connection.cursor()
-        self.synset_query = None
-        self.sense_query = None
-        self.synset_relation_query = None
+        self.batch_size = batch_size
+        self.concept_ids = concept_ids
+        self.buffers = {table: [] for table in self.FIELDS}
+        self.updates = {table: [] for table in ("synsets", "senses")}
 
         self.synsets = set()
         self.senses = set()
         self.synset_relations = set()
-        self.fill_caches()
+        # Записи затронутых понятий, которые уже есть в базе (инкрементальный режим)
+        self.existing = {table: {} for table in self.FIELDS}
+        if concept_ids is None:
+            self.fill_caches()
+        else:
+            self.fill_existing()
 
     def fill_caches(self):
         with self.connection.cursor() as cursor:
@@ -292,154 +380,182 @@ class SoftInserter:
             cursor.execute("SELECT parent_id, child_id, name FROM synset_relations")
             self.synset_relations = {tuple(row) for row in cursor}
 
+    def fill_existing(self):
+        concept_ids = list(self.concept_ids)
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT {fields}
+                FROM synsets
+                WHERE concept_id = ANY(%s)""".format(
+                    fields=", ".join(self.FIELDS["synsets"])
+                ),
+                (concept_ids,),
+            )
+            self.existing["synsets"] = {row[0]: row[1:] for row in cursor}
+            synset_ids = list(self.existing["synsets"])
+
+            cursor.execute(
+                """
+                SELECT {fields}
+                FROM senses
+                WHERE synset_id = ANY(%s)""".format(
+                    fields=", ".join(self.FIELDS["senses"])
+                ),
+                (synset_ids,),
+            )
+            self.existing["senses"] = {row[0]: row[1:] for row in cursor}
+
+            cursor.execute(
+                """
+                SELECT parent_id, child_id, name
+                FROM synset_relations
+                WHERE parent_id = ANY(%s)
+                  AND name = ANY(%s)""",
+                (synset_ids, sorted(GENERATED_RELATIONS)),
+            )
+            self.existing["synset_relations"] = {tuple(row) for row in cursor}
+
     def insert_synset(self, data):
         if data["id"] in self.synsets:
             logging.debug("Skip existing synset: %s", data["id"])
             return
-        self.do_insert(self.get_synset_query(), data, "synset")
+        self.synsets.add(data["id"])
+        self.add_or_update_row("synsets", data)
 
     def insert_sense(self, data):
         if data["id"] in self.senses:
             logging.debug("Skip existing sense: %s", data["id"])
             return
-        self.do_insert(self.get_sense_query(), data, "sense")
+        self.senses.add(data["id"])
+        self.add_or_update_row("senses", data)
 
     def insert_synset_relation(self, data):
-        if (data["parent_id"], data["child_id"], data["name"]) in self.synset_relations:
+        key = (data["parent_id"], data["child_id"], data["name"])
+        if key in self.synset_relations:
             logging.debug("Skip existing synset relation: %s", data)
             return
-        self.do_insert(self.get_synset_relation_query(), data, "relation")
-
-    def do_insert(self, sql, data, mark: str):
-        try:
-            self.cursor.execute(sql, data)
-            self.connection.commit()
-        except errors.UniqueViolation:
-            logging.debug("Insert failed for %s %s", mark, data)
-            self.connection.rollback()
-
-    def get_synset_query(self) -> str:
-        if self.synset_query is None:
-            fields = ("id", "name", "definition", "part_of_speech")
-            self.synset_query = self.make_insert_query("synsets", fields, self.cursor)
-        return self.synset_query
-
-    def get_sense_query(self) -> str:
-        if self.sense_query is None:
-            fields = (
-                "id",
-                "synset_id",
-                "name",
-                "lemma",
-                "synt_type",
-                "meaning",
-                "main_word",
-                "poses",
-            )
-            self.sense_query = self.make_insert_query("senses", fields, self.cursor)
-        return self.sense_query
-
-    def get_synset_relation_query(self) -> str:
-        if self.synset_relation_query is None:
-            fields = (
-                "parent_id",
-                "child_id",
-                "name",
-            )
-            self.synset_relation_query = self.make_insert_query(
-                "synset_relations", fields, self.cursor
-            )
-        return self.synset_relation_query
+        self.synset_relations.add(key)
+        if key not in self.existing["synset_relations"]:
+            self.add_row("synset_relations", data)
+
+    def add_or_update_row(self, table, data):
+        existing = self.existing[table]
+        if data["id"] not in existing:
+            self.add_row(table, data)
+            return
+        values = tuple(data[field] for field in self.FIELDS[table][1:])
+        if values != existing[data["id"]]:
+            logging.debug("Update %s: %s", table, data["id"])
+            self.updates[table].append(data)
+
+    def add_row(self, table, data):
+        buffer = self.buffers[table]
+        buffer.append(data)
+        # В инкрементальном режиме всё пишется одной транзакцией в конце
+        if self.concept_ids is None and len(buffer) >= self.batch_size:
+            self.flush()
+
+    def delete_stale(self):
+        """
+        Удаляет записи затронутых понятий, которые не были порождены заново.
+        Вызывается перед flush(), чтобы новые записи не конфликтовали
+        с устаревшими по уникальным ключам.
+        """
+        # Смыслы устаревших синсетов тоже есть в existing и заново не порождены
+        stale_relations = self.existing["synset_relations"] - self.synset_relations
+        stale_senses = list(self.existing["senses"].keys() - self.senses)
+        stale_synsets = list(self.existing["synsets"].keys() - self.synsets)
+        logging.info(
+            "Delete stale rows: %s synsets, %s senses, %s synset relations",
+            len(stale_synsets),
+            len(stale_senses),
+            len(stale_relations),
+        )
+        with self.connection.cursor() as cursor:
+            if stale_relations:
+                extras.execute_values(
+                    cursor,
+                    """
+                    DELETE FROM synset_relations sr
+                    USING (VALUES %s) v (parent_id, child_id, name)
+                    WHERE sr.parent_id = v.parent_id
+                      AND sr.child_id = v.child_id
+                      AND sr.name = v.name""",
+                    list(stale_relations),
+                    page_size=self.batch_size,
+                )
+            if stale_senses:
+                cursor.execute(
+                    "DELETE FROM sense_relations WHERE parent_id = ANY(%s) OR child_id = ANY(%s)",
+                    (stale_senses, stale_senses),
+                )
+                cursor.execute("DELETE FROM senses WHERE id = ANY(%s)", (stale_senses,))
+            if stale_synsets:
+                cursor.execute(
+                    "DELETE FROM synset_relations WHERE parent_id = ANY(%s) OR child_id = ANY(%s)",
+                    (stale_synsets, stale_synsets),
+                )
+                cursor.execute(
+                    "DELETE FROM synsets WHERE id = ANY(%s)", (stale_synsets,)
+                )
+
+    def flush(self):
+        with self.connection.cursor() as cursor:
+            for table, rows in self.updates.items():
+                if not rows:
+                    continue
+                fields = self.FIELDS[table]
+                logging.debug("Update %s rows in %s", len(rows), table)
+                extras.execute_values(
+                    cursor,
+                    self.make_update_query(table, fields),
+                    rows,
+                    template=self.make_template(fields),
+                    page_size=self.batch_size,
+                )
+                rows.clear()
+            for table, fields in self.FIELDS.items():
+                rows = self.buffers[table]
+                if not rows:
+                    continue
+                logging.debug("Flush %s rows into %s", len(rows), table)
+                extras.execute_values(
+                    cursor,
+                    self.make_insert_query(table, fields),
+                    rows,
+                    template=self.make_template(fields),
+                    page_size=self.batch_size,
+                )
+                rows.clear()
+        self.connection.commit()
 
     @staticmethod
-    def make_insert_query(table, fields, cur):
-        fields = sorted(fields)
-        fields_str = ", ".join(fields)
-        dollars = ", ".join("$" + str(i + 1) for i, _ in enumerate(fields))
-        placeholders = ", ".join("%({0})s".format(f) for f in fields)
-
-        sql_str = "EXECUTE prepared_query_{table} ({placeholders})".format(
-            placeholders=placeholders, table=table
+    def make_insert_query(table, fields) -> str:
+        return "INSERT INTO {tbl} ({fields}) VALUES %s ON CONFLICT DO NOTHING".format(
+            tbl=table, fields=", ".join(fields)
         )
 
-        sql = "PREPARE prepared_query_{table} AS ".format(
-            table=table
-        ) + "INSERT INTO {tbl} ({fields}) VALUES ({dollars})".format(
-            fields=fields_str, dollars=dollars, tbl=table
+    @staticmethod
+    def make_update_query(table, fields) -> str:
+        return (
+            "UPDATE {tbl} t SET {assignments} FROM (VALUES %s) v ({fields})"
+            " WHERE t.id = v.id"
+        ).format(
+            tbl=table,
+            assignments=", ".join("{0} = v.{0}".format(f) for f in fields[1:]),
+            fields=", ".join(fields),
         )
 
-        cur.execute(sql)
-        return sql_str
-
-
-def get_part_of_speech(synt_type):
-    for pos, types in POS_TYPE_MAP.items():
-        if synt_type in types:
-            return pos
-
-
-def uniqify(seq, idfun=None):
-    # order preserving
-    if idfun is None:
-        idfun = lambda x: x
-
-    seen = set()
-    for item in seq:
-        marker = idfun(item)
-        if marker in seen:
-            continue
-        seen.add(marker)
-        yield item
-
-
-def fix_relation(concepts, relation, types, path=None) -> list:
-    """
-    Проверяем текущее отношение - оно должно указывать на понятие
-    с не пустыми текстовыми входами. Если отношение не проходит
-    проверку, спускаемся по иерархии отношений вниз и повторяем
-    проверку для низлежащих отношений.
-
-    :param path:
-    :param types:
-    :param concepts:
-    :param relation:
-    :return:
-    """
-    if path is None:
-        path = []
-    # Это отношение уже рассматривалось
-    if relation in path:
-        return []
-    path.append(relation)
-    if relation["to_id"] in concepts:
-        # Берём понятие, на которое указывает данное отношение
-        toc = concepts[relation["to_id"]]
-        if len([entry for entry in toc["entries"] if entry["synt_type"] in types]) > 0:
-            # Если у понятия есть текстовые входы запрошенного типа, значит отношение нам подходит
-            return [relation]
-        # Отношение не подходит
-        # Замыкание предусмотрено не для всех типов связей
-        if relation["name"] not in {
-            "НИЖЕ",
-            "ВЫШЕ",
-        }:
-            return []
-        # Спускаемся ниже по иерархии
-        relations = []
-        # Смотрим все отношения низлежащего понятия
-        for rel in toc["relations"]:
-            # Проверяем, чтобы тип отношения совпадал с исходным отношением
-            if rel["name"] == relation["name"]:
-                # И запускаем проверку этого отношения
-                relations += fix_relation(concepts, rel, types, path)
-        return relations
-    return []
+    @staticmethod
+    def make_template(fields) -> str:
+        return "(" + ", ".join("%({0})s".format(f) for f in fields) + ")"
 
 
 def get_relation_name(relation, pos):
-    rel_type = relation["name"]
-    asp = relation["asp"]
-    version = relation["version"]
+    rel_type = relation.name
+    asp = relation.asp
+    version = relation.version
 
     # Для новых отношений берём для начала самые простые типы
     if version != "initial" and rel_type not in {"ВЫШЕ", "НИЖЕ"}:
@@ -1,12 +1,17 @@
 #!/usr/bin/env python3
 
 import argparse
+import gzip
+import itertools
 import logging
-from collections import defaultdict
+import sys
+from contextlib import ExitStack
 
 from lxml import etree
 from psycopg2 import connect, extras
 
+from ruwordnet.lmf import DTD_URL, LmfValidator
+
 parser = argparse.ArgumentParser(description="Generate RuWordNet OMW xml files")
 connection_string = (
     "host='localhost' dbname='ruwordnet' user='ruwordnet' password='ruwordnet'"
@@ -19,6 +24,13 @@ parser.add_argument(
     default=connection_string,
 )
 parser.add_argument("-l", "--level", help="Logging level", default=logging.INFO)
+parser.add_argument("-o", "--output", help="Output file (default: stdout)", default="-")
+parser.add_argument("-z", "--gzip", action="store_true", help="Compress output")
+parser.add_argument(
+    "--validate",
+    action="store_true",
+    help="Validate output against WN-LMF-1.0.dtd while writing",
+)
 
 ARGS = parser.parse_args()
 
@@ -28,6 +40,9 @@ extras.register_uuid()
 
 LEXICON_ID = "RuWordNet"
 
+# Количество строк, получаемых за раз из серверного курсора
+ITERSIZE = 10000
+
 allowed_synset_relations = {
     "agent",
     "also",
@@ -154,168 +169,226 @@ def sense_id(data):
     )
 
 
-def run(connection):
-    nsmap = {"dc": "http://purl.org/dc/elements/1.1/"}
-    LexicalResource = etree.Element("LexicalResource", nsmap=nsmap)
-    Lexicon = etree.SubElement(
-        LexicalResource,
-        "Lexicon",
-        id=LEXICON_ID,
-        label="RuWordNet",
-        language="ru",
-        email="john.doe@example.com",
-        license="proprietary",
-        version="1.0",
-        citation="TODO",
-        url="http://ruwordnet.ru",
-    )
-
-    with connection.cursor(cursor_factory=extras.RealDictCursor) as cur:
-        logging.info("Selecting all data...")
-
-        logging.info("sense relations")
-        cur.execute(
-            """
-            SELECT
-              ser.parent_id,
-              ser.child_id,
-              ser.name,
-              c.id concept_id,
-              LOWER(sy.part_of_speech) part_of_speech,
-              t.id text_entry_id
-            FROM sense_relations ser
-              JOIN senses se ON se.id = ser.child_id
-              JOIN synsets sy ON sy.id = se.synset_id
-              JOIN concepts c ON c.name = sy.name
-              JOIN text_entry t ON t.name = se.name
-            """
+class LmfWriter:
+    """
+    Пишет документ WN-LMF по мере порождения элементов LexicalEntry и Synset
+    (etree.xmlfile). Результат совпадает с pretty_print-сериализацией всего
+    дерева. Если передан validator, записанные байты передаются и ему.
+    """
+
+    def __init__(self, file, validator=None):
+        self.file = file
+        self.validator = validator
+        self.xf_context = None
+        self.xf = None
+        self.elements = []
+
+    def write(self, data: bytes):
+        self.file.write(data)
+        if self.validator is not None:
+            self.validator.feed(data)
+
+    def __enter__(self):
+        self.xf_context = etree.xmlfile(self, encoding="utf-8")
+        self.xf = self.xf_context.__enter__()
+        self.xf.write_declaration()
+        self.xf.write_doctype('<!DOCTYPE LexicalResource SYSTEM "{}">'.format(DTD_URL))
+        self.open_element(
+            "LexicalResource", nsmap={"dc": "http://purl.org/dc/elements/1.1/"}
         )
-        sense_relations = defaultdict(list)
-        for row in cur:
-            sense_relations[row["parent_id"]].append(row)
-
-        logging.info("senses")
-        cur.execute(
-            """
-            SELECT
-              se.id,
-              se.synset_id,
-              LOWER(se.name) "name",
-              LOWER(se.lemma) lemma,
-              t.id text_entry_id,
-              LOWER(sy.part_of_speech) part_of_speech,
-              c.id concept_id
-            FROM senses se
-              JOIN synsets sy ON sy.id = se.synset_id
-              JOIN concepts c ON c.name = sy.name
-              JOIN text_entry t ON t.name = se.name
-            """
+        self.xf.write("\n  ")
+        self.open_element(
+            "Lexicon",
+            {
+                "id": LEXICON_ID,
+                "label": "RuWordNet",
+                "language": "ru",
+                "email": "john.doe@example.com",
+                "license": "proprietary",
+                "version": "1.0",
+                "citation": "TODO",
+                "url": "http://ruwordnet.ru",
+            },
         )
-        lexical_entries = defaultdict(list)
-        for row in cur:
-            lexical_entries[row["lemma"]].append(row)
-
-        for lemma, senses in lexical_entries.items():
-            sense = senses[0]
-            LexicalEntry = etree.SubElement(
-                Lexicon, "LexicalEntry", id=str(sense["text_entry_id"])
-            )
-            etree.SubElement(
-                LexicalEntry,
-                "Lemma",
-                writtenForm=lemma,
-                partOfSpeech=pos(sense["part_of_speech"]),
+        return self
+
+    def open_element(self, *args, **kwargs):
+        element = self.xf.element(*args, **kwargs)
+        element.__enter__()
+        self.elements.append(element)
+
+    def write_element(self, element):
+        etree.indent(element, level=2)
+        element.tail = None
+        self.xf.write("\n    ", element)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            # Отступы перед </Lexicon> и </LexicalResource>
+            for indent in ("\n  ", "\n"):
+                self.xf.write(indent)
+                self.elements.pop().__exit__(None, None, None)
+        self.xf_context.__exit__(exc_type, exc_value, traceback)
+        if exc_type is None:
+            self.write(b"\n")
+        return False
+
+
+def stream(connection, sql):
+    with connection.cursor(name="omw", cursor_factory=extras.RealDictCursor) as cur:
+        cur.itersize = ITERSIZE
+        cur.execute(sql)
+        yield from cur
+
+
+def run(connection, writer):
+    logging.info("lexical entries")
+    # Смыслы упорядочены по лемме: смыслы с одной леммой образуют LexicalEntry
+    rows = stream(
+        connection,
+        """
+        SELECT
+          se.id,
+          se.synset_id,
+          LOWER(se.name) "name",
+          LOWER(se.lemma) lemma,
+          se.text_entry_id,
+          LOWER(sy.part_of_speech) part_of_speech,
+          se.concept_id,
+          (
+            SELECT json_agg(
+              json_build_object(
+                'name', ser.name,
+                'concept_id', se2.concept_id,
+                'part_of_speech', LOWER(sy2.part_of_speech),
+                'text_entry_id', se2.text_entry_id
+              )
+              ORDER BY ser.child_id, ser.name
             )
-            etree.SubElement(LexicalEntry, "Form", writtenForm=sense["name"])
-            for sense in senses:
-                Sense = etree.SubElement(
-                    LexicalEntry, "Sense", id=sense_id(sense), synset=synset_id(sense)
-                )
-
-                for relation in sense_relations[sense["id"]]:
-                    args = {"target": sense_id(relation)}
-                    relType = sense_rel(relation["name"])
-                    if relType in allowed_sense_relations:
-                        args["relType"] = relType
-                    else:
-                        args["relType"] = "other"
-                        args["note"] = relType
-                    etree.SubElement(Sense, "SenseRelation", **args)
-
-        logging.info("synset relations")
-        cur.execute(
-            """
-            SELECT
-              syr.parent_id,
-              syr.child_id,
-              syr.name,
-              LOWER(sy.part_of_speech) part_of_speech,
-              c.id concept_id
-            FROM synset_relations syr
-              JOIN synsets sy ON sy.id = syr.child_id
-              JOIN concepts c ON c.name = sy.name
-            """
-        )
-        synset_relations = defaultdict(list)
-        for row in cur:
-            synset_relations[row["parent_id"]].append(row)
-
-        logging.info("synsets")
-        cur.execute(
-            """
-            SELECT
-              sy.id,
-              sy.name,
-              sy.definition,
-              LOWER(sy.part_of_speech) part_of_speech,
-              c.id concept_id,
-              map.ili,
-              map.wn wn_id,
-              ili.wn_gloss
-            FROM synsets sy
-              JOIN concepts c ON c.name = sy.name
-              LEFT JOIN ili ON ili.concept_id = c.id
-              LEFT JOIN ili_map_wn map
-                ON map.version = 30
-                AND (
-                  map.wn = ili.wn_id
-                  OR substring(map.wn, '^\d+') = substring(ili.wn_id, '^\d+')
-                  AND ARRAY[substring(map.wn, '.$'), substring(ili.wn_id, '.$')] @> ARRAY['a', 's']
-                )
-            """
+            FROM sense_relations ser
+              JOIN senses se2 ON se2.id = ser.child_id
+              JOIN synsets sy2 ON sy2.id = se2.synset_id
+              JOIN concepts c2 ON c2.id = se2.concept_id
+              JOIN text_entry t2 ON t2.id = se2.text_entry_id
+            WHERE ser.parent_id = se.id
+          ) relations
+        FROM senses se
+          JOIN synsets sy ON sy.id = se.synset_id
+          JOIN concepts c ON c.id = se.concept_id
+          JOIN text_entry t ON t.id = se.text_entry_id
+        ORDER BY lemma, se.id
+        """,
+    )
+    for lemma, senses in itertools.groupby(rows, key=lambda row: row["lemma"]):
+        sense = next(senses)
+        LexicalEntry = etree.Element("LexicalEntry", id=str(sense["text_entry_id"]))
+        etree.SubElement(
+            LexicalEntry,
+            "Lemma",
+            writtenForm=lemma,
+            partOfSpeech=pos(sense["part_of_speech"]),
         )
-        for synset in cur:
-            args = {
-                "id": synset_id(synset),
-                "partOfSpeech": pos(synset["part_of_speech"]),
-            }
-            if (
-                synset["wn_id"] is not None
-                and args["partOfSpeech"] == synset["wn_id"][-1]
-            ):
-                args["ili"] = synset["ili"]
-                args["note"] = synset["wn_id"]
-            Synset = etree.SubElement(Lexicon, "Synset", **args)
-
-            for relation in synset_relations[synset["id"]]:
-                args = {"target": synset_id(relation)}
-                relType = synset_rel(relation["name"])
-                if relType in allowed_synset_relations:
+        etree.SubElement(LexicalEntry, "Form", writtenForm=sense["name"])
+        for sense in itertools.chain((sense,), senses):
+            Sense = etree.SubElement(
+                LexicalEntry, "Sense", id=sense_id(sense), synset=synset_id(sense)
+            )
+
+            for relation in sense["relations"] or ():
+                args = {"target": sense_id(relation)}
+                relType = sense_rel(relation["name"])
+                if relType in allowed_sense_relations:
                     args["relType"] = relType
                 else:
                     args["relType"] = "other"
                     args["note"] = relType
-                etree.SubElement(Synset, "SynsetRelation", **args)
-
-        print(
-            etree.tostring(
-                LexicalResource,
-                encoding="utf-8",
-                pretty_print=True,
-                xml_declaration=True,
-                doctype='<!DOCTYPE LexicalResource SYSTEM "http://globalwordnet.github.io/schemas/WN-LMF-1.0.dtd">',
-            ).decode()
-        )
-
-
-run(connect(ARGS.connection_string))
+                etree.SubElement(Sense, "SenseRelation", **args)
+        writer.write_element(LexicalEntry)
+
+    logging.info("synsets")
+    rows = stream(
+        connection,
+        """
+        SELECT
+          sy.id,
+          sy.name,
+          sy.definition,
+          LOWER(sy.part_of_speech) part_of_speech,
+          sy.concept_id,
+          map.ili,
+          map.wn wn_id,
+          ili.wn_gloss,
+          (
+            SELECT json_agg(
+              json_build_object(
+                'name', syr.name,
+                'concept_id', sy2.concept_id,
+                'part_of_speech', LOWER(sy2.part_of_speech)
+              )
+              ORDER BY syr.child_id, syr.name
+            )
+            FROM synset_relations syr
+              JOIN synsets sy2 ON sy2.id = syr.child_id
+              JOIN concepts c2 ON c2.id = sy2.concept_id
+            WHERE syr.parent_id = sy.id
+          ) relations
+        FROM synsets sy
+          JOIN concepts c ON c.id = sy.concept_id
+          LEFT JOIN ili ON ili.concept_id = c.id
+          LEFT JOIN ili_map_wn map
+            ON map.version = 30
+            AND (
+              map.wn = ili.wn_id
+              OR substring(map.wn, '^\d+') = substring(ili.wn_id, '^\d+')
+              AND ARRAY[substring(map.wn, '.$'), substring(ili.wn_id, '.$')] @> ARRAY['a', 's']
+            )
+        ORDER BY sy.id, ili.wn_id, map.ili
+        """,
+    )
+    for synset in rows:
+        args = {
+            "id": synset_id(synset),
+            "partOfSpeech": pos(synset["part_of_speech"]),
+        }
+        if synset["wn_id"] is not None and args["partOfSpeech"] == synset["wn_id"][-1]:
+            args["ili"] = synset["ili"]
+            args["note"] = synset["wn_id"]
+        Synset = etree.Element("Synset", **args)
+
+        for relation in synset["relations"] or ():
+            args = {"target": synset_id(relation)}
+            relType = synset_rel(relation["name"])
+            if relType in allowed_synset_relations:
+                args["relType"] = relType
+            else:
+                args["relType"] = "other"
+                args["note"] = relType
+            etree.SubElement(Synset, "SynsetRelation", **args)
+        writer.write_element(Synset)
+
+
+def main():
+    validator = LmfValidator() if ARGS.validate else None
+    connection = connect(ARGS.connection_string)
+
+    with ExitStack() as stack:
+        if ARGS.output == "-":
+            output = sys.stdout.buffer
+        else:
+            output = stack.enter_context(open(ARGS.output, "wb"))
+        if ARGS.gzip:
+            output = stack.enter_context(gzip.GzipFile(fileobj=output, mode="wb"))
+        writer = stack.enter_context(LmfWriter(output, validator))
+        run(connection, writer)
+
+    if validator is not None:
+        errors = validator.close()
+        for error in errors[:100]:
+            logging.error(error)
+        if errors:
+            logging.error("Document is invalid (%s errors reported)", len(errors))
+            sys.exit(1)
+        logging.info("Document is valid")
+
+
+main()
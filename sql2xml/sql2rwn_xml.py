@@ -1,9 +1,12 @@
 #!/usr/bin/env python3
 
 import argparse
+import itertools
 import logging
 import os
 from collections import defaultdict
+from contextlib import ExitStack
+from multiprocessing import Pool
 
 from lxml import etree
 from nltk.corpus import wordnet as wn
@@ -11,6 +14,55 @@ from psycopg2 import connect, extras
 
 PKG_ROOT = os.path.dirname(os.path.abspath(__file__))
 
+POSES = ("N", "V", "Adj")
+
+# Файлы, выгружаемые отдельно для каждой части речи
+POS_ENTITIES = ("synsets", "senses", "synset_relations")
+
+# Корневые элементы файлов
+ROOT_TAGS = {
+    "synsets": "synsets",
+    "senses": "senses",
+    "synset_relations": "relations",
+    "composed_of": "senses",
+    "derived_from": "senses",
+    "ili": "ili",
+}
+
+# Все выгружаемые файлы: сущность и часть речи
+TASKS = [(entity, pos) for pos in POSES for entity in POS_ENTITIES] + [
+    ("composed_of", None),
+    ("derived_from", None),
+    ("ili", None),
+]
+
+# Количество строк, получаемых за раз из серверного курсора
+ITERSIZE = 10000
+
+# Смыслы вместе с понятием и текстовым входом (атрибуты элемента sense)
+SENSES_SQL = """
+  SELECT
+    senses.id,
+    senses.synset_id,
+    senses.name,
+    senses.lemma,
+    senses.main_word,
+    senses.synt_type,
+    senses.poses,
+    senses.meaning,
+    synsets.part_of_speech,
+    c.id concept_id,
+    t.id entry_id
+  FROM synsets
+  INNER JOIN senses ON synsets.id = senses.synset_id
+  INNER JOIN concepts c ON c.id = senses.concept_id
+  INNER JOIN text_entry t ON t.id = senses.text_entry_id
+  {filter}
+"""
+
+# Генератор процесса-исполнителя при параллельной выгрузке
+worker_generator = None
+
 
 def main():
     logging.basicConfig(level=logging.INFO)
@@ -31,205 +83,205 @@ def main():
         help="A directory where xml-files will be saved",
         default=os.path.join(PKG_ROOT, "out", "rwn"),
     )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        help="Number of processes writing files in parallel",
+        default=1,
+    )
 
     ARGS = parser.parse_args()
 
+    if ARGS.jobs > 1:
+        run_parallel(ARGS.connection_string, ARGS.output_directory, ARGS.jobs)
+        return
+
     generator = Generator(
         out_dir=ARGS.output_directory, connection=connect(ARGS.connection_string)
     )
     generator.run()
 
 
+def run_parallel(connection_string: str, out_dir: str, jobs: int):
+    """
+    Распределяет выгрузку по процессам: каждый файл (сущность и часть речи)
+    порождается отдельной задачей со своим соединением с базой.
+    """
+    logging.info("Start (%s jobs)", jobs)
+    with Pool(jobs, init_worker, (connection_string, out_dir)) as pool:
+        for _ in pool.imap_unordered(export_task, TASKS):
+            pass
+    logging.info("Done")
+
+
+def init_worker(connection_string: str, out_dir: str):
+    global worker_generator
+    logging.basicConfig(level=logging.INFO)
+    worker_generator = Generator(out_dir=out_dir, connection=connect(connection_string))
+
+
+def export_task(task):
+    worker_generator.export(*task)
+
+
 class Generator:
     def __init__(self, out_dir: str, connection):
         self.connection = connection
         self.out_dir = out_dir
-        self.synset_counter = 0
-        self.sense_counter = 0
-        self.synsets = []
-        self.senses = []
-        self.synset_relations = []
-        self.ili = []
 
     def run(self):
         logging.info("Start")
-
-        with self.connection.cursor(cursor_factory=extras.RealDictCursor) as cur:
-            logging.info("Selecting all data...")
-            logging.info("synsets")
-            cur.execute(
-                """
-                SELECT
-                  synsets.*,
-                  c.id concept_id,
-                  array_agg(senses.id) senses
-                FROM synsets
-                INNER JOIN senses ON synsets.id = senses.synset_id
-                INNER JOIN concepts c ON c.name = synsets.name
-                GROUP BY synsets.id, c.id
-                ORDER BY part_of_speech
-                """
-            )
-            self.synsets = [{**row, "relations": [],} for row in cur]
-            synsets_by_id = {synset["id"]: synset for synset in self.synsets}
-
-            logging.info("senses")
-            cur.execute(
-                """
-                SELECT
-                  senses.*,
-                  synsets.part_of_speech,
-                  c.id concept_id,
-                  t.id entry_id
-                FROM synsets
-                INNER JOIN senses ON synsets.id = senses.synset_id
-                INNER JOIN concepts c ON c.name = synsets.name
-                INNER JOIN text_entry t ON t.name = senses.name
-                """
-            )
-            self.senses = {
-                row["id"]: {**row, "meaning": int(row["meaning"]) + 1,} for row in cur
-            }
-
-            logging.info("synset relations")
-            cur.execute("SELECT * FROM synset_relations")
-            self.synset_relations = cur.fetchall()
-
-            logging.info("distribute relations...")
-            for relation in self.synset_relations:
-                synsets_by_id[relation["parent_id"]]["relations"].append(relation)
-
-            logging.info("building trees...")
-
-            current_pos = ""
-            synsets_root = None
-            senses_root = None
-            synset_relations_root = None
-
-            count = len(self.synsets)
-            for i, synset in enumerate(self.synsets):
-                if current_pos != synset["part_of_speech"]:
-                    if current_pos:
-                        print()
-                        self.write_file(synsets_root, "synsets", current_pos)
-                        self.write_file(senses_root, "senses", current_pos)
-                        self.write_file(
-                            synset_relations_root, "synset_relations", current_pos
-                        )
-                    synsets_root = etree.Element("synsets")
-                    senses_root = etree.Element("senses")
-                    synset_relations_root = etree.Element("relations")
-                    current_pos = synset["part_of_speech"]
-                    print()
-                    logging.info(f"POS: {current_pos}")
-                self.add_synset(synsets_root, synset)
-                for sense_id in synset["senses"]:
-                    self.add_sense(senses_root, self.senses[sense_id])
-                for relation in synset["relations"]:
-                    self.add_synset_relation(synset_relations_root, relation)
-                print(
-                    "\rProgress: {0}% ({1})".format(
-                        round((i + 1) / count * 100), i + 1
-                    ),
-                    end="",
-                    flush=True,
-                )
-            self.write_file(synsets_root, "synsets", current_pos)
-            self.write_file(senses_root, "senses", current_pos)
-            self.write_file(synset_relations_root, "synset_relations", current_pos)
-
-            print()
-            self.generate_composed_of_relations_file(cur)
-            self.generate_derived_from_relations_file(cur)
-            self.generate_ili_file(cur)
-
+        for entity, pos in TASKS:
+            self.export(entity, pos)
         logging.info("Done")
 
-    def write_file(self, root: etree.Element, entity: str, pos: str):
-        tree = etree.ElementTree(root)
-        filename = os.path.join(self.out_dir, "{0}.{1}.xml".format(entity, pos[0]))
-        if os.path.isfile(filename):
-            os.remove(filename)
+    def export(self, entity: str, pos: str = None):
+        """
+        Порождает один файл выгрузки. Данные читаются из серверных курсоров
+        и пишутся в файл по мере получения, поэтому файлы можно порождать
+        параллельно в разных процессах.
+        """
+        if entity == "synsets":
+            self.generate_synsets_file(pos)
+        elif entity == "senses":
+            self.generate_senses_file(pos)
+        elif entity == "synset_relations":
+            self.generate_synset_relations_file(pos)
+        elif entity == "ili":
+            self.generate_ili_file()
+        else:
+            self.generate_sense_relations_file(entity)
+        self.connection.commit()
+
+    def stream(self, sql: str, params=None, name: str = "export"):
+        with self.connection.cursor(
+            name=name, cursor_factory=extras.RealDictCursor
+        ) as cur:
+            cur.itersize = ITERSIZE
+            cur.execute(sql, params)
+            yield from cur
+
+    def open_file(self, entity: str, pos: str = None):
+        if pos is None:
+            filename = os.path.join(self.out_dir, "{}.xml".format(entity))
+        else:
+            filename = os.path.join(self.out_dir, "{0}.{1}.xml".format(entity, pos[0]))
         logging.info("Output file: " + filename)
-        tree.write(filename, encoding="utf-8", pretty_print=True)
+        return ElementWriter(filename, ROOT_TAGS[entity])
+
+    def generate_synsets_file(self, pos: str):
+        rows = self.stream(
+            """
+            SELECT
+              synsets.*,
+              array_agg(senses.id ORDER BY senses.id) senses,
+              array_agg(senses.lemma ORDER BY senses.id) lemmas
+            FROM synsets
+            INNER JOIN senses ON synsets.id = senses.synset_id
+            INNER JOIN concepts c ON c.id = synsets.concept_id
+            WHERE synsets.part_of_speech = %(pos)s
+            GROUP BY synsets.id
+            ORDER BY synsets.id
+            """,
+            {"pos": pos},
+        )
+        with self.open_file("synsets", pos) as writer:
+            for row in rows:
+                writer.write(self.make_synset(row))
+
+    def generate_senses_file(self, pos: str):
+        # Смыслы идут в порядке синсетов (как в файле синсетов)
+        rows = self.stream(
+            SENSES_SQL.format(filter="WHERE synsets.part_of_speech = %(pos)s")
+            + "ORDER BY senses.synset_id, senses.id",
+            {"pos": pos},
+        )
+        with self.open_file("senses", pos) as writer:
+            for row in rows:
+                writer.write(self.make_sense(row))
+
+    def generate_synset_relations_file(self, pos: str):
+        rows = self.stream(
+            """
+            SELECT synset_relations.*
+            FROM synset_relations
+            INNER JOIN synsets ON synsets.id = synset_relations.parent_id
+            INNER JOIN concepts c ON c.id = synsets.concept_id
+            WHERE synsets.part_of_speech = %(pos)s
+              AND EXISTS (SELECT 1 FROM senses WHERE synset_id = synsets.id)
+            ORDER BY parent_id, child_id, synset_relations.name
+            """,
+            {"pos": pos},
+        )
+        with self.open_file("synset_relations", pos) as writer:
+            for row in rows:
+                writer.write(self.make_element("relation", row))
 
-    def add_synset(self, root: etree.Element, row: dict):
-        synset = etree.SubElement(root, "synset")
+    @staticmethod
+    def make_synset(row: dict) -> etree.Element:
+        synset = etree.Element("synset")
         synset.set("id", row["id"])
         synset.set("ruthes_name", row["name"])
         synset.set("definition", xstr(row["definition"]))
         synset.set("part_of_speech", row["part_of_speech"])
 
-        for sense_id in row["senses"]:
-            sense = self.senses[sense_id]
+        for sense_id, lemma in zip(row["senses"], row["lemmas"]):
             sense_el = etree.SubElement(synset, "sense")
-            sense_el.set("id", sense["id"])
-            sense_el.text = sense["lemma"]
-
-    def add_sense(self, root, row):
-        self.fill_element_attributes(etree.SubElement(root, "sense"), row)
+            sense_el.set("id", sense_id)
+            sense_el.text = lemma
+        return synset
 
-    def add_synset_relation(self, root, row):
-        self.fill_element_attributes(etree.SubElement(root, "relation"), row)
+    @classmethod
+    def make_sense(cls, row: dict) -> etree.Element:
+        return cls.make_element("sense", {**row, "meaning": int(row["meaning"]) + 1})
 
     @staticmethod
-    def fill_element_attributes(element, attributes: dict):
+    def make_element(tag: str, attributes: dict) -> etree.Element:
+        element = etree.Element(tag)
         for k, v in attributes.items():
             element.set(k, xstr(v))
+        return element
 
-    def generate_sense_relations_file(self, relation_name, cur):
+    def generate_sense_relations_file(self, relation_name):
         logging.info('Generating "{}" relations file'.format(relation_name))
 
-        logging.info("Getting relations from the database")
         sql = """
           SELECT
-            parent_id,
-            array_agg(child_id) child_ids
-          FROM sense_relations
-          WHERE name = %s
-          GROUP BY parent_id"""
-        cur.execute(sql, (relation_name,))
-
-        root = etree.Element("senses")
-
-        logging.info("Generating xml")
-        for row in cur:
-            parent_sense = self.senses[row["parent_id"]]
-            x_sense = etree.SubElement(root, "sense")
-            x_sense.set("name", parent_sense["name"])
-            x_sense.set("id", parent_sense["id"])
-            x_sense.set("synset_id", parent_sense["synset_id"])
-            x_rel = etree.SubElement(x_sense, relation_name)
-            for child_id in row["child_ids"]:
-                child_sense = self.senses[child_id]
-                x_lexeme = etree.SubElement(x_rel, "sense")
-                x_lexeme.set("name", child_sense["name"])
-                x_lexeme.set("id", child_sense["id"])
-                x_lexeme.set("synset_id", child_sense["synset_id"])
-
-        tree = etree.ElementTree(root)
-        filename = os.path.join(self.out_dir, "{}.xml".format(relation_name))
-        if os.path.isfile(filename):
-            os.remove(filename)
-        logging.info("Output file: " + filename)
-        tree.write(filename, encoding="utf-8", pretty_print=True)
-
-    def generate_derived_from_relations_file(self, cur):
-        self.generate_sense_relations_file("derived_from", cur)
-
-    def generate_composed_of_relations_file(self, cur):
-        self.generate_sense_relations_file("composed_of", cur)
-
-    def generate_ili_file(self, cur):
+            p.id,
+            p.name,
+            p.synset_id,
+            json_agg(
+              json_build_array(ch.name, ch.id, ch.synset_id)
+              ORDER BY ch.id
+            ) children
+          FROM sense_relations sr
+            INNER JOIN senses p ON p.id = sr.parent_id
+            INNER JOIN senses ch ON ch.id = sr.child_id
+          WHERE sr.name = %s
+          GROUP BY p.id
+          ORDER BY p.id"""
+
+        with self.open_file(relation_name) as writer:
+            for row in self.stream(sql, (relation_name,)):
+                x_sense = etree.Element("sense")
+                x_sense.set("name", row["name"])
+                x_sense.set("id", row["id"])
+                x_sense.set("synset_id", row["synset_id"])
+                x_rel = etree.SubElement(x_sense, relation_name)
+                for name, child_id, synset_id in row["children"]:
+                    x_lexeme = etree.SubElement(x_rel, "sense")
+                    x_lexeme.set("name", name)
+                    x_lexeme.set("id", child_id)
+                    x_lexeme.set("synset_id", synset_id)
+                writer.write(x_sense)
+
+    def generate_ili_file(self):
         logging.info("Generating ILI file")
 
-        synsets_by_concept_id = defaultdict(list)
-        for synset in self.synsets:
-            synsets_by_concept_id[synset["concept_id"]].append(synset)
-
-        cur.execute(
+        ili_rows = self.stream(
             """
-            SELECT concept_id, array_agg(wn_id) wn_ids
+            SELECT concept_id, array_agg(wn_id ORDER BY wn_id) wn_ids
             FROM (
               SELECT concept_id, wn_id
               FROM ili
@@ -243,52 +295,74 @@ class Generator:
                 AND approved
             ) t
             GROUP BY concept_id
-            """
+            ORDER BY concept_id
+            """,
+            name="ili",
         )
+        # Синсеты RuWordNet читаются параллельно в том же порядке понятий
+        rwn_synsets = itertools.groupby(
+            self.stream(
+                """
+                SELECT
+                  synsets.*,
+                  json_agg(s ORDER BY s.id) senses
+                FROM synsets
+                INNER JOIN ({senses}) s ON s.synset_id = synsets.id
+                WHERE synsets.concept_id IN (SELECT concept_id FROM ili WHERE approved)
+                GROUP BY synsets.id
+                ORDER BY synsets.concept_id, synsets.part_of_speech, synsets.id
+                """.format(senses=SENSES_SQL.format(filter="")),
+                name="ili_synsets",
+            ),
+            key=lambda synset: synset["concept_id"],
+        )
+        concept_id, concept_synsets = next(rwn_synsets, (None, None))
 
-        root = etree.Element("ili")
-        for row in cur:
-            wn_synsets_by_pos = defaultdict(list)
-            for wn_synset in [self.get_wn_synset(wn_id) for wn_id in row["wn_ids"]]:
-                pos = wn_synset.pos()
-                wn_synsets_by_pos["a" if pos == "s" else pos].append(wn_synset)
-
-            for rwn_synset in synsets_by_concept_id[row["concept_id"]]:
-                pos = rwn_synset["part_of_speech"]
-                wn_synsets = wn_synsets_by_pos.get(
-                    "a" if pos == "Adj" else pos.lower(), []
-                )
-                if not wn_synsets:
+        with self.open_file("ili") as writer:
+            for row in ili_rows:
+                while concept_id is not None and concept_id < row["concept_id"]:
+                    concept_id, concept_synsets = next(rwn_synsets, (None, None))
+                if concept_id != row["concept_id"]:
                     continue
+                concept_synsets = list(concept_synsets)
 
-                x_match = etree.SubElement(root, "match")
+                wn_synsets_by_pos = defaultdict(list)
+                for wn_synset in [self.get_wn_synset(wn_id) for wn_id in row["wn_ids"]]:
+                    pos = wn_synset.pos()
+                    wn_synsets_by_pos["a" if pos == "s" else pos].append(wn_synset)
 
-                x_rwn_synset = etree.SubElement(x_match, "rwn-synset")
-                x_rwn_synset.set("id", rwn_synset["id"])
-                x_rwn_synset.set("ruthes_name", rwn_synset["name"])
-                x_rwn_synset.set("definition", xstr(rwn_synset["definition"]))
-                x_rwn_synset.set("part_of_speech", rwn_synset["part_of_speech"])
+                for rwn_synset in concept_synsets:
+                    pos = rwn_synset["part_of_speech"]
+                    wn_synsets = wn_synsets_by_pos.get(
+                        "a" if pos == "Adj" else pos.lower(), []
+                    )
+                    if not wn_synsets:
+                        continue
 
-                for sense_id in rwn_synset["senses"]:
-                    self.add_sense(x_rwn_synset, self.senses[sense_id])
+                    x_match = etree.Element("match")
 
-                for wn_synset in wn_synsets:
-                    x_wn_synset = etree.SubElement(x_match, "wn-synset")
-                    x_wn_synset.set(
-                        "id", str(wn_synset.offset()).zfill(8) + "-" + wn_synset.pos()
-                    )
-                    x_wn_synset.set("definition", wn_synset.definition())
-                    for lemma in wn_synset.lemmas():
-                        x_lemma = etree.SubElement(x_wn_synset, "lemma")
-                        x_lemma.set("name", lemma.name())
-                        x_lemma.set("key", lemma.key())
-
-        tree = etree.ElementTree(root)
-        filename = os.path.join(self.out_dir, "ili.xml")
-        if os.path.isfile(filename):
-            os.remove(filename)
-        logging.info("Output file: " + filename)
-        tree.write(filename, encoding="utf-8", pretty_print=True)
+                    x_rwn_synset = etree.SubElement(x_match, "rwn-synset")
+                    x_rwn_synset.set("id", rwn_synset["id"])
+                    x_rwn_synset.set("ruthes_name", rwn_synset["name"])
+                    x_rwn_synset.set("definition", xstr(rwn_synset["definition"]))
+                    x_rwn_synset.set("part_of_speech", rwn_synset["part_of_speech"])
+
+                    for sense in rwn_synset["senses"]:
+                        x_rwn_synset.append(self.make_sense(sense))
+
+                    for wn_synset in wn_synsets:
+                        x_wn_synset = etree.SubElement(x_match, "wn-synset")
+                        x_wn_synset.set(
+                            "id",
+                            str(wn_synset.offset()).zfill(8) + "-" + wn_synset.pos(),
+                        )
+                        x_wn_synset.set("definition", wn_synset.definition())
+                        for lemma in wn_synset.lemmas():
+                            x_lemma = etree.SubElement(x_wn_synset, "lemma")
+                            x_lemma.set("name", lemma.name())
+                            x_lemma.set("key", lemma.key())
+
+                    writer.write(x_match)
 
     @staticmethod
     def get_wn_synset(wn_id: str):
@@ -296,6 +370,53 @@ class Generator:
         return wn.synset_from_pos_and_offset(parts[1], int(parts[0]))
 
 
+class ElementWriter:
+    """
+    Пишет корневой элемент и его дочерние элементы в файл по мере их
+    порождения (etree.xmlfile). Результат совпадает с результатом
+    tree.write(filename, encoding="utf-8", pretty_print=True).
+    """
+
+    def __init__(self, filename: str, tag: str):
+        self.filename = filename
+        self.tag = tag
+        self.file = None
+        self.contexts = None
+        self.xf = None
+        self.started = False
+
+    def __enter__(self):
+        self.file = open(self.filename, "wb")
+        self.contexts = ExitStack()
+        self.xf = self.contexts.enter_context(
+            etree.xmlfile(self.file, encoding="utf-8")
+        )
+        return self
+
+    def write(self, element: etree.Element):
+        # Корневой элемент открывается при записи первого дочернего
+        if not self.started:
+            self.contexts.enter_context(self.xf.element(self.tag))
+            self.started = True
+        etree.indent(element, level=1)
+        element.tail = None
+        self.xf.write("\n  ", element)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            if exc_type is None:
+                if self.started:
+                    self.xf.write("\n")
+                else:
+                    self.xf.write(etree.Element(self.tag))
+            self.contexts.close()
+            if exc_type is None:
+                self.file.write(b"\n")
+        finally:
+            self.file.close()
+        return False
+
+
 def xstr(value):
     return "" if value is None else str(value)
 
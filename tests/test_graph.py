@@ -0,0 +1,103 @@
+import random
+
+from ruwordnet.graph import POS_BITS, Graph, HierarchyClosure
+
+
+def make_graph(poses, relations):
+    """
+    Граф из частей речи понятий ({id: "N" | "V"}) и отношений НИЖЕ
+    (from_id, to_id)
+    """
+    concepts = [(cid, "c{}".format(cid), "") for cid in sorted(poses)]
+    entries = [
+        (cid, "e{}".format(cid), "e{}".format(cid), "", pos, "")
+        for cid, pos in sorted(poses.items())
+    ]
+    synonyms = [(cid, cid) for cid in sorted(poses)]
+    rows = sorted(
+        ("НИЖЕ", from_id, to_id, " ", "initial") for from_id, to_id in relations
+    )
+    return Graph.from_rows(concepts, entries, synonyms, rows)
+
+
+def fix_relation(graph, relation, pos, path):
+    """
+    Замыкание по-старому (sql2sql.fix_relation): обход с общим для всего
+    вызова списком пройденных отношений, без запоминания
+    """
+    if relation in path:
+        return []
+    path.append(relation)
+    if graph.pos_mask(relation.to_id) & POS_BITS[pos]:
+        return [relation]
+    relations = []
+    for rel in graph.relations(relation.to_id, relation.name):
+        relations += fix_relation(graph, rel, pos, path)
+    return relations
+
+
+def targets(relations):
+    # Замыкание оставляет одно отношение на понятие, на которое оно указывает
+    return {relation.to_id for relation in relations}
+
+
+def test_cycle():
+    # X -> B, A <-> B, A -> Y; только у Y есть существительные
+    x, a, b, y = 1, 2, 3, 4
+    graph = make_graph(
+        {x: "V", a: "V", b: "V", y: "N"}, [(x, b), (a, b), (b, a), (a, y)]
+    )
+    closure = HierarchyClosure(graph)
+    # Обход из A проходит через B, пока обход A не завершён
+    assert targets(closure.descend(a, "НИЖЕ", "N")) == {y}
+    assert targets(closure.descend(b, "НИЖЕ", "N")) == {y}
+    assert targets(closure.fix_all(x, "N")) == {y}
+
+
+def test_random_graphs_match_path_based_closure():
+    rng = random.Random(0)
+    for _ in range(200):
+        size = rng.randint(2, 12)
+        poses = {cid: rng.choice(("N", "V", "V")) for cid in range(1, size + 1)}
+        relations = {
+            (rng.randint(1, size), rng.randint(1, size)) for _ in range(size * 2)
+        }
+        graph = make_graph(poses, relations)
+        closure = HierarchyClosure(graph)
+        order = list(poses)
+        rng.shuffle(order)
+        for cid in order:
+            expected = set()
+            for relation in graph.relations(cid):
+                expected |= targets(fix_relation(graph, relation, "N", []))
+            assert targets(closure.fix_all(cid, "N")) == expected
+
+
+def test_large_cycles_are_traversed_once():
+    size = 300
+    y = size + 1
+    for relations in (
+        # Кольцо с хордами i -> i+1, i -> i+2
+        [(i, i % size + 1) for i in range(1, size + 1)]
+        + [(i, (i + 1) % size + 1) for i in range(1, size + 1)],
+        # Полный орграф на 40 понятиях
+        [(i, j) for i in range(1, 41) for j in range(1, 41) if i != j],
+    ):
+        count = max(max(pair) for pair in relations)
+        poses = {cid: "V" for cid in range(1, count + 1)}
+        poses[y] = "N"
+        graph = make_graph(poses, relations + [(count, y)])
+        closure = HierarchyClosure(graph)
+        expanded = []
+        relations_of = graph.relations
+
+        def counting_relations(concept_id, name=None):
+            if name is not None:
+                expanded.append(concept_id)
+            return relations_of(concept_id, name)
+
+        graph.relations = counting_relations
+        for cid in range(1, count + 1):
+            assert targets(closure.descend(cid, "НИЖЕ", "N")) == {y}
+        # Каждое понятие раскрывается один раз
+        assert sorted(expanded) == list(range(1, count + 1))
@@ -0,0 +1,64 @@
+from ruwordnet.lemma_index import (
+    ENTRIES_SQL,
+    SENSES_SQL,
+    SOURCE_SQL,
+    SOURCE_TABLES,
+    ensure_index,
+    open_index,
+)
+
+
+class Connection:
+    """
+    Соединение, курсоры которого возвращают заданные строки запросов
+    """
+
+    def __init__(self):
+        self.senses = [("1-N-1", "1-N", "КОШКА", "N", "КОШКА", "КОШКА")]
+        self.entries = [(1, 10, "КОШКА", "КОШКА", "КОШКА")]
+        self.counts = dict.fromkeys(SOURCE_TABLES, 1)
+
+    def cursor(self):
+        return Cursor(self)
+
+
+class Cursor:
+    def __init__(self, connection):
+        self.connection = connection
+        self.rows = []
+
+    def execute(self, sql):
+        self.rows = {
+            SENSES_SQL: self.connection.senses,
+            ENTRIES_SQL: self.connection.entries,
+            SOURCE_SQL: list(self.connection.counts.items()),
+        }[sql]
+
+    def fetchall(self):
+        return list(self.rows)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+
+def test_index_is_rebuilt_when_the_database_changes(tmp_path):
+    filename = str(tmp_path / "test.lemma_index")
+    connection = Connection()
+    assert ensure_index(connection, filename)
+    assert not ensure_index(connection, filename)
+    assert ensure_index(connection, filename, rebuild=True)
+
+    connection.senses.append(("2-N-1", "2-N", "КОТ", "N", "КОТ", "КОТ"))
+    connection.counts["senses"] += 1
+    with open_index(filename, connection) as index:
+        assert [sense.id for sense in index.senses("кот")] == ["2-N-1"]
+        assert index.source["senses"] == 2
+
+
+def test_files_that_are_not_indexes_are_rebuilt(tmp_path):
+    filename = tmp_path / "test.lemma_index"
+    filename.write_bytes(b"not an index")
+    assert ensure_index(Connection(), str(filename))
@@ -0,0 +1,62 @@
+from lxml import etree
+
+from ruwordnet.lmf import DTD_PATH, DTD_URL, LmfValidator
+
+SAMPLE = """<?xml version='1.0' encoding='utf-8'?>
+<!DOCTYPE LexicalResource SYSTEM "{dtd}">
+<LexicalResource xmlns:dc="http://purl.org/dc/elements/1.1/">
+  <Lexicon id="rwn" label="RuWordNet" language="ru" email="x@example.com"
+           license="license" version="1.0">
+    <LexicalEntry id="le1">
+      <Lemma writtenForm="кошка" partOfSpeech="n"/>
+      <Sense id="s1" synset="{synset}"/>
+    </LexicalEntry>
+    <LexicalEntry id="le2">
+      <Lemma writtenForm="животное" partOfSpeech="n"/>
+      <Sense id="s2" synset="ss2"/>
+    </LexicalEntry>
+    <Synset id="ss1" ili="" partOfSpeech="n">
+      <SynsetRelation target="ss2" relType="hypernym"/>
+    </Synset>
+    <Synset id="ss2" ili="" partOfSpeech="n">
+      <SynsetRelation target="ss1" relType="hyponym"/>
+    </Synset>
+  </Lexicon>
+</LexicalResource>
+"""
+
+
+def validate(document: bytes, chunk_size=64):
+    validator = LmfValidator()
+    for start in range(0, len(document), chunk_size):
+        validator.feed(document[start : start + chunk_size])
+    return validator.close()
+
+
+def sample(synset="ss1") -> bytes:
+    return SAMPLE.format(dtd=DTD_URL, synset=synset).encode("utf-8")
+
+
+def test_valid_sample():
+    document = sample()
+    dtd = etree.DTD(DTD_PATH)
+    assert dtd.validate(etree.fromstring(document))
+    assert validate(document) == []
+    assert validate(document, chunk_size=len(document)) == []
+
+
+def test_unknown_idref():
+    errors = validate(sample(synset="ss3"))
+    assert errors == ['IDREF references an unknown ID "ss3"']
+
+
+def test_lexical_entry_after_synset():
+    document = sample().replace(
+        b"  </Lexicon>",
+        '    <LexicalEntry id="le3">\n'
+        '      <Lemma writtenForm="кот" partOfSpeech="n"/>\n'
+        "    </LexicalEntry>\n"
+        "  </Lexicon>".encode("utf-8"),
+    )
+    errors = validate(document)
+    assert any("LexicalEntry le3 follows Synset" in error for error in errors)
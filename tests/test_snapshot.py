@@ -0,0 +1,47 @@
+import pytest
+
+from ruwordnet.graph import StringTable
+from ruwordnet.snapshot import Snapshot, SnapshotError, encode_columns, write_tables
+
+COLUMNS = [("id", "int"), ("name", "str"), ("flag", "bool")]
+ROWS = [(1, "кошка", True), (2, None, None), (3, "кот", False)]
+
+
+def write(filename):
+    strings = StringTable()
+    values = encode_columns(COLUMNS, ROWS, strings)
+    write_tables(str(filename), [("items", COLUMNS, values)], strings)
+
+
+def mapped(filename) -> bool:
+    with open("/proc/self/maps") as maps:
+        return any(line.rstrip().endswith(str(filename)) for line in maps)
+
+
+def test_round_trip(tmp_path):
+    filename = tmp_path / "test.snapshot"
+    write(filename)
+    with Snapshot(str(filename)) as snapshot:
+        assert list(snapshot["items"].select("id", "name", "flag")) == ROWS
+    assert not mapped(filename)
+
+
+def test_truncated_files_are_closed(tmp_path):
+    source = tmp_path / "test.snapshot"
+    write(source)
+    data = source.read_bytes()
+    errors = []
+    for size in range(len(data)):
+        filename = tmp_path / "truncated{}.snapshot".format(size)
+        filename.write_bytes(data[:size])
+        try:
+            Snapshot(str(filename)).close()
+        except SnapshotError as e:
+            # Трассировка держит ссылку на недооткрытый снимок
+            errors.append(e)
+        assert not mapped(filename)
+    assert errors
+    filename = tmp_path / "truncated.snapshot"
+    filename.write_bytes(data[: len(data) // 2])
+    with pytest.raises(SnapshotError):
+        Snapshot(str(filename))
@@ -1,10 +1,15 @@
 #!/usr/bin/env python3
 import argparse
 import os
+import threading
+import time
+from queue import Queue
 from xml.etree import ElementTree
 
 import psycopg2
 
+from ruwordnet.bulk import copy_rows
+
 PKG_ROOT = os.path.split(__file__)[0]
 
 parser = argparse.ArgumentParser(description="Run import RuThes from xml to database.")
@@ -32,6 +37,23 @@ parser.add_argument(
     help="Postgresql database connection string ({})".format(connection_string),
     default=connection_string,
 )
+parser.add_argument(
+    "-b",
+    "--bulk",
+    help="Load data with COPY through staging tables instead of row-by-row inserts",
+    action="store_true",
+)
+parser.add_argument(
+    "--batch-size",
+    type=int,
+    help="Number of rows sent to the database with a single COPY in bulk mode",
+    default=10000,
+)
+parser.add_argument(
+    "--replace",
+    help="In bulk mode, replace the contents of the tables instead of merging into them",
+    action="store_true",
+)
 # parser.add_argument(
 #     '-v',
 #     dest='verbose',
@@ -45,7 +67,9 @@ ARGS = parser.parse_args()
 def import_data():
     print("Importing data from XML files to DB")
 
-    insert_data(
+    load_data = copy_data if ARGS.bulk else insert_data
+
+    load_data(
         filename="concepts.xml",
         table="concepts",
         fields=["id", "name", "gloss", "domain"],
@@ -55,10 +79,10 @@ def import_data():
             "gloss": item.find("gloss").text,
             "domain": item.find("domain").text,
         },
-        get_items=lambda tree: tree.findall("concept"),
+        tag="concept",
     )
 
-    insert_data(
+    load_data(
         filename="relations.xml",
         table="relations",
         fields=["from_id", "to_id", "name", "asp"],
@@ -68,10 +92,10 @@ def import_data():
             "name": item.get("name"),
             "asp": item.get("asp"),
         },
-        get_items=lambda tree: tree.findall("rel"),
+        tag="rel",
     )
 
-    insert_data(
+    load_data(
         filename="text_entry.xml",
         table="text_entry",
         fields=["id", "name", "lemma", "main_word", "synt_type", "pos_string"],
@@ -83,10 +107,10 @@ def import_data():
             "synt_type": item.find("synt_type").text,
             "pos_string": item.find("pos_string").text,
         },
-        get_items=lambda tree: tree.findall("entry"),
+        tag="entry",
     )
 
-    insert_data(
+    load_data(
         filename="synonyms.xml",
         table="synonyms",
         fields=["concept_id", "entry_id"],
@@ -94,11 +118,11 @@ def import_data():
             "concept_id": item.get("concept_id"),
             "entry_id": item.get("entry_id"),
         },
-        get_items=lambda tree: tree.findall("entry_rel"),
+        tag="entry_rel",
     )
 
 
-def insert_data(filename, table, fields, get_values, get_items):
+def insert_data(filename, table, fields, get_values, tag):
     print("Start processing " + filename)
 
     logname = os.path.join(ARGS.log_dir, filename + ".log")
@@ -108,15 +132,10 @@ def insert_data(filename, table, fields, get_values, get_items):
     dollars = ", ".join("$" + str(i + 1) for i in range(len(fields)))
     placeholders = ", ".join("%({0})s".format(f) for f in fields)
 
-    tree = ElementTree.parse(os.path.join(ARGS.xml_dir, filename))
-    items = get_items(tree)
-    count = len(items)
-    print("Found {0} items".format(count))
-
     sql_str = "EXECUTE prepared_query_{table} ({placeholders})".format(
         placeholders=placeholders, table=table
     )
-    i = 0
+    progress = Progress(table)
 
     with CONN.cursor() as cur:
         sql = "PREPARE prepared_query_{table} AS ".format(
@@ -129,24 +148,129 @@ def insert_data(filename, table, fields, get_values, get_items):
 
         file.write(sql + "\n\n")
 
-        for item in items:
-            values = {
-                k: val.strip() if isinstance(val, str) else val
-                for k, val in get_values(item).items()
-            }
+        for values in prefetch(read_rows(filename, tag, get_values)):
             cur.execute(sql_str, values)
-            i += 1
-            print(
-                "\rProgress: {0}% ({1})".format(round(i / count * 100), i),
-                end="",
-                flush=True,
-            )
+            progress.update()
             file.write(str(values) + "\n")
-        print()
+        progress.finish()
     CONN.commit()
     file.close()
 
 
+def copy_data(filename, table, fields, get_values, tag):
+    """
+    Загрузка данных через COPY во временную таблицу с последующим переносом
+    в основную таблицу (ruwordnet.bulk.copy_rows). Всё происходит в одной
+    транзакции, поэтому основная таблица никогда не остаётся заполненной
+    частично.
+    """
+    print("Start bulk loading " + filename)
+
+    logname = os.path.join(ARGS.log_dir, filename + ".log")
+    file = open(logname, "w", encoding="utf-8")
+
+    progress = Progress(table)
+
+    def make_rows():
+        for values in prefetch(read_rows(filename, tag, get_values)):
+            progress.update()
+            yield [values[f] for f in fields]
+
+    with CONN.cursor() as cur:
+        copied, inserted = copy_rows(
+            cur, table, fields, make_rows(), ARGS.replace, ARGS.batch_size
+        )
+        progress.finish()
+        print("Inserted {0} rows into {1}".format(inserted, table))
+        file.write("{0} rows copied, {1} rows inserted\n".format(copied, inserted))
+    CONN.commit()
+    file.close()
+
+
+def read_rows(filename, tag, get_values):
+    """
+    Потоковый разбор xml-файла. Каждый элемент с тегом tag превращается
+    в словарь значений и сразу удаляется из дерева, поэтому расход памяти
+    не зависит от размера файла.
+    """
+    root = None
+    context = ElementTree.iterparse(
+        os.path.join(ARGS.xml_dir, filename), events=("start", "end")
+    )
+    for event, elem in context:
+        if root is None:
+            root = elem
+        if event == "end" and elem.tag == tag:
+            yield {
+                k: val.strip() if isinstance(val, str) else val
+                for k, val in get_values(elem).items()
+            }
+            # Обработанные элементы больше не нужны
+            root.clear()
+
+
+def prefetch(rows, size=10000):
+    """
+    Чтение строк в отдельном потоке, чтобы разбор xml шёл параллельно
+    с записью в базу данных.
+    """
+    queue = Queue(size)
+    done = object()
+    errors = []
+
+    def produce():
+        try:
+            for row in rows:
+                queue.put(row)
+        except Exception as err:  # pylint: disable=broad-except
+            errors.append(err)
+        finally:
+            queue.put(done)
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    while True:
+        row = queue.get()
+        if row is done:
+            break
+        yield row
+    thread.join()
+    if errors:
+        raise errors[0]
+
+
+class Progress:
+    """
+    Вывод количества обработанных строк и скорости обработки
+    (не чаще, чем раз в interval секунд).
+    """
+
+    def __init__(self, name, interval=1.0):
+        self.name = name
+        self.interval = interval
+        self.count = 0
+        self.started = self.reported = time.monotonic()
+
+    def update(self, count=1):
+        self.count += count
+        now = time.monotonic()
+        if now - self.reported >= self.interval:
+            self.reported = now
+            self.report(now)
+
+    def finish(self):
+        self.report(time.monotonic())
+
+    def report(self, now):
+        elapsed = now - self.started
+        print(
+            "{0}: {1} rows, {2:.0f} rows/s".format(
+                self.name, self.count, self.count / elapsed if elapsed else 0
+            ),
+            flush=True,
+        )
+
+
 def check_xml_files():
     source_filenames = [
         "concepts.xml",